@@ -1,7 +1,36 @@
 import boto3
 import s3fs
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from config import aws_access_key_id, aws_secret_access_key, BUCKET_NAME
 
+# Počet měsíčních prefixů vypisovaných současně
+LIST_WORKERS = 16
+
+def list_prefix(s3_client, bucket, prefix, delimiter=None):
+    """
+    Stránkovaný výpis prefixu (list_objects_v2 vrací nejvýš 1000 klíčů najednou).
+    Vrací (podadresáře, objekty).
+    """
+    prefixes, objects = [], []
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    if delimiter:
+        kwargs["Delimiter"] = delimiter
+    for page in s3_client.get_paginator('list_objects_v2').paginate(**kwargs):
+        prefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+        objects.extend(page.get('Contents', []))
+    return prefixes, objects
+
+def summarize_stores(objects):
+    """Počet objektů a velikost každého .zarr úložiště {prefix úložiště: [objekty, bajty]}"""
+    stores = defaultdict(lambda: [0, 0])
+    for obj in objects:
+        store, sep, _ = obj['Key'].partition('.zarr/')
+        if sep:
+            stores[f"{store}.zarr/"][0] += 1
+            stores[f"{store}.zarr/"][1] += obj['Size']
+    return stores
+
 def check_s3_data():
     """Jednoduchý skript pro kontrolu, zda data v S3 existují a v jakém jsou formátu"""
     
@@ -23,58 +52,51 @@ def check_s3_data():
     
     # 1. Základní kontrola - vypsat objekty v kořenu bucketu
     print("\n1. Obsah kořenového adresáře:")
-    response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Delimiter='/')
+    root_prefixes, root_objects = list_prefix(s3_client, BUCKET_NAME, "", delimiter='/')
     
-    if 'CommonPrefixes' in response:
+    if root_prefixes:
         print("  Prefixy (adresáře):")
-        for prefix in response['CommonPrefixes']:
-            print(f"    {prefix['Prefix']}")
+        for prefix in root_prefixes:
+            print(f"    {prefix}")
     
-    if 'Contents' in response:
+    if root_objects:
         print("  Soubory:")
-        for obj in response['Contents']:
+        for obj in root_objects:
             print(f"    {obj['Key']}")
     
     # 2. Hledání meteo_data adresáře
     print("\n2. Hledání meteo_data adresáře:")
     meteo_prefix = "meteo_data/"
-    response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=meteo_prefix, Delimiter='/')
+    month_prefixes, _ = list_prefix(s3_client, BUCKET_NAME, meteo_prefix, delimiter='/')
     
-    if 'CommonPrefixes' in response:
+    if month_prefixes:
         print("  Nalezené měsíční adresáře:")
-        for prefix in response['CommonPrefixes']:
-            month_prefix = prefix['Prefix']
-            print(f"    {month_prefix}")
-            
-            # Kontrola obsahu měsíčního adresáře
-            month_response = s3_client.list_objects_v2(
-                Bucket=BUCKET_NAME, 
-                Prefix=month_prefix,
-                Delimiter='/'
-            )
-            
-            if 'CommonPrefixes' in month_response:
-                print(f"      Parametry v adresáři {month_prefix}:")
-                for param_prefix in month_response['CommonPrefixes']:
-                    print(f"        {param_prefix['Prefix']}")
-            
-            if 'Contents' in month_response:
-                print(f"      Soubory v adresáři {month_prefix}:")
-                for obj in month_response['Contents']:
-                    print(f"        {obj['Key']}")
+        # Měsíce se vypisují souběžně, každý celý (se stránkováním)
+        with ThreadPoolExecutor(max_workers=LIST_WORKERS) as executor:
+            listings = executor.map(lambda prefix: list_prefix(s3_client, BUCKET_NAME, prefix)[1],
+                                    month_prefixes)
+            for month_prefix, objects in zip(month_prefixes, listings):
+                print(f"    {month_prefix}")
+                stores = summarize_stores(objects)
+                if stores:
+                    print(f"      Parametry v adresáři {month_prefix}:")
+                    for store, (count, size) in sorted(stores.items()):
+                        print(f"        {store} ({count} objektů, {size / 1024 ** 2:.1f} MiB)")
+                other = [obj['Key'] for obj in objects if '.zarr/' not in obj['Key']]
+                if other:
+                    print(f"      Soubory v adresáři {month_prefix}:")
+                    for key in other:
+                        print(f"        {key}")
     
     # 3. Hledání konkrétního parametru pro duben 2025
     april_2025 = "meteo_data/202504/"
     print(f"\n3. Hledání dat pro {april_2025}:")
     try:
-        april_response = s3_client.list_objects_v2(
-            Bucket=BUCKET_NAME, 
-            Prefix=april_2025
-        )
+        _, april_objects = list_prefix(s3_client, BUCKET_NAME, april_2025)
         
-        if 'Contents' in april_response and len(april_response['Contents']) > 0:
-            print(f"  Nalezeno {len(april_response['Contents'])} objektů:")
-            for obj in april_response['Contents'][:10]:  # Jen prvních 10 pro přehlednost
+        if april_objects:
+            print(f"  Nalezeno {len(april_objects)} objektů:")
+            for obj in april_objects[:10]:  # Jen prvních 10 pro přehlednost
                 print(f"    {obj['Key']}")
         else:
             print("  Žádné objekty nenalezeny.")
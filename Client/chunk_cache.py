@@ -0,0 +1,183 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# Lokální cache chunků Zarr úložišť z S3
+CHUNK_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "npw_chunks")
+# Maximální velikost cache na disku, nejdéle nepoužité chunky se mažou (LRU)
+CHUNK_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Podle obsahu .zmetadata se pozná nová verze úložiště (po připsání dat)
+METADATA_KEY = ".zmetadata"
+
+
+class ChunkCache:
+    """
+    Velikostně omezená cache chunků na disku s LRU mazáním.
+
+    Chunk je uložen pod <úložiště>/<verze>/<klíč chunku>, kde verze je hash
+    .zmetadata - když se úložiště změní, stará verze se smaže celá.
+    Sdílí ji všechna úložiště i vlákna (dask, ThreadPoolExecutor).
+    """
+
+    def __init__(self, path=CHUNK_CACHE_DIR, max_bytes=CHUNK_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # cesta -> velikost, od nejdéle nepoužitého
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0, "bytes_from_cache": 0, "bytes_downloaded": 0, "evicted": 0}
+        self._scan()
+
+    def _scan(self):
+        """Načte obsah cache z předchozích běhů, pořadí podle času posledního použití"""
+        files = []
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                file_path = os.path.join(root, name)
+                stat = os.stat(file_path)
+                files.append((stat.st_mtime, file_path, stat.st_size))
+        for _, file_path, size in sorted(files):
+            self.entries[file_path] = size
+            self.size += size
+
+    def namespace(self, store_url, metadata):
+        """
+        Adresář pro jednu verzi úložiště. Starší verze téhož úložiště
+        (jiné .zmetadata) se při tom smažou.
+        """
+        store_dir = os.path.join(self.path, hashlib.sha1(store_url.encode()).hexdigest()[:16])
+        version = hashlib.sha1(metadata).hexdigest()[:16]
+        if os.path.isdir(store_dir):
+            for old_version in os.listdir(store_dir):
+                if old_version != version:
+                    self._remove_tree(os.path.join(store_dir, old_version))
+        return os.path.join(store_dir, version)
+
+    def _remove_tree(self, directory):
+        with self.lock:
+            prefix = directory + os.sep
+            for file_path in [p for p in self.entries if p.startswith(prefix)]:
+                self.size -= self.entries.pop(file_path)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def get(self, file_path):
+        try:
+            with open(file_path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+        with self.lock:
+            self.stats["hits"] += 1
+            self.stats["bytes_from_cache"] += len(data)
+            if file_path in self.entries:
+                self.entries.move_to_end(file_path)
+        try:
+            os.utime(file_path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, file_path, data):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, file_path)
+        with self.lock:
+            self.stats["bytes_downloaded"] += len(data)
+            self.size += len(data) - self.entries.pop(file_path, 0)
+            self.entries[file_path] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            file_path, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.stats["evicted"] += 1
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def report(self):
+        return (f"Cache chunků: {self.stats['hits']} zásahů / {self.stats['misses']} stažení "
+                f"({self.hit_rate():.0%}), {self.stats['bytes_from_cache'] / 1024 ** 2:.1f} MiB z disku, "
+                f"{self.stats['bytes_downloaded'] / 1024 ** 2:.1f} MiB z S3, "
+                f"obsazeno {self.size / 1024 ** 2:.1f} MiB, smazáno {self.stats['evicted']} chunků")
+
+
+class CachedStore(MutableMapping):
+    """
+    Zarr úložiště (pouze pro čtení) - chunky se čtou z ChunkCache a ze S3
+    jen při prvním přístupu. .zmetadata (a čas jeho zápisu) se čte vždy ze S3
+    (jednou při otevření), aby se poznala nová verze úložiště.
+
+    `version` nahradí čas zápisu .zmetadata - pro úložiště, kde se změna
+    nemusí projevit v .zmetadata (referenční soubor virtuálního datasetu).
+    """
+
+    def __init__(self, store, store_url, cache, version=None):
+        self.store = store
+        self.cache = cache
+        self.metadata = store[METADATA_KEY]
+        if version is None:
+            version = self._metadata_tag()
+        self.directory = cache.namespace(store_url, self.metadata + version.encode())
+
+    def _metadata_tag(self):
+        """Čas zápisu .zmetadata - změní se i při přepsání úložiště beze změny metadat"""
+        try:
+            info = self.store.fs.info(f"{self.store.root}/{METADATA_KEY}")
+        except (AttributeError, OSError):
+            return ""
+        return f"{info.get('LastModified', '')}{info.get('ETag', '')}"
+
+    def __getitem__(self, key):
+        if key == METADATA_KEY:
+            return self.metadata
+        file_path = os.path.join(self.directory, *key.split("/"))
+        data = self.cache.get(file_path)
+        if data is None:
+            data = self.store[key]
+            self.cache.put(file_path, data)
+        return data
+
+    def __contains__(self, key):
+        if key == METADATA_KEY or os.path.exists(os.path.join(self.directory, *key.split("/"))):
+            return True
+        return key in self.store
+
+    def __setitem__(self, key, value):
+        raise PermissionError("CachedStore je pouze pro čtení")
+
+    def __delitem__(self, key):
+        raise PermissionError("CachedStore je pouze pro čtení")
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Sdílená ChunkCache pro celý proces"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ChunkCache()
+    return _cache
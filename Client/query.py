@@ -1,9 +1,17 @@
+import hashlib
+import json
+import numpy as np
 import xarray as xr
 import pandas as pd
 import matplotlib.pyplot as plt
 import s3fs
+import fsspec
 import boto3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from scipy.spatial import cKDTree
 from matplotlib.widgets import Slider, Button
+from chunk_cache import CachedStore, get_cache
 from config import aws_access_key_id, aws_secret_access_key, BUCKET_NAME, REGION
 
 # AWS přístupové údaje
@@ -18,12 +26,39 @@ s3fs_instance = s3fs.S3FileSystem(anon=False,
                                  secret=AWS_SECRET_KEY,
                                  client_kwargs={"region_name": REGION})
 
+# Přístup k S3 pro xarray/fsspec
+STORAGE_OPTIONS = {"anon": False, "key": AWS_ACCESS_KEY, "secret": AWS_SECRET_KEY,
+                   "client_kwargs": {"region_name": REGION}}
+
 # Inicializace boto3 klienta pro lepší kontrolu existence
 s3_client = boto3.client('s3',
                        aws_access_key_id=AWS_ACCESS_KEY,
                        aws_secret_access_key=AWS_SECRET_KEY,
                         region_name=REGION)
 
+# Počet měsíčních Zarr úložišť otevíraných současně
+MAX_OPEN_WORKERS = 8
+# Chunky se ukládají do lokální cache na disku (chunk_cache.CHUNK_CACHE_DIR)
+USE_CHUNK_CACHE = True
+# Prohlížeč - počet vláken a dosah (± snímků v čase i kroku) přednačítání
+PREFETCH_WORKERS = 4
+PREFETCH_RADIUS = 2
+# Maximální počet snímků držených v paměti prohlížeče
+FRAME_CACHE_SIZE = 64
+# Počet snímků, ze kterých se odhaduje rozsah barev
+COLOR_SAMPLE_FRAMES = 8
+# Souhrnné statistiky, které zapisovač ukládá do každého Zarr úložiště
+STATS_KEY = ".zstats"
+# Katalog všech úložišť v bucketu (zapisovač ho aktualizuje po každém zápisu)
+CATALOG_KEY = "catalog.json"
+# Jeden logický dataset přes všechny měsíce (referenční soubory virtual/<prefix>/<parametr>.json)
+USE_VIRTUAL_DATASET = True
+VIRTUAL_PREFIX = "virtual"
+# Index platností (time + step), který zapisovač ukládá do každého úložiště s předpověďmi
+VALID_INDEX_KEY = ".zvalid"
+# Nejdelší krok předpovědi - o tolik dříve se hledají běhy platné v požadovaném období
+MAX_FORECAST_STEP = pd.Timedelta(hours=72)
+
 def check_exists_boto3(bucket, prefix):
     """Kontroluje existenci objektu/prefixu pomocí boto3 místo s3fs"""
     response = s3_client.list_objects_v2(
@@ -33,75 +68,283 @@ def check_exists_boto3(bucket, prefix):
     )
     return 'Contents' in response and len(response['Contents']) > 0
 
-def load_data(parameter, start_date, end_date, lat_range=None, lon_range=None):
-    """Načte data z S3 pro zadaný parametr a časové období."""
+def month_keys(start_dt, end_dt):
+    """Seznam měsíců (YYYYMM), do kterých zasahuje období start_dt - end_dt"""
+    return [month.strftime("%Y%m") for month in
+            pd.period_range(start_dt.to_period("M"), end_dt.to_period("M"), freq="M")]
+
+def list_months(bucket=None, prefix=BASE_PREFIX):
+    """Jedním (stránkovaným) výpisem zjistí, pro které měsíce existují data"""
+    bucket = bucket or BUCKET_NAME
+    months = set()
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/", Delimiter='/'):
+        for common_prefix in page.get('CommonPrefixes', []):
+            months.add(common_prefix['Prefix'].rstrip('/').rsplit('/', 1)[-1])
+    return months
+
+def load_catalog():
+    """Katalog úložišť z bucketu (jeden GET), None pokud neexistuje"""
     try:
-        # Převedení dat na datetime objekty
-        start_dt = pd.to_datetime(start_date)
-        end_dt = pd.to_datetime(end_date)
-        
-        # Zjištění potřebných měsíců
-        needed_months = []
-        current = start_dt.replace(day=1)
-        while current <= end_dt:
-            needed_months.append(current.strftime("%Y%m"))
-            if current.month == 12:
-                current = current.replace(year=current.year + 1, month=1)
-            else:
-                current = current.replace(month=current.month + 1)
-        
-        print(f"Potřebné měsíce: {needed_months}")
-        
-        # Načtení dat pro každý měsíc
-        datasets = []
-        storage_options = {"anon": False, "key": AWS_ACCESS_KEY, "secret": AWS_SECRET_KEY,
-                           "client_kwargs": {"region_name": REGION}}
-        
-        for month in needed_months:
-            # Cesta k zarr souboru v S3
-            zarr_path = f"s3://{BUCKET_NAME}/{BASE_PREFIX}/{month}/{parameter}.zarr"
-            prefix_to_check = f"{BASE_PREFIX}/{month}/{parameter}.zarr/"
-            
-            # Kontrola existence souboru pomocí boto3 místo s3fs
-            print(f"Kontroluji existenci dat pro měsíc {month} (parametr {parameter})...")
-            exists = check_exists_boto3(BUCKET_NAME, prefix_to_check)
-            
-            if exists:
-                print(f"Data pro měsíc {month} EXISTUJÍ.")
+        with s3fs_instance.open(f"{BUCKET_NAME}/{CATALOG_KEY}", "rb") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Katalog {CATALOG_KEY} nelze načíst ({e}), měsíce se zjistí výpisem S3")
+        return None
+
+def list_parameters(catalog=None, prefix=BASE_PREFIX):
+    """Parametry, pro které existují data (podle katalogu)"""
+    catalog = catalog or load_catalog() or {"stores": {}}
+    return sorted({entry["parameter"] for entry in catalog["stores"].values() if entry["prefix"] == prefix})
+
+def catalog_months(catalog, parameter, start_dt, end_dt, prefix=BASE_PREFIX):
+    """Měsíce, jejichž úložiště parametru má data v období start_dt - end_dt"""
+    months = []
+    for entry in catalog["stores"].values():
+        if entry["prefix"] != prefix or entry["parameter"] != parameter or not entry["n_times"]:
+            continue
+        if pd.Timestamp(entry["start"]) <= end_dt and pd.Timestamp(entry["end"]) >= start_dt:
+            months.append(entry["month"])
+    return sorted(months)
+
+def uncatalogued_months(catalog, parameter, months, prefix=BASE_PREFIX):
+    """
+    Měsíce z `months`, pro které katalog nemá záznam úložiště parametru -
+    úložiště zapsaná dřív, než katalog existoval (nebo než ho inventory.py
+    --rebuild-catalog doplnil). Jejich existence se musí zjistit výpisem S3.
+    """
+    recorded = {entry["month"] for entry in catalog["stores"].values()
+                if entry["prefix"] == prefix and entry["parameter"] == parameter}
+    return [month for month in months if month not in recorded]
+
+def open_month(month, parameter, start_dt, end_dt, storage_options, use_cache=USE_CHUNK_CACHE):
+    """
+    Otevře (líně) Zarr úložiště jednoho měsíce a vybere z něj jen časy
+    start_dt - end_dt. Vrací None, pokud úložiště pro parametr neexistuje.
+    """
+    zarr_path = f"s3://{BUCKET_NAME}/{BASE_PREFIX}/{month}/{parameter}.zarr"
+    try:
+        store = fsspec.get_mapper(zarr_path, **storage_options)
+        if use_cache:
+            store = CachedStore(store, zarr_path, get_cache())
+        ds = xr.open_zarr(store, consolidated=True)
+    except (FileNotFoundError, KeyError):
+        print(f"Data pro měsíc {month} (parametr {parameter}) NEEXISTUJÍ.")
+        return None
+    ds = ds.sel(time=slice(start_dt, end_dt))
+    print(f"Načten {zarr_path}: {len(ds.time)} časů v požadovaném období")
+    return ds
+
+class GridIndex:
+    """
+    Prostorový index 2-D (křivočaré) mřížky latitude/longitude.
+
+    Obdélník lat/lon se převede na rozsahy indexů y/x, nejbližší bod mřížky
+    se hledá KD-stromem nad body na jednotkové kouli, takže výběr je pak jen
+    `isel` a ze S3 se stáhnou jen chunky, které do výřezu zasahují.
+    """
+
+    def __init__(self, latitude, longitude):
+        self.dims = latitude.dims
+        self.latitude = np.asarray(latitude.values, dtype="float64")
+        self.longitude = np.asarray(longitude.values, dtype="float64")
+        self.tree = cKDTree(self._to_xyz(self.latitude.ravel(), self.longitude.ravel()))
+
+    @staticmethod
+    def _to_xyz(lat, lon):
+        lat, lon = np.radians(lat), np.radians(lon)
+        return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+    def bbox(self, lat_range=None, lon_range=None):
+        """Vrátí {dim: slice} pokrývající všechny body mřížky uvnitř obdélníku, None když žádný není"""
+        mask = np.ones(self.latitude.shape, dtype=bool)
+        if lat_range is not None:
+            mask &= (self.latitude >= min(lat_range)) & (self.latitude <= max(lat_range))
+        if lon_range is not None:
+            mask &= (self.longitude >= min(lon_range)) & (self.longitude <= max(lon_range))
+        if not mask.any():
+            return None
+        selection = {}
+        for axis, dim in enumerate(self.dims):
+            hits = np.flatnonzero(mask.any(axis=1 - axis))
+            selection[dim] = slice(int(hits[0]), int(hits[-1]) + 1)
+        return selection
+
+    def nearest(self, lat, lon):
+        """Vrátí {dim: index} nejbližšího bodu mřížky a jeho vzdálenost v km"""
+        distance, flat_index = self.tree.query(self._to_xyz([lat], [lon])[0])
+        index = np.unravel_index(flat_index, self.latitude.shape)
+        return {dim: int(i) for dim, i in zip(self.dims, index)}, distance * 6371.0
+
+
+# Indexy mřížek podle definice mřížky (tvar + hash souřadnic)
+_grid_indexes = {}
+
+def grid_index(ds):
+    """GridIndex pro mřížku datasetu - sestaví se jednou pro každou definici mřížky"""
+    latitude, longitude = ds.latitude.load(), ds.longitude.load()
+    key = (latitude.shape, hashlib.sha1(latitude.values.tobytes() + longitude.values.tobytes()).hexdigest())
+    if key not in _grid_indexes:
+        _grid_indexes[key] = GridIndex(latitude, longitude)
+    return _grid_indexes[key]
+
+def spatial_subset(ds, lat_range=None, lon_range=None, point=None):
+    """
+    Prostorový výběr - obdélník lat_range/lon_range nebo nejbližší bod k point=(lat, lon).
+    Funguje pro 1-D souřadnice (sel) i pro 2-D křivočarou mřížku ALADINu (isel přes GridIndex).
+    """
+    if ds.latitude.ndim == 1 and point is None:
+        if lat_range is not None:
+            ds = ds.sel(latitude=slice(lat_range[0], lat_range[1]))
+        if lon_range is not None:
+            ds = ds.sel(longitude=slice(lon_range[0], lon_range[1]))
+        return ds
+    if ds.latitude.ndim == 1:
+        return ds.sel(latitude=point[0], longitude=point[1], method="nearest")
+
+    index = grid_index(ds)
+    if point is not None:
+        selection, distance = index.nearest(*point)
+        print(f"Nejbližší bod mřížky k {point}: {selection} ({distance:.1f} km)")
+        return ds.isel(selection)
+    selection = index.bbox(lat_range, lon_range)
+    if selection is None:
+        print(f"V oblasti {lat_range} / {lon_range} nejsou žádné body mřížky")
+        return None
+    return ds.isel(selection)
+
+def open_virtual(parameter, storage_options, use_cache=USE_CHUNK_CACHE):
+    """
+    Celá historie parametru jako jeden líný dataset z referenčního souboru
+    virtual/<BASE_PREFIX>/<parametr>.json - jedno čtení metadat místo otevření
+    každého měsíce. Vrací (dataset, měsíce v něm obsažené) nebo None, pokud
+    referenční soubor neexistuje. Měsíce s jiným uspořádáním úložiště
+    zapisovač do referencí nezařadí - ty je třeba otevřít zvlášť (open_months).
+    """
+    ref_url = f"s3://{BUCKET_NAME}/{VIRTUAL_PREFIX}/{BASE_PREFIX}/{parameter}.json"
+    try:
+        with fsspec.open(ref_url, "rb", **storage_options) as file:
+            raw = file.read()
+    except FileNotFoundError:
+        return None
+    references = json.loads(raw)
+    included = references.get("included")
+    if included is None:
+        # Starší referenční soubory - stejné uspořádání jako nejnovější měsíc
+        months = references["months"]
+        newest = months[max(months)]
+        included = [month for month, info in sorted(months.items())
+                    if info["layout"] == newest["layout"] and info["n_times"]]
+
+    fs = fsspec.filesystem("reference", fo=references, remote_protocol="s3", remote_options=storage_options)
+    store = fs.get_mapper("")
+    if use_cache:
+        # Verze cache podle obsahu referenčního souboru - časy jsou přímo v něm (time/0)
+        # a připsání uvnitř posledního chunku virtuální .zmetadata nezmění
+        store = CachedStore(store, ref_url, get_cache(), version=hashlib.sha1(raw).hexdigest())
+    ds = xr.open_zarr(store, consolidated=True)
+    # Měsíce začínají na hranici chunku, nevyužitá místa mají čas NaT
+    ds = ds.isel(time=np.flatnonzero(~np.isnat(ds.time.values)))
+    if not ds.indexes["time"].is_monotonic_increasing:
+        ds = ds.sortby("time")
+    # valid_time se do virtuálního datasetu nepřebírá (jednotky se liší po měsících)
+    if "step" in ds.coords and "valid_time" not in ds.coords:
+        ds = ds.assign_coords(valid_time=ds.time + ds.step)
+    return ds, included
+
+def open_months(parameter, start_dt, end_dt, storage_options, max_workers=MAX_OPEN_WORKERS,
+                use_cache=USE_CHUNK_CACHE, catalog=None, available_months=None, only_months=None):
+    """
+    Měsíční úložiště parametru v období, otevřená souběžně a spojená (líně)
+    podél času. Existující měsíce se zjistí z katalogu v bucketu (jeden GET,
+    jinak jedním výpisem S3) - načtený katalog / výpis lze předat. Měsíce,
+    pro které katalog nemá záznam (starší úložiště), se ověří výpisem S3.
+    S only_months se otevřou jen tyto měsíce (YYYYMM).
+    """
+    # Zjištění potřebných měsíců
+    needed_months = [month for month in month_keys(start_dt, end_dt)
+                     if only_months is None or month in only_months]
+    print(f"Potřebné měsíce: {needed_months}")
+
+    if catalog is None and available_months is None:
+        catalog = load_catalog()
+    if catalog is not None:
+        months = [month for month in catalog_months(catalog, parameter, start_dt, end_dt)
+                  if month in needed_months]
+        # Měsíce bez záznamu v katalogu se nepovažují za neexistující - ověří se výpisem S3
+        unknown = uncatalogued_months(catalog, parameter, needed_months)
+        if unknown:
+            print(f"Katalog nemá záznam pro měsíce {unknown} (parametr {parameter}), ověřuji je výpisem S3")
+            available_months = list_months() if available_months is None else available_months
+            months = sorted(months + [month for month in unknown if month in available_months])
+    else:
+        available_months = list_months() if available_months is None else available_months
+        months = [month for month in needed_months if month in available_months]
+    missing = [month for month in needed_months if month not in months]
+    if missing:
+        print(f"Data pro měsíce {missing} NEEXISTUJÍ.")
+    
+    # Souběžné otevření měsíčních úložišť (jen metadata, data se nestahují)
+    datasets = []
+    if months:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(months))) as executor:
+            futures = [executor.submit(open_month, month, parameter, start_dt, end_dt, storage_options, use_cache)
+                       for month in months]
+            for month, future in zip(months, futures):
                 try:
-                    # Načtení dat přímo - přeskočíme kontrolu s s3fs.exists()
-                    print(f"Načítám data z {zarr_path}...")
-                    ds = xr.open_zarr(zarr_path, consolidated=True, storage_options=storage_options)
-                    print(f"Načten dataset s časovým rozsahem: {ds.time.min().values} až {ds.time.max().values}")
-                    print(f"Rozměry datasetu: {ds.dims}")
-                    datasets.append(ds)
+                    ds = future.result()
                 except Exception as e:
                     print(f"Chyba při načítání dat pro měsíc {month}: {e}")
                     import traceback
                     traceback.print_exc()
-            else:
-                print(f"Data pro měsíc {month} NEEXISTUJÍ nebo jsou prázdná.")
+                    continue
+                if ds is not None and len(ds.time):
+                    datasets.append(ds)
+    
+    if not datasets:
+        return None
+    
+    # Spojení datasetů - měsíce sdílí mřížku, souřadnice se neporovnávají
+    # ani nenačítají, data zůstávají líná
+    print(f"Spojuji {len(datasets)} datasetů...")
+    return xr.concat(datasets, dim="time", data_vars="minimal", coords="minimal",
+                     compat="override", join="override")
+
+def load_data(parameter, start_date, end_date, lat_range=None, lon_range=None,
+              max_workers=MAX_OPEN_WORKERS, point=None, use_cache=USE_CHUNK_CACHE,
+              use_virtual=USE_VIRTUAL_DATASET):
+    """
+    Načte data z S3 pro zadaný parametr a časové období.
+
+    Prostorově se vybírá obdélníkem lat_range/lon_range, nebo s point=(lat, lon)
+    časová řada v nejbližším bodě mřížky. S use_cache se chunky čtou z lokální
+    cache na disku a ze S3 se stahují jen poprvé nebo po změně úložiště.
+
+    S use_virtual se parametr otevře jako jeden dataset přes všechny měsíce
+    (open_virtual) a zvlášť se otevřou jen měsíce, které v něm chybí, jinak
+    se otevřou jednotlivé měsíce (open_months), viz open_parameters. Výsledek
+    zůstává líný (dask) - ze S3 se stahují jen chunky z požadovaného časového
+    a prostorového výřezu.
+    """
+    try:
+        # Převedení dat na datetime objekty
+        start_dt = pd.to_datetime(start_date)
+        end_dt = pd.to_datetime(end_date)
+        storage_options = STORAGE_OPTIONS
         
-        if not datasets:
+        filtered_ds = open_parameters([parameter], start_dt, end_dt, storage_options, max_workers,
+                                      use_cache, use_virtual)[parameter]
+        
+        if filtered_ds is None or not len(filtered_ds.time):
             print("Nepodařilo se načíst žádná data pro zadané období.")
             return None
         
-        # Spojení datasetů
-        print(f"Spojuji {len(datasets)} datasetů...")
-        combined_ds = xr.concat(datasets, dim="time")
-        
-        # Filtrování podle času
-        print(f"Filtruji data od {start_dt} do {end_dt}")
-        filtered_ds = combined_ds.sel(time=slice(start_dt, end_dt))
-        
         # Filtrování podle zeměpisné šířky a délky
-        if lat_range is not None:
-            print(f"Filtruji zeměpisnou šířku od {lat_range[0]} do {lat_range[1]}")
-            filtered_ds = filtered_ds.sel(latitude=slice(lat_range[0], lat_range[1]))
-        
-        if lon_range is not None:
-            print(f"Filtruji zeměpisnou délku od {lon_range[0]} do {lon_range[1]}")
-            filtered_ds = filtered_ds.sel(longitude=slice(lon_range[0], lon_range[1]))
+        if lat_range is not None or lon_range is not None or point is not None:
+            print(f"Filtruji oblast: šířka {lat_range}, délka {lon_range}, bod {point}")
+            filtered_ds = spatial_subset(filtered_ds, lat_range, lon_range, point)
+            if filtered_ds is None:
+                return None
         
         print(f"Finální rozměry datasetu: {filtered_ds.dims}")
         return filtered_ds
@@ -113,6 +356,348 @@ def load_data(parameter, start_date, end_date, lat_range=None, lon_range=None):
         return None
 
 
+def to_step(step):
+    """Krok předpovědi jako Timedelta - z timedelta, řetězce ("6h") nebo počtu hodin"""
+    if isinstance(step, (int, float, np.integer, np.floating)):
+        return pd.to_timedelta(step, unit="h")
+    return pd.to_timedelta(step)
+
+def select_steps(ds, steps):
+    """Výběr kroků předpovědi - seznam timedelta/řetězců ("6h") nebo počtů hodin"""
+    return ds.sel(step=[to_step(step) for step in steps])
+
+def same_grid(ds, reference):
+    """Stejná mřížka (rozměry a tvar souřadnic) - výběr z reference platí i pro ds"""
+    return (ds.latitude.dims == reference.latitude.dims
+            and ds.latitude.shape == reference.latitude.shape)
+
+def open_parameters(parameters, start_dt, end_dt, storage_options, max_workers=MAX_OPEN_WORKERS,
+                    use_cache=USE_CHUNK_CACHE, use_virtual=USE_VIRTUAL_DATASET):
+    """
+    Otevře (líně) více parametrů najednou - {parametr: dataset nebo None}.
+
+    Nejdřív se souběžně zkusí virtuální datasety všech parametrů. Měsíce
+    období, které ve virtuálním datasetu nejsou (jiné uspořádání úložiště,
+    chybějící referenční soubor), se otevřou po měsících - katalog (jinak
+    výpis S3) se na to načte jednou a měsíce se otevřou opět souběžně.
+    """
+    datasets = dict.fromkeys(parameters)
+    # Měsíce, které se otevřou po měsících (None = všechny měsíce období)
+    month_gaps = dict.fromkeys(parameters)
+    workers = max(1, min(max_workers, len(parameters)))
+
+    def open_all(open_one, names):
+        """{parametr: výsledek open_one}, chyba jednoho parametru nezastaví ostatní"""
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(open_one, name) for name in names}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"Chyba při otevírání parametru {name}: {e}")
+                results[name] = None
+        return results
+
+    if use_virtual:
+        for name, opened in open_all(lambda name: open_virtual(name, storage_options, use_cache),
+                                     parameters).items():
+            if opened is None:
+                continue
+            ds, included = opened
+            print(f"Načten virtuální dataset {name}: {len(ds.time)} časů z {len(included)} měsíců")
+            datasets[name] = ds.sel(time=slice(start_dt, end_dt))
+            month_gaps[name] = [month for month in month_keys(start_dt, end_dt) if month not in included]
+            if month_gaps[name]:
+                print(f"Měsíce {month_gaps[name]} nejsou ve virtuálním datasetu {name}, otevírám je zvlášť")
+
+    remaining = [name for name in parameters if month_gaps[name] is None or month_gaps[name]]
+    if remaining:
+        catalog = load_catalog()
+        # Výpis S3 jednou pro všechny parametry - bez katalogu, nebo když katalogu některé měsíce chybí
+        period = month_keys(start_dt, end_dt)
+        if catalog is None or any(uncatalogued_months(catalog, name, period) for name in remaining):
+            available_months = list_months()
+        else:
+            available_months = None
+        opened = open_all(lambda name: open_months(name, start_dt, end_dt, storage_options, max_workers,
+                                                   use_cache, catalog, available_months, month_gaps[name]),
+                          remaining)
+        for name, ds in opened.items():
+            if ds is None:
+                continue
+            if datasets[name] is None or not len(datasets[name].time):
+                datasets[name] = ds
+            else:
+                datasets[name] = xr.concat([datasets[name], ds], dim="time", data_vars="minimal",
+                                           coords="minimal", compat="override", join="override").sortby("time")
+    return datasets
+
+def load_parameters(parameters, start_date, end_date, lat_range=None, lon_range=None, point=None,
+                    steps=None, max_workers=MAX_OPEN_WORKERS, use_cache=USE_CHUNK_CACHE,
+                    use_virtual=USE_VIRTUAL_DATASET):
+    """
+    Načte více parametrů pro stejné období a oblast jako jeden dataset.
+
+    Úložiště všech parametrů se otevřou najednou (open_parameters), výřez
+    mřížky se spočítá jen jednou a použije pro všechny parametry se stejnou
+    mřížkou a souřadnice (latitude/longitude, step) se převezmou z prvního
+    parametru. Časy se spojí (chybějící časy parametru jsou NaN), valid_time
+    se dopočítá jako time + step. S steps se vyberou jen dané kroky předpovědi.
+    Výsledek zůstává líný (dask). Vrací None, pokud se nenačetl žádný parametr.
+    """
+    try:
+        start_dt = pd.to_datetime(start_date)
+        end_dt = pd.to_datetime(end_date)
+        opened = open_parameters(list(parameters), start_dt, end_dt, STORAGE_OPTIONS,
+                                 max_workers, use_cache, use_virtual)
+        missing = [name for name, ds in opened.items() if ds is None or not len(ds.time)]
+        if missing:
+            print(f"Parametry {missing} nemají data pro zadané období.")
+        datasets = [ds for name, ds in opened.items() if name not in missing]
+        if not datasets:
+            print("Nepodařilo se načíst žádná data pro zadané období.")
+            return None
+
+        if steps is not None:
+            datasets = [select_steps(ds, steps) for ds in datasets]
+
+        # Výřez mřížky jen jednou - z prvního parametru, ostatní se stejnou mřížkou ho převezmou
+        if lat_range is not None or lon_range is not None or point is not None:
+            print(f"Filtruji oblast: šířka {lat_range}, délka {lon_range}, bod {point}")
+            reference = datasets[0]
+            subset = spatial_subset(reference, lat_range, lon_range, point)
+            if subset is None:
+                return None
+            selection = None
+            if reference.latitude.ndim == 2:
+                index = grid_index(reference)
+                selection = index.nearest(*point)[0] if point is not None else index.bbox(lat_range, lon_range)
+            datasets = [subset] + [ds.isel(selection) if selection is not None and same_grid(ds, reference)
+                                   else spatial_subset(ds, lat_range, lon_range, point)
+                                   for ds in datasets[1:]]
+            datasets = [ds for ds in datasets if ds is not None]
+
+        # Souřadnice bez času se převezmou z prvního parametru, valid_time se dopočítá
+        shared = [name for name in ("latitude", "longitude") if name in datasets[0].coords]
+        datasets = [datasets[0]] + [ds.drop_vars([name for name in shared if name in ds.coords])
+                                    for ds in datasets[1:]]
+        datasets = [ds.drop_vars("valid_time") if "valid_time" in ds.coords else ds for ds in datasets]
+        merged = xr.merge(datasets, join="outer", compat="override", combine_attrs="drop_conflicts")
+        if "step" in merged.coords:
+            merged = merged.assign_coords(valid_time=merged.time + merged.step)
+
+        print(f"Finální rozměry datasetu: {merged.dims}")
+        return merged
+
+    except Exception as e:
+        print(f"Chyba při načítání dat: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+def read_valid_index(month, parameter):
+    """Index platností úložiště z jeho .zvalid, None pokud ho nemá"""
+    try:
+        with s3fs_instance.open(f"{BUCKET_NAME}/{BASE_PREFIX}/{month}/{parameter}.zarr/{VALID_INDEX_KEY}", "rb") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def valid_index_from_coords(ds):
+    """
+    Index platností spočtený ze souřadnic time/step (pro úložiště bez .zvalid) -
+    stejný tvar jako .zvalid, časy v minutách od 1970-01-01.
+    """
+    runs = ds.time.values.astype("datetime64[m]").astype("int64")
+    steps = ds.step.values.astype("timedelta64[m]").astype("int64")
+    valid = (runs[:, None] + steps[None, :]).ravel()
+    order = np.lexsort((-np.repeat(runs, len(steps)), valid))
+    valid_times, first = np.unique(valid[order], return_index=True)
+    time_idx, step_idx = np.divmod(order[first], len(steps))
+    return {"runs": runs.tolist(), "steps": steps.tolist(), "valid_times": valid_times.tolist(),
+            "latest": np.column_stack([time_idx, step_idx]).tolist()}
+
+def open_month_indexed(month, parameter, use_cache=USE_CHUNK_CACHE):
+    """Celé úložiště měsíce (líně) a jeho index platností, (None, None) pokud neexistuje"""
+    ds = open_month(month, parameter, None, None, STORAGE_OPTIONS, use_cache)
+    if ds is None:
+        return None, None
+    index = read_valid_index(month, parameter)
+    if index is None or len(index["runs"]) != len(ds.time) or len(index["steps"]) != len(ds.step):
+        print(f"Úložiště {month}/{parameter} nemá aktuální {VALID_INDEX_KEY}, index se spočte ze souřadnic")
+        index = valid_index_from_coords(ds)
+    return ds, index
+
+def latest_forecast(parameter, start_date, end_date, lat_range=None, lon_range=None, point=None,
+                    max_workers=MAX_OPEN_WORKERS, use_cache=USE_CHUNK_CACHE):
+    """
+    Nejlepší dostupná předpověď - pro každou platnost (time + step) v období
+    hodnota z nejnovějšího běhu, který ji pokrývá.
+
+    Pozice (time, step) se vyberou z indexů platností měsíců (.zvalid), data
+    se pak vyberou jedním vektorovým isel, takže se ze S3 stáhnou jen chunky,
+    ve kterých vybrané pozice leží. Výsledek má rozměr valid_time, souřadnice
+    time (běh) a step u každé hodnoty ukazují, odkud hodnota pochází.
+    """
+    try:
+        start_dt = pd.to_datetime(start_date)
+        end_dt = pd.to_datetime(end_date)
+        months = month_keys(start_dt - MAX_FORECAST_STEP, end_dt)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(months)))) as executor:
+            opened = list(executor.map(lambda month: open_month_indexed(month, parameter, use_cache), months))
+
+        # Kandidáti ze všech měsíců: (platnost, běh, měsíc, pozice time, pozice step)
+        start_min = start_dt.to_datetime64().astype("datetime64[m]").astype("int64")
+        end_min = end_dt.to_datetime64().astype("datetime64[m]").astype("int64")
+        candidates = []
+        for month_idx, (ds, index) in enumerate(opened):
+            if index is None or not index["valid_times"]:
+                continue
+            valid = np.asarray(index["valid_times"], dtype="int64")
+            latest = np.asarray(index["latest"], dtype="int64").reshape(-1, 2)
+            inside = (valid >= start_min) & (valid <= end_min)
+            runs = np.asarray(index["runs"], dtype="int64")[latest[inside, 0]]
+            candidates.append(np.column_stack([valid[inside], runs, np.full(inside.sum(), month_idx),
+                                               latest[inside]]))
+        candidates = np.concatenate(candidates) if candidates else np.empty((0, 5), dtype="int64")
+        if not len(candidates):
+            print("Pro zadané období nejsou žádné předpovědi.")
+            return None
+        # Běh z pozdějšího měsíce přebíjí starší - pro každou platnost nejnovější běh
+        candidates = candidates[np.lexsort((-candidates[:, 1], candidates[:, 0]))]
+        candidates = candidates[np.unique(candidates[:, 0], return_index=True)[1]]
+
+        parts = []
+        for month_idx in np.unique(candidates[:, 2]):
+            rows = candidates[candidates[:, 2] == month_idx]
+            ds = opened[month_idx][0].drop_vars("valid_time", errors="ignore")
+            if lat_range is not None or lon_range is not None or point is not None:
+                ds = spatial_subset(ds, lat_range, lon_range, point)
+                if ds is None:
+                    return None
+            valid_times = rows[:, 0].astype("datetime64[m]").astype("datetime64[ns]")
+            part = ds.isel(time=xr.DataArray(rows[:, 3], dims="valid_time"),
+                           step=xr.DataArray(rows[:, 4], dims="valid_time"))
+            parts.append(part.assign_coords(valid_time=valid_times))
+        result = parts[0] if len(parts) == 1 else xr.concat(parts, dim="valid_time", data_vars="minimal",
+                                                            coords="minimal", compat="override")
+        result = result.sortby("valid_time")
+        print(f"Nejnovější předpověď {parameter}: {len(result.valid_time)} platností "
+              f"z {len(np.unique(candidates[:, 1]))} běhů")
+        return result
+
+    except Exception as e:
+        print(f"Chyba při načítání předpovědi: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def forecast_horizon(parameter, step, start_date, end_date, lat_range=None, lon_range=None, point=None,
+                     use_cache=USE_CHUNK_CACHE, use_virtual=USE_VIRTUAL_DATASET):
+    """
+    Řez pevným krokem předpovědi - hodnoty všech běhů s krokem `step`
+    (timedelta, "6h" nebo počet hodin), jejichž platnost je v období.
+    Rozměr valid_time, souřadnice time je běh. Stahuje se jen chunk kroku.
+    """
+    step = to_step(step)
+    ds = load_data(parameter, pd.to_datetime(start_date) - step, pd.to_datetime(end_date) - step,
+                   lat_range, lon_range, point=point, use_cache=use_cache, use_virtual=use_virtual)
+    if ds is None:
+        return None
+    ds = ds.drop_vars("valid_time", errors="ignore").sel(step=step)
+    ds = ds.assign_coords(valid_time=("time", (ds.time + step).values)).swap_dims(time="valid_time")
+    print(f"Řez krokem +{step}: {len(ds.valid_time)} platností")
+    return ds
+
+
+class FramePrefetcher:
+    """
+    Načítá snímky (time, step) ve vláknech na pozadí - kromě aktuálního
+    i sousední snímky, takže posun posuvníku většinou nečeká na S3.
+    """
+
+    def __init__(self, data_array, max_workers=PREFETCH_WORKERS, radius=PREFETCH_RADIUS,
+                 max_frames=FRAME_CACHE_SIZE):
+        self.data_array = data_array
+        self.radius = radius
+        self.max_frames = max_frames
+        self.shape = (len(data_array.time), len(data_array.step))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self.frames = OrderedDict()  # (time_idx, step_idx) -> Future s np.ndarray
+
+    def _load(self, time_idx, step_idx):
+        return self.data_array.isel(time=time_idx, step=step_idx).values
+
+    def request(self, time_idx, step_idx):
+        """Future se snímkem, který se případně začne načítat (znovu, pokud načtení selhalo)"""
+        key = (time_idx, step_idx)
+        future = self.frames.get(key)
+        if future is not None and future.done() and not future.cancelled() and future.exception() is not None:
+            del self.frames[key]
+        if key in self.frames:
+            self.frames.move_to_end(key)
+        else:
+            self.frames[key] = self.executor.submit(self._load, time_idx, step_idx)
+            while len(self.frames) > self.max_frames:
+                self.frames.popitem(last=False)[1].cancel()
+        return self.frames[key]
+
+    def prefetch_around(self, time_idx, step_idx):
+        """Vrátí Future aktuálního snímku a zařadí sousední snímky, nejbližší nejdřív"""
+        current = self.request(time_idx, step_idx)
+        neighbours = sorted(
+            ((t, s) for t in range(time_idx - self.radius, time_idx + self.radius + 1)
+             for s in range(step_idx - self.radius, step_idx + self.radius + 1)
+             if 0 <= t < self.shape[0] and 0 <= s < self.shape[1] and (t, s) != (time_idx, step_idx)),
+            key=lambda ts: abs(ts[0] - time_idx) + abs(ts[1] - step_idx))
+        for t, s in neighbours:
+            self.request(t, s)
+        self.frames.move_to_end((time_idx, step_idx))
+        return current
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def estimate_color_range(data_array, samples=COLOR_SAMPLE_FRAMES):
+    """
+    Rozsah barev z několika rovnoměrně vybraných snímků (načtených souběžně)
+    místo průchodu celým výběrem - stáhne se jen pár chunků.
+    """
+    n_time, n_step = len(data_array.time), len(data_array.step)
+    picks = np.linspace(0, n_time * n_step - 1, min(samples, n_time * n_step)).astype(int)
+    with ThreadPoolExecutor(max_workers=PREFETCH_WORKERS) as executor:
+        values = list(executor.map(
+            lambda i: data_array.isel(time=int(i // n_step), step=int(i % n_step)).values, picks))
+    return float(np.nanmin(values)), float(np.nanmax(values))
+
+
+def read_store_stats(month, parameter):
+    """Statistiky (min/max/mean, pokrytí časem) úložiště z jeho .zstats, None pokud nejsou"""
+    try:
+        with s3fs_instance.open(f"{BUCKET_NAME}/{BASE_PREFIX}/{month}/{parameter}.zarr/{STATS_KEY}", "rb") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def stored_color_range(parameter, start_date, end_date):
+    """
+    Rozsah barev z uložených statistik měsíců v období (pár kB místo dat,
+    rozsah platí pro celou mřížku), None pokud některý měsíc statistiky nemá nebo nepokrývají všechna data.
+    """
+    months = month_keys(pd.to_datetime(start_date), pd.to_datetime(end_date))
+    with ThreadPoolExecutor(max_workers=MAX_OPEN_WORKERS) as executor:
+        all_stats = list(executor.map(lambda month: read_store_stats(month, parameter), months))
+    if not all_stats or any(stats is None or stats.get("partial") or not stats["summary"]["count"]
+                            for stats in all_stats):
+        return None
+    return (min(stats["summary"]["min"] for stats in all_stats),
+            max(stats["summary"]["max"] for stats in all_stats))
+
+
 def launch_viewer():
     """Spustí interaktivní prohlížeč meteorologických dat."""
 
@@ -142,9 +727,11 @@ def launch_viewer():
     max_time_idx = len(data.time) - 1
     max_step_idx = len(data.step) - 1
     
-    # Rozsah hodnot parametru pro konzistentní barvy
-    param_min = float(data[default_param].min())
-    param_max = float(data[default_param].max())
+    # Rozsah hodnot parametru pro konzistentní barvy - z uložených statistik,
+    # jinak odhad z několika snímků
+    color_range = stored_color_range(default_param, data.time.values[0], data.time.values[-1])
+    param_min, param_max = color_range or estimate_color_range(data[default_param])
+    prefetcher = FramePrefetcher(data[default_param])
     
     # Počáteční vykreslení
     time_value = data.time.values[time_idx]
@@ -156,8 +743,12 @@ def launch_viewer():
             f"Krok předpovědi: +{step_value}\n"
             f"Platnost: {valid_time}")
     
-    # Vykreslení dat
-    plot_data = data[default_param].isel(time=time_idx, step=step_idx)
+    # Vykreslení dat (při chybě prázdný snímek s chybou v titulku)
+    try:
+        plot_data = prefetcher.prefetch_around(time_idx, step_idx).result()
+    except Exception as e:
+        plot_data = np.full(data[default_param].isel(time=0, step=0).shape, np.nan)
+        title = f"{default_param}\nChyba při načítání snímku: {e}"
     img = ax.pcolormesh(data.longitude, data.latitude, plot_data, 
                        cmap='viridis', vmin=param_min, vmax=param_max, 
                        shading='auto')
@@ -189,10 +780,36 @@ def launch_viewer():
         valstep=1
     )
     
+    # Čekání na snímek, který se ještě načítá - UI se neblokuje, jen se
+    # periodicky kontroluje, jestli už je hotový (stále tentýž Future, takže
+    # snímek, jehož načtení selhalo, se znovu načte až při dalším posunu)
+    pending_timer = fig.canvas.new_timer(interval=50)
+    waiting = {}
+
+    def draw_when_ready():
+        show_frame(*waiting["frame"])
+
+    pending_timer.add_callback(draw_when_ready)
+
     # Funkce pro aktualizaci grafu
     def update(val):
         time_idx = int(time_slider.val)
         step_idx = int(step_slider.val)
+        waiting["frame"] = (time_idx, step_idx, prefetcher.prefetch_around(time_idx, step_idx))
+        show_frame(*waiting["frame"])
+
+    def show_frame(time_idx, step_idx, frame):
+        if not frame.done():
+            ax.set_title(f"{default_param}\nNačítám snímek...")
+            fig.canvas.draw_idle()
+            pending_timer.start()
+            return
+        pending_timer.stop()
+        
+        if frame.exception() is not None:
+            ax.set_title(f"{default_param}\nChyba při načítání snímku: {frame.exception()}")
+            fig.canvas.draw_idle()
+            return
         
         time_value = data.time.values[time_idx]
         step_value = data.step.values[step_idx]
@@ -203,8 +820,7 @@ def launch_viewer():
                 f"Krok předpovědi: +{step_value}\n"
                 f"Platnost: {valid_time}")
         
-        plot_data = data[default_param].isel(time=time_idx, step=step_idx)
-        img.set_array(plot_data.values.ravel())
+        img.set_array(frame.result().ravel())
         ax.set_title(title)
         fig.canvas.draw_idle()
     
@@ -223,6 +839,9 @@ def launch_viewer():
     reset_button.on_clicked(reset)
     
     plt.show()
+    prefetcher.shutdown()
+    if USE_CHUNK_CACHE:
+        print(get_cache().report())
 
 if __name__ == "__main__":
     launch_viewer()
\ No newline at end of file
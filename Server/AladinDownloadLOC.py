@@ -1,7 +1,10 @@
 import aiohttp
 import asyncio
 import bz2
+import hashlib
+import json
 import os
+import time
 from datetime import datetime, timedelta
 from config import (
     DOMAINLA,
@@ -22,59 +25,288 @@ SUBDOMAIN = SUBDOMAINCZ
 # List of TIME values to process
 TIME_VALUES = ["00", "06", "12", "18"]
 
-async def fetch_data(URL):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(URL) as response:
-            if response.status == 200:
-                data = await response.read()
-                return data
-            else:
-                print(f"Failed to fetch data, status code: {response.status}")
-                return None
-
-async def process_time_slot(date, time_value):
-    current_date = date.strftime(f"%Y%m%d{time_value}")
-    
-    for attribute in ALADIN_ATTRIBUTES:
-        CURRENTFILE = f"{current_date}_{ALADIN_ATTRIBUTES[attribute]}.grb.bz2"
-        URL = f"{DOMAIN}{time_value}{SUBDOMAIN}{CURRENTFILE}"
-        
-        data = await fetch_data(URL)
-        if data:
-            output_file_grb = CURRENTFILE.replace('.bz2', '')
-            try:
-                decompressed_data = bz2.decompress(data)
-            except Exception as e:
-                print(f"Failed to decompress bz2 data for {date.strftime('%Y-%m-%d')} {time_value}: {e}")
-                continue
-            
-            # Create directories
-            os.makedirs(f"{DIRNAME}", exist_ok=True)
-            os.makedirs(f"{DIRNAME}/{time_value}", exist_ok=True)
-            os.makedirs(f"{DIRNAME}/{time_value}/{current_date}", exist_ok=True)
-            
-            # Write the decompressed file
-            output_path = f"{DIRNAME}/{time_value}/{current_date}/{output_file_grb}"
-            with open(output_path, 'wb') as file:
-                file.write(decompressed_data)
-                print(f"Saved decompressed GRB data to {output_file_grb} for date {date.strftime('%Y-%m-%d')} time {time_value}\n")
+# Max number of files downloaded at once (over all dates, runs and attributes)
+MAX_CONCURRENT_DOWNLOADS = 8
+# Max number of open connections to opendata.chmi.cz, reused with keep-alive
+CONNECTIONS_PER_HOST = 8
+KEEPALIVE_TIMEOUT = 30
+# Size of response chunks fed to the bz2 decompressor
+CHUNK_SIZE = 1024 * 1024
+# Record of downloaded files (ETag, Last-Modified, size, checksum) keyed by URL
+MANIFEST_FILE = f"{DIRNAME}/manifest.json"
+
+
+def create_session(connections_per_host=CONNECTIONS_PER_HOST, stats=None):
+    """
+    Create one pooled aiohttp session shared by all downloads.
+
+    If `stats` dict is given, number of newly opened TCP connections is
+    counted in stats["connections"].
+    """
+    connector = aiohttp.TCPConnector(limit=connections_per_host,
+                                     limit_per_host=connections_per_host,
+                                     keepalive_timeout=KEEPALIVE_TIMEOUT)
+    trace_configs = []
+    if stats is not None:
+        stats.setdefault("connections", 0)
+
+        async def on_connection_create_end(session, context, params):
+            stats["connections"] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_configs.append(trace_config)
+
+    return aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
+
+
+def load_manifest(path=MANIFEST_FILE):
+    """Load manifest of downloaded files (keyed by URL), empty if missing."""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"Manifest {path} is corrupted, starting with empty one: {e}")
+        return {}
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    """Atomically write the manifest, so a crash never leaves it half-written."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class Bz2StreamWriter:
+    """
+    Decompress bz2 chunks incrementally into a temporary file next to
+    `output_path`, so only one chunk is held in memory at a time.
+    The file is renamed to `output_path` only after the whole stream is
+    decompressed.
+
+    Compressed chunks are also appended to `<output_path>.bz2.part`, so an
+    interrupted download can be resumed with an HTTP Range request. With
+    `resume=True` the existing part is replayed through the decompressor
+    before new chunks are written.
+    """
+
+    def __init__(self, output_path, resume=False):
+        self.output_path = output_path
+        self.tmp_path = f"{output_path}.tmp"
+        self.part_path = f"{output_path}.bz2.part"
+        self.decompressor = bz2.BZ2Decompressor()
+        # A stream has started and its end-of-stream marker was not reached yet
+        self.in_stream = False
+        self.streams = 0
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.file = open(self.tmp_path, 'wb')
+
+        if resume:
+            with open(self.part_path, 'rb') as part:
+                for chunk in iter(lambda: part.read(CHUNK_SIZE), b""):
+                    self._decompress(chunk)
+        self.part = open(self.part_path, 'ab' if resume else 'wb')
+
+    def _decompress(self, chunk):
+        while chunk:
+            # .bz2 file can contain more concatenated streams - the next one
+            # may start in the same chunk or only in the next one
+            if not self.in_stream:
+                if self.streams:
+                    self.decompressor = bz2.BZ2Decompressor()
+                self.in_stream = True
+            data = self.decompressor.decompress(chunk)
+            self.file.write(data)
+            self.sha256.update(data)
+            self.size += len(data)
+            if not self.decompressor.eof:
+                break
+            self.in_stream = False
+            self.streams += 1
+            chunk = self.decompressor.unused_data
+
+    def write(self, chunk):
+        self.part.write(chunk)
+        self._decompress(chunk)
+
+    def commit(self):
+        self.file.close()
+        self.part.close()
+        if self.in_stream or not self.streams:
+            self.abort()
+            raise EOFError("Compressed stream ended before the end-of-stream marker was reached")
+        os.replace(self.tmp_path, self.output_path)
+        os.remove(self.part_path)
+
+    def abort(self, keep_part=False):
+        """Remove the temporary file, `keep_part` leaves the part for resuming."""
+        self.file.close()
+        self.part.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        if not keep_part and os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+
+async def fetch_to_file(session, URL, output_path, manifest):
+    """
+    Stream .grb.bz2 from URL and decompress it on the fly to output_path.
+    Decompression runs in a worker thread (bz2 releases the GIL), so it
+    overlaps with the network I/O of other downloads.
+
+    Uses the manifest entry for URL to send a conditional request for
+    already completed files, or to resume a partial transfer with Range.
+    Returns "downloaded", "not_modified" or False.
+    """
+    entry = manifest.get(URL, {})
+    validator = entry.get("etag") or entry.get("last_modified")
+    part_path = f"{output_path}.bz2.part"
+    part_size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    headers = {}
+    complete = (entry.get("complete") and os.path.exists(output_path)
+                and os.path.getsize(output_path) == entry.get("size"))
+    if complete:
+        if not validator:
+            return "not_modified"
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    elif part_size and validator:
+        headers["Range"] = f"bytes={part_size}-"
+        headers["If-Range"] = validator
+
+    async with session.get(URL, headers=headers) as response:
+        if response.status == 304:
+            return "not_modified"
+        if response.status == 416:
+            # Part is not a prefix of the current file anymore, start over
+            os.remove(part_path)
+            manifest.pop(URL, None)
+            return await fetch_to_file(session, URL, output_path, manifest)
+        if response.status not in (200, 206):
+            print(f"Failed to fetch data, status code: {response.status}")
+            return False
+
+        resume = response.status == 206
+        if resume:
+            print(f"Resuming {URL} from byte {part_size}")
         else:
-            print(f"Failed to fetch the data for date {date.strftime('%Y-%m-%d')} time {time_value}.\n")
+            entry = manifest[URL] = {
+                "path": output_path,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "compressed_size": response.content_length,
+                "complete": False,
+            }
+            save_manifest(manifest, MANIFEST_FILE)
+
+        writer = await asyncio.to_thread(Bz2StreamWriter, output_path, resume)
+        try:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                await asyncio.to_thread(writer.write, chunk)
+            writer.commit()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Keep what we have, next run continues with a Range request
+            writer.abort(keep_part=True)
+            raise
+        except BaseException:
+            writer.abort()
+            raise
+
+    entry.update(complete=True, size=writer.size, sha256=writer.sha256.hexdigest())
+    save_manifest(manifest, MANIFEST_FILE)
+    return "downloaded"
+
+
+async def process_file(session, semaphore, manifest, date, time_value, attribute, file_queue=None):
+    current_date = date.strftime(f"%Y%m%d{time_value}")
+    CURRENTFILE = f"{current_date}_{ALADIN_ATTRIBUTES[attribute]}.grb.bz2"
+    URL = f"{DOMAIN}{time_value}{SUBDOMAIN}{CURRENTFILE}"
+
+    output_file_grb = CURRENTFILE.replace('.bz2', '')
+    output_dir = f"{DIRNAME}/{time_value}/{current_date}"
+    output_path = f"{output_dir}/{output_file_grb}"
+
+    # Create directories
+    os.makedirs(output_dir, exist_ok=True)
+
+    async with semaphore:
+        try:
+            status = await fetch_to_file(session, URL, output_path, manifest)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Failed to fetch {URL}: {e}")
+            status = False
+        except (OSError, EOFError) as e:
+            print(f"Failed to decompress bz2 data for {date.strftime('%Y-%m-%d')} {time_value}: {e}")
+            status = False
+
+    if not status:
+        print(f"Failed to fetch the data for date {date.strftime('%Y-%m-%d')} time {time_value}.\n")
+    elif status == "not_modified":
+        print(f"Skipping {output_file_grb}, already downloaded\n")
+    else:
+        print(f"Saved decompressed GRB data to {output_file_grb} for date {date.strftime('%Y-%m-%d')} time {time_value}\n")
+
+    # Hand the file over to the next pipeline stage (None if it failed)
+    if file_queue is not None:
+        await file_queue.put((attribute, current_date, output_path if status else None))
+    return status
 
-async def downloadAladin():
+
+async def process_time_slot(session, semaphore, manifest, date, time_value, file_queue=None):
+    tasks = [process_file(session, semaphore, manifest, date, time_value, attribute, file_queue)
+             for attribute in ALADIN_ATTRIBUTES]
+    return await asyncio.gather(*tasks)
+
+
+def download_dates():
     # Get current date and the previous 2 days
     current_date = datetime.now()
-    dates = [
+    return [
         current_date - timedelta(days=1),
     ]
-    
-    # Create tasks for each date and time slot combination
-    tasks = []
-    for date in dates:
-        for time in TIME_VALUES:
-            tasks.append(process_time_slot(date, time))
-    
-    # Run all tasks concurrently
-    await asyncio.gather(*tasks)
-    
-    return True
\ No newline at end of file
+
+
+async def downloadAladin(max_concurrency=MAX_CONCURRENT_DOWNLOADS,
+                         connections_per_host=CONNECTIONS_PER_HOST,
+                         file_queue=None):
+    """
+    Download all ALADIN_ATTRIBUTES for all runs of download_dates().
+
+    If `file_queue` (asyncio.Queue) is given, every processed file is put
+    into it as (attribute, "YYYYMMDDHH", path or None) as soon as it lands.
+    """
+    dates = download_dates()
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    manifest = load_manifest(MANIFEST_FILE)
+    stats = {}
+    started = time.perf_counter()
+
+    # One session for all files - connections are kept alive and reused
+    async with create_session(connections_per_host, stats) as session:
+        # Create tasks for each date and time slot combination
+        tasks = []
+        for date in dates:
+            for time_value in TIME_VALUES:
+                tasks.append(process_time_slot(session, semaphore, manifest, date, time_value, file_queue))
+
+        # Run all tasks concurrently
+        results = await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - started
+    statuses = [status for slot in results for status in slot]
+    downloaded = statuses.count("downloaded")
+    print(f"Downloaded {downloaded} files in {elapsed:.1f} s "
+          f"({downloaded / elapsed if elapsed else 0:.2f} files/s), "
+          f"skipped {statuses.count('not_modified')} unchanged files, "
+          f"connections opened: {stats['connections']}")
+
+    return True
@@ -1,23 +1,48 @@
-
 import cfgrib
 import xarray as xr
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 from config import DIR
+
+# Počet procesů pro paralelní převod (None = počet CPU)
+MAX_WORKERS = None
+
 def list_files_in_directory(directory_path, extension=None):
     return [os.path.join(dirpath, filename) for dirpath, _, filenames in os.walk(directory_path)
             for filename in filenames if not extension or filename.endswith(extension)]
 
 
-def convertToNC():
+def convert_file(file, output_directory):
+    """Převede jeden GRIB soubor do NetCDF, vrací cestu k výstupu nebo None při chybě."""
+    try:
+        # Načti GRIB soubor do xarray Dataset
+        with cfgrib.open_dataset(file) as ds:
+            # Vytvoř cestu pro výstupní soubor
+            filename = os.path.basename(file)
+            output_file = os.path.join(output_directory, filename.replace('.grb', '.nc'))
+
+            # Ulož do NetCDF
+            ds.to_netcdf(output_file)
+        return output_file
+    except Exception as e:
+        print(f"Chyba při zpracování souboru {file}: {e}")
+        return None
+
+
+def convertToNC(max_workers=MAX_WORKERS):
+    """
+    Převede všechny GRIB soubory v adresáři DIR do NetCDF.
+
+    Dekódování GRIB je náročné na CPU, soubory se proto převádí paralelně
+    v `max_workers` procesech (1 = bez process poolu).
+    Vrací slovník {grib soubor: výstupní .nc soubor nebo None při chybě},
+    chyba v jednom souboru nezastaví převod ostatních.
+    """
     # Vstupní adresář s GRIB soubory
     input_directory = DIR
     output_directory = DIR
 
-    # Výstupní adresář (adresář Data v aktuálním umístění skriptu)
-    current_directory = os.path.dirname(os.path.abspath(__file__))
-
-
     # Vytvoření adresáře Data, pokud neexistuje
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
@@ -26,19 +51,13 @@ def convertToNC():
     # Získání seznamu GRIB souborů
     files = list_files_in_directory(input_directory, '.grb')
 
-    for file in files:
-        try:
-            # Načti GRIB soubor do xarray Dataset
-            ds = cfgrib.open_dataset(file)
-            
-            # Vytvoř cestu pro výstupní soubor
-            filename = os.path.basename(file)
-            output_file = os.path.join(output_directory, filename.replace('.grb', '.nc'))
-            
-            # Ulož do NetCDF
-            ds.to_netcdf(output_file)
-        except Exception as e:
-            print(f"Chyba při zpracování souboru {file}: {e}")
-            return False
+    if max_workers == 1 or len(files) <= 1:
+        results = {file: convert_file(file, output_directory) for file in files}
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outputs = executor.map(convert_file, files, [output_directory] * len(files))
+            results = dict(zip(files, outputs))
 
-    return True
\ No newline at end of file
+    failed = sum(1 for output in results.values() if output is None)
+    print(f"Převedeno {len(results) - failed} z {len(results)} GRIB souborů ({failed} chyb)")
+    return results
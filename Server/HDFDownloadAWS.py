@@ -1,13 +1,21 @@
-
 import aiohttp
+import argparse
 import asyncio
 import io
 import os
+import re
+import time
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from config import BUCKET_NAME, aws_secret_access_key, aws_access_key_id, REGION
 
-# Konfigurace pro dva typy radarových dat
+# Konfigurace typů radarových dat. Další produkt se přidá novou položkou;
+# nepovinný klíč "filename_regex" (celý název souboru, jedna skupina = čas
+# YYYYMMDDHHMMSS) nahradí výchozí tvar názvu T_<code>_C_OKPR_<čas>.hdf pro
+# hledání ve výpisu adresáře.
 RADAR_TYPES = [
     {
         "name": "maxz",
@@ -23,10 +31,40 @@ RADAR_TYPES = [
     }
 ]
 
+# Odkazy ve výpisu adresáře (text odkazu může být zkrácený, název se bere z href)
+HREF_REGEX = re.compile(r'href="([^"?#]+)"')
+
+# Maximální počet současných stahování
+MAX_CONCURRENT_DOWNLOADS = 5
+# Počet vláken pro nahrávání do S3 (stahování a nahrávání běží souběžně)
+UPLOAD_WORKERS = 8
+# Soubory větší než tato mez se nahrávají po částech (multipart) paralelně
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MULTIPART_CONCURRENCY = 4
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+    max_concurrency=MULTIPART_CONCURRENCY
+)
+
+# Jeden sdílený S3 klient pro všechna nahrávání (boto3 klient je thread-safe),
+# pool spojení pokrývá všechna vlákna včetně částí multipart uploadu
+s3_client = boto3.client(
+    's3',
+    aws_access_key_id=aws_access_key_id,
+    aws_secret_access_key=aws_secret_access_key,
+    region_name=REGION,
+    config=Config(max_pool_connections=UPLOAD_WORKERS * MULTIPART_CONCURRENCY)
+)
+
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="s3-upload")
+
 # Funkce pro nahrávání souborů do S3
 def upload_file_to_s3(file_obj, bucket, object_name):
     """
-    Nahraje soubor do S3 bucketu
+    Nahraje soubor do S3 bucketu (velké soubory jako paralelní multipart upload)
     
     :param file_obj: Soubor v paměti (BytesIO objekt)
     :param bucket: Název S3 bucketu
@@ -34,67 +72,147 @@ def upload_file_to_s3(file_obj, bucket, object_name):
     :return: True pokud se upload povedl, jinak False
     """
     try:
-        # Vytvoření S3 klienta
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=REGION
-        )
-        
-        s3_client.put_object(Body=file_obj.getvalue(), Bucket=bucket, Key=object_name)
+        s3_client.upload_fileobj(file_obj, bucket, object_name, Config=TRANSFER_CONFIG)
         return True
     except Exception as e:
         print(f"Chyba při nahrávání do S3: {e}")
         return False
 
-async def fetch_data(URL):
+async def upload_file_to_s3_async(file_obj, bucket, object_name):
     """
-    Stahuje data z URL pomocí aiohttp.
+    Nahraje soubor do S3 ve vlákně z upload_executor, takže neblokuje
+    event loop a stahování dalších souborů pokračuje.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(upload_executor, upload_file_to_s3, file_obj, bucket, object_name)
+
+def radar_session(stats=None):
+    """
+    Jedna aiohttp session (pool spojení) pro výpisy adresářů i stahování
+    souborů - spojení na opendata.chmi.cz se znovu používají (keep-alive)
+
+    :param stats: Nepovinný slovník - do stats["connections"] se počítají nově otevřená spojení
+    """
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_DOWNLOADS, limit_per_host=MAX_CONCURRENT_DOWNLOADS)
+    trace_configs = []
+    if stats is not None:
+        stats.setdefault("connections", 0)
+
+        async def on_connection_create_end(session, context, params):
+            stats["connections"] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_configs.append(trace_config)
+    return aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
+
+async def fetch_data(URL, session=None):
+    """
+    Stahuje data z URL pomocí aiohttp přes sdílenou `session`
+    (bez ní se otevře jednorázová).
     Vrátí data, pokud je stahování úspěšné, jinak None.
     """
+    if session is None:
+        async with radar_session() as session:
+            return await fetch_data(URL, session)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(URL) as response:
-                if response.status == 200:
-                    data = await response.read()
-                    return data
-                else:
-                    print(f"Nepodařilo se stáhnout data z {URL}, status kód: {response.status}")
-                    return None
+        async with session.get(URL) as response:
+            if response.status == 200:
+                data = await response.read()
+                return data
+            else:
+                print(f"Nepodařilo se stáhnout data z {URL}, status kód: {response.status}")
+                return None
     except Exception as e:
         print(f"Chyba při stahování dat z {URL}: {e}")
         return None
 
-async def process_radar_file(timestamp, radar_type):
+def radar_filename(timestamp, radar_type):
+    """Název souboru radarového kompozitu pro daný čas"""
+    return f"T_{radar_type['code']}_C_OKPR_{timestamp.strftime('%Y%m%d%H%M%S')}.hdf"
+
+def radar_s3_key(timestamp, radar_type, filename=None):
+    """
+    Cesta v S3 - organizace podle data a typu radaru. `filename` je název
+    nalezený ve výpisu adresáře; bez něj se použije výchozí tvar názvu.
+    """
+    filename = filename or radar_filename(timestamp, radar_type)
+    return f"{radar_type['s3_prefix']}/{timestamp.strftime('%Y%m%d')}/{filename}"
+
+def radar_filename_regex(radar_type):
+    """Regulární výraz pro názvy souborů produktu ve výpisu adresáře"""
+    return re.compile(radar_type.get("filename_regex", rf"T_{re.escape(radar_type['code'])}_C_OKPR_(\d{{14}})\.hdf"))
+
+async def discover_radar_files(radar_type, session=None):
+    """
+    Načte jednou výpis adresáře (index stránku) produktu na opendata.chmi.cz
+    a vrátí {čas: název souboru} souborů, které na serveru opravdu jsou.
+    Vrátí None, pokud se výpis nepodařilo stáhnout.
+    """
+    index = await fetch_data(radar_type['base_url'], session)
+    if index is None:
+        return None
+    pattern = radar_filename_regex(radar_type)
+    text = index.decode('utf-8', errors='replace')
+    files = {}
+    for href in HREF_REGEX.findall(text):
+        # Celý název souboru, ne jeho část (např. .hdf.md5)
+        match = pattern.fullmatch(os.path.basename(href))
+        if match:
+            files[datetime.strptime(match.group(1), "%Y%m%d%H%M%S")] = match.group(0)
+    return files
+
+def list_existing_keys(bucket, prefix):
+    """
+    Vrátí {klíč: velikost} všech objektů pod prefixem v S3.
+    Používá stránkování, takže nekončí po prvních 1000 klíčích.
+    """
+    existing = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            existing[obj['Key']] = obj['Size']
+    return existing
+
+async def process_radar_file(timestamp, radar_type, download_semaphore, zarr_writer=None, filename=None,
+                             session=None):
     """
     Zpracuje jeden radarový soubor - stáhne ho a nahraje do S3
     
     :param timestamp: Časová značka pro soubor (datetime objekt)
     :param radar_type: Slovník s konfigurací pro typ radarových dat
+    :param download_semaphore: Omezení počtu současných stahování
+    :param zarr_writer: Nepovinný RadarZarrWriter - soubor se přidá i do Zarr kostky
+    :param filename: Název souboru z výpisu adresáře (jinak výchozí tvar názvu)
+    :param session: Sdílená aiohttp session (radar_session)
     :return: True pokud je zpracování úspěšné, jinak False
     """
     # Formátování času pro název souboru
     formatted_time = timestamp.strftime("%Y%m%d%H%M%S")
     
     # Sestavení názvu souboru a URL
-    filename = f"T_{radar_type['code']}_C_OKPR_{formatted_time}.hdf"
+    filename = filename or radar_filename(timestamp, radar_type)
     url = f"{radar_type['base_url']}{filename}"
     
-    # Stažení dat
-    data = await fetch_data(url)
+    # Stažení dat (semafor drží jen stahování, nahrávání už běží mimo něj)
+    async with download_semaphore:
+        data = await fetch_data(url, session)
     if data:
         # Příprava dat pro nahrání do S3
         file_in_memory = io.BytesIO(data)
         
         # Cesta v S3 - organizace podle data a typu radaru
-        date_str = timestamp.strftime("%Y%m%d")
-        s3_path = f"{radar_type['s3_prefix']}/{date_str}/{filename}"
+        s3_path = radar_s3_key(timestamp, radar_type, filename)
         
         # Nahrání do S3
-        success = upload_file_to_s3(file_in_memory, BUCKET_NAME, s3_path)
+        success = await upload_file_to_s3_async(file_in_memory, BUCKET_NAME, s3_path)
         if success:
             print(f"Nahráno {filename} do S3 bucketu {BUCKET_NAME}, cesta: {s3_path}")
+            if zarr_writer is not None:
+                try:
+                    await asyncio.to_thread(zarr_writer.add, radar_type['name'], timestamp, data)
+                except Exception as e:
+                    print(f"Chyba při převodu {filename} do Zarr: {e}")
             return True
         else:
             print(f"Nepodařilo se nahrát {filename} do S3")
@@ -103,12 +221,49 @@ async def process_radar_file(timestamp, radar_type):
         print(f"Nepodařilo se stáhnout {radar_type['name']} radar pro čas {formatted_time}")
         return False
 
-async def process_time_period(date):
+def download_file_from_s3(bucket, object_name):
+    """Stáhne objekt z S3, vrátí data nebo None"""
+    try:
+        return s3_client.get_object(Bucket=bucket, Key=object_name)['Body'].read()
+    except Exception as e:
+        print(f"Chyba při stahování {object_name} z S3: {e}")
+        return None
+
+async def backfill_zarr(timestamp, radar_type, s3_path, download_semaphore, zarr_writer):
+    """
+    Doplní do Zarr kostky soubor, který už v S3 je, ale v kostce chybí
+    (převod při jeho nahrání selhal) - zdrojem je surový soubor v S3.
+    
+    :return: True pokud je soubor předán k převodu, jinak False
+    """
+    async with download_semaphore:
+        data = await asyncio.get_running_loop().run_in_executor(
+            upload_executor, download_file_from_s3, BUCKET_NAME, s3_path)
+    if not data:
+        return False
+    try:
+        await asyncio.to_thread(zarr_writer.add, radar_type['name'], timestamp, data)
+    except Exception as e:
+        print(f"Chyba při převodu {s3_path} do Zarr: {e}")
+        return False
+    print(f"Doplněno {s3_path} do Zarr")
+    return True
+
+async def process_time_period(date, available=None, zarr_writer=None, session=None):
     """
     Zpracuje všechna radarová data pro zadané datum
     
     :param date: Datum pro zpracování (datetime objekt)
+    :param available: {název typu: {čas: název souboru}} z výpisu adresáře; pro typy,
+        které v něm nejsou, se zkouší každý 5-minutový interval
+    :param zarr_writer: Nepovinný RadarZarrWriter pro převod do Zarr kostek; soubory
+        už nahrané v S3, které v kostkách chybí, se do nich doplní
+    :param session: Sdílená aiohttp session pro všechna stahování (bez ní se otevře
+        jedna pro celé datum)
     """
+    if session is None:
+        async with radar_session() as session:
+            return await process_time_period(date, available, zarr_writer, session)
     print(f"Zpracovávám data pro datum: {date.strftime('%Y-%m-%d')}")
     
     # Nastavení počátečního a koncového času
@@ -122,35 +277,84 @@ async def process_time_period(date):
     
     current_timestamp = date_start
     
-    # Pro každý 5-minutový interval ve dni
-    tasks = []
+    # Maximálně MAX_CONCURRENT_DOWNLOADS současných stahování
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    
+    # Jeden výpis prefixu radar/<typ>/<YYYYMMDD>/ pro každý typ - co už v S3 je
+    date_str = date.strftime("%Y%m%d")
+    existing = {}
+    for radar_type in RADAR_TYPES:
+        existing.update(await asyncio.to_thread(
+            list_existing_keys, BUCKET_NAME, f"{radar_type['s3_prefix']}/{date_str}/"))
+    
+    # Každý 5-minutový interval ve dni (pro typy bez výpisu adresáře, výchozí název souboru)
+    slots = {}
     while current_timestamp <= date_end:
-        # Pro každý typ radarových dat vytvoříme úkol
-        for radar_type in RADAR_TYPES:
-            task = process_radar_file(current_timestamp, radar_type)
-            tasks.append(task)
-        
-        # Posun na další 5-minutový interval
+        slots[current_timestamp] = None
         current_timestamp += timedelta(minutes=5)
     
-    # Spuštění všech úkolů současně (s omezením počtu)
-    semaphore = asyncio.Semaphore(5)  # Maximálně 5 současných spojení
-    
-    async def bounded_process(task):
-        async with semaphore:
-            return await task
+    tasks = []
+    backfill_tasks = []
+    skipped = 0
+    for radar_type in RADAR_TYPES:
+        if available and available.get(radar_type['name']) is not None:
+            files = {t: name for t, name in available[radar_type['name']].items() if date_start <= t <= date_end}
+        else:
+            files = slots
+        
+        # Úkol vytvoříme jen pro soubory, které v S3 ještě nejsou
+        uploaded = {}
+        for timestamp, filename in sorted(files.items()):
+            s3_path = radar_s3_key(timestamp, radar_type, filename)
+            if existing.get(s3_path):
+                uploaded[timestamp] = s3_path
+                continue
+            tasks.append(process_radar_file(timestamp, radar_type, semaphore, zarr_writer, filename, session))
+        skipped += len(uploaded)
+        
+        # Nahrané soubory, které v Zarr kostce chybí, se do ní doplní
+        if zarr_writer is not None and uploaded:
+            try:
+                missing = await asyncio.to_thread(zarr_writer.missing, radar_type['name'], list(uploaded))
+            except Exception as e:
+                print(f"Nepodařilo se zjistit chybějící časy v Zarr ({radar_type['name']}): {e}")
+                missing = []
+            backfill_tasks.extend(backfill_zarr(timestamp, radar_type, uploaded[timestamp], semaphore, zarr_writer)
+                                  for timestamp in missing)
     
-    bounded_tasks = [bounded_process(task) for task in tasks]
-    results = await asyncio.gather(*bounded_tasks, return_exceptions=True)
+    # Spuštění všech úkolů současně
+    started = time.perf_counter()
+    results = await asyncio.gather(*tasks, *backfill_tasks, return_exceptions=True)
+    backfilled = sum(1 for result in results[len(tasks):] if result is True)
+    results = results[:len(tasks)]
+    if zarr_writer is not None:
+        try:
+            await asyncio.to_thread(zarr_writer.flush)
+        except Exception as e:
+            print(f"Chyba při zápisu radarových dat do Zarr: {e}")
+    elapsed = time.perf_counter() - started
     
     # Počet úspěšných stažení
     successful = sum(1 for result in results if result is True)
-    print(f"Pro datum {date.strftime('%Y-%m-%d')} zpracováno {successful} z {len(tasks)} souborů")
+    print(f"Pro datum {date.strftime('%Y-%m-%d')} přeskočeno {skipped} souborů už nahraných v S3, "
+          f"přeneseno {successful} z {len(tasks)} souborů "
+          f"za {elapsed:.1f} s ({successful / elapsed if elapsed else 0:.2f} souborů/s)")
+    if backfill_tasks:
+        print(f"Do Zarr doplněno {backfilled} z {len(backfill_tasks)} souborů chybějících v kostkách")
+    return successful
 
-async def main():
+async def main(convert_to_zarr=False):
     """
     Hlavní funkce pro stažení obou typů radarových dat za poslední 3 dny
+    
+    :param convert_to_zarr: Nově nahrané soubory přidá i do měsíčních Zarr kostek
     """
+    zarr_writer = None
+    if convert_to_zarr:
+        # Import jen při zapnutém převodu (h5py, xarray, zarr)
+        from radar_to_zarr import RadarZarrWriter
+        from transfrom_s3 import get_storage_options
+        zarr_writer = RadarZarrWriter(BUCKET_NAME, get_storage_options(REGION))
     
     # Získání aktuálního data a předchozích 2 dnů
     current_date = datetime.now()
@@ -160,11 +364,24 @@ async def main():
         current_date
     ]
     
-    # Zpracování každého dne
-    for date in dates:
-        await process_time_period(date)
+    # Jedna session (pool spojení) pro výpisy i všechna stahování
+    async with radar_session() as session:
+        # Jeden výpis adresáře pro každý typ - stahujeme jen soubory, které existují
+        available = {}
+        for radar_type in RADAR_TYPES:
+            available[radar_type['name']] = await discover_radar_files(radar_type, session)
+            if available[radar_type['name']] is None:
+                print(f"Výpis adresáře {radar_type['base_url']} se nepodařilo načíst, zkouším všechny časy")
+        
+        # Zpracování každého dne
+        for date in dates:
+            await process_time_period(date, available, zarr_writer, session)
     
     print("Stahování radarových dat bylo dokončeno.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Stažení radarových dat CHMI do S3")
+    parser.add_argument("--zarr", action="store_true",
+                        help="nově nahrané soubory přidá i do měsíčních Zarr kostek (radar_data/<YYYYMM>/<typ>.zarr)")
+    args = parser.parse_args()
+    asyncio.run(main(args.zarr))
\ No newline at end of file
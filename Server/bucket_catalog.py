@@ -0,0 +1,66 @@
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Catalog of all Zarr stores in the bucket, read by clients with a single GET
+BUCKET_CATALOG_KEY = "catalog.json"
+
+# Writers in one process (pipeline upload workers) update the catalog one at a time
+_catalog_lock = threading.Lock()
+
+
+def empty_catalog():
+    return {"version": 1, "updated": None, "stores": {}}
+
+
+def catalog_entry(store_key, variable, dims, sizes, chunks, times):
+    """
+    Catalog record of one store <prefix>/<YYYYMM>/<parameter>.zarr - what it
+    holds, where and for which times.
+    """
+    prefix, month, name = store_key.rsplit('/', 2)
+    times = np.sort(np.asarray(times, dtype="datetime64[ns]"))
+    return {
+        "prefix": prefix,
+        "month": month,
+        "parameter": name[:-len(".zarr")],
+        "variable": variable,
+        "dims": list(dims),
+        "shape": [int(sizes[dim]) for dim in dims],
+        "chunks": [int(chunks.get(dim) or sizes[dim]) for dim in dims],
+        "start": str(times[0]) if len(times) else None,
+        "end": str(times[-1]) if len(times) else None,
+        "n_times": int(len(times)),
+    }
+
+
+def load_bucket_catalog(fs, bucket_name):
+    """Catalog from the bucket, empty one if it does not exist yet or is corrupted."""
+    try:
+        with fs.open(f"{bucket_name}/{BUCKET_CATALOG_KEY}", "rb") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return empty_catalog()
+    except ValueError as e:
+        logger.warning(f"Bucket catalog {BUCKET_CATALOG_KEY} is corrupted, starting a new one: {e}")
+        return empty_catalog()
+
+
+def save_bucket_catalog(fs, bucket_name, catalog):
+    catalog["updated"] = datetime.now(timezone.utc).isoformat()
+    with fs.open(f"{bucket_name}/{BUCKET_CATALOG_KEY}", "wb") as file:
+        file.write(json.dumps(catalog, sort_keys=True).encode())
+
+
+def update_bucket_catalog(fs, bucket_name, entries):
+    """Read-modify-write of the bucket catalog with new {store key: entry} records."""
+    with _catalog_lock:
+        catalog = load_bucket_catalog(fs, bucket_name)
+        catalog["stores"].update(entries)
+        save_bucket_catalog(fs, bucket_name, catalog)
+    return catalog
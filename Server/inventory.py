@@ -0,0 +1,209 @@
+import argparse
+import json
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+import s3fs
+import zarr
+from botocore.config import Config
+
+from bucket_catalog import BUCKET_CATALOG_KEY, empty_catalog, save_bucket_catalog
+from store_stats import time_summary
+from virtual_dataset import rebuild_virtual_dataset
+from transfrom_s3 import decode_times, get_storage_options
+from config import aws_access_key_id, aws_secret_access_key, BUCKET_NAME, REGION
+
+logger = logging.getLogger(__name__)
+
+# Prefixes with monthly stores <prefix>/<YYYYMM>/<name>.zarr
+INVENTORY_PREFIXES = ["meteo_data", "radar_data"]
+# Number of concurrent S3 listings / store reads
+INVENTORY_WORKERS = 16
+INVENTORY_FILE = "inventory.json"
+
+
+def create_s3_client(max_connections=INVENTORY_WORKERS):
+    return boto3.client('s3',
+                        aws_access_key_id=aws_access_key_id,
+                        aws_secret_access_key=aws_secret_access_key,
+                        region_name=REGION,
+                        config=Config(max_pool_connections=max_connections))
+
+
+def list_months(s3_client, bucket, prefix):
+    """Month prefixes (<prefix>/<YYYYMM>/) - paginated, so nothing is cut off at 1000 keys."""
+    months = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/", Delimiter='/'):
+        months.extend(common_prefix['Prefix'] for common_prefix in page.get('CommonPrefixes', []))
+    return months
+
+
+def list_store_objects(s3_client, bucket, month_prefix):
+    """Object count and bytes of every <name>.zarr store under one month prefix."""
+    stores = defaultdict(lambda: {"objects": 0, "bytes": 0})
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=month_prefix):
+        for obj in page.get('Contents', []):
+            store_key, sep, _ = obj['Key'].partition('.zarr/')
+            if not sep:
+                continue
+            store = stores[f"{store_key}.zarr"]
+            store["objects"] += 1
+            store["bytes"] += obj['Size']
+    return dict(stores)
+
+
+def read_store_summary(fs, bucket, store_key):
+    """
+    Variables, shapes, chunks and time coverage of one store - reads only
+    .zmetadata and the `time` array.
+    """
+    group = zarr.open_consolidated(fs.get_mapper(f"{bucket}/{store_key}"), mode="r")
+    variables = {}
+    for name, array in group.arrays():
+        dims = array.attrs.get("_ARRAY_DIMENSIONS", [])
+        if len(dims) > 2 and dims[0] == "time":
+            variables[name] = {
+                "dims": dims,
+                "shape": list(array.shape),
+                "chunks": list(array.chunks),
+                "dtype": str(array.dtype),
+                "compressor": array.compressor.get_config() if array.compressor else None,
+            }
+    times = decode_times(group["time"]) if "time" in group else []
+    return {"variables": variables, "time": time_summary(times), "times": times}
+
+
+def build_inventory(bucket_name=BUCKET_NAME, prefixes=INVENTORY_PREFIXES, workers=INVENTORY_WORKERS):
+    """
+    Catalog of all monthly Zarr stores in the bucket - time coverage, gaps,
+    variables, object counts and sizes. Month prefixes are listed and the
+    stores are read concurrently.
+    """
+    started = time.perf_counter()
+    s3_client = create_s3_client(workers)
+    fs = s3fs.S3FileSystem(anon=False, **get_storage_options(REGION))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        month_prefixes = [month for months in executor.map(lambda p: list_months(s3_client, bucket_name, p), prefixes)
+                          for month in months]
+        objects = {}
+        for stores in executor.map(lambda m: list_store_objects(s3_client, bucket_name, m), month_prefixes):
+            objects.update(stores)
+
+        store_keys = sorted(objects)
+        futures = [executor.submit(read_store_summary, fs, bucket_name, store_key) for store_key in store_keys]
+        stores = []
+        times = {}
+        for store_key, future in zip(store_keys, futures):
+            prefix, month, name = store_key.rsplit('/', 2)
+            entry = {"key": store_key, "prefix": prefix, "month": month,
+                     "parameter": name[:-len(".zarr")], **objects[store_key]}
+            try:
+                summary = future.result()
+                times[store_key] = summary.pop("times")
+                entry.update(summary)
+            except Exception as e:
+                logger.error(f"Cannot read metadata of {store_key}: {e}")
+                entry["error"] = str(e)
+            stores.append(entry)
+
+    return {
+        "bucket": bucket_name,
+        "generated": datetime.now(timezone.utc).isoformat(),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "stores": stores,
+        # Time arrays in store order, not written to the JSON catalog
+        "times": times,
+    }
+
+
+def write_inventory(inventory, path=INVENTORY_FILE):
+    with open(path, 'w') as file:
+        json.dump({key: value for key, value in inventory.items() if key != "times"}, file, indent=1)
+
+
+def catalog_from_inventory(inventory):
+    """Bucket catalog (see bucket_catalog) rebuilt from a full inventory."""
+    catalog = empty_catalog()
+    for store in inventory["stores"]:
+        if "error" in store or not store.get("variables"):
+            continue
+        variable, info = next(iter(store["variables"].items()))
+        catalog["stores"][store["key"]] = {
+            "prefix": store["prefix"],
+            "month": store["month"],
+            "parameter": store["parameter"],
+            "variable": variable,
+            "dims": info["dims"],
+            "shape": info["shape"],
+            "chunks": info["chunks"],
+            "start": store["time"]["start"],
+            "end": store["time"]["end"],
+            "n_times": store["time"]["n_times"],
+        }
+    return catalog
+
+
+def rebuild_virtual_datasets(inventory, fs, prefix="meteo_data"):
+    """Reference files (virtual_dataset) of all parameters under `prefix` from an inventory."""
+    month_times = defaultdict(dict)
+    for store in inventory["stores"]:
+        if store["prefix"] == prefix and "error" not in store:
+            month_times[store["parameter"]][store["month"]] = inventory["times"][store["key"]]
+    return [rebuild_virtual_dataset(fs, inventory["bucket"], prefix, param_name, months)
+            for param_name, months in sorted(month_times.items())]
+
+
+def print_inventory(inventory):
+    """Human readable report by month and parameter."""
+    month = None
+    for store in inventory["stores"]:
+        if (store["prefix"], store["month"]) != month:
+            month = (store["prefix"], store["month"])
+            print(f"Month: {store['month']} ({store['prefix']})")
+        size = f"{store['objects']} objects, {store['bytes'] / 1024 ** 2:.1f} MiB"
+        if "error" in store:
+            print(f"  - {store['parameter']}: Error opening dataset: {store['error']} ({size})")
+            continue
+        coverage = store["time"]
+        print(f"  - {store['parameter']}: {coverage['n_days']} days, {coverage['n_times']} measurements, "
+              f"time range: {coverage['start']} to {coverage['end']} ({size})")
+        if coverage["n_gaps"]:
+            print(f"    * Warning: {coverage['n_gaps']} gaps longer than "
+                  f"{coverage['interval_s']} s detected: {coverage['gaps'][:5]}")
+    total_bytes = sum(store["bytes"] for store in inventory["stores"])
+    print(f"{len(inventory['stores'])} stores, {total_bytes / 1024 ** 3:.2f} GiB, "
+          f"inventory took {inventory['elapsed_s']} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inventory of Zarr stores in the S3 bucket")
+    parser.add_argument("--bucket", default=BUCKET_NAME)
+    parser.add_argument("--prefix", action="append", dest="prefixes",
+                        help=f"store prefix to scan (default: {', '.join(INVENTORY_PREFIXES)})")
+    parser.add_argument("--output", default=INVENTORY_FILE, help="JSON catalog output path")
+    parser.add_argument("--quiet", action="store_true", help="only write the JSON catalog")
+    parser.add_argument("--rebuild-catalog", action="store_true",
+                        help=f"replace the bucket catalog ({BUCKET_CATALOG_KEY}) with one built from this inventory")
+    parser.add_argument("--rebuild-virtual", action="store_true",
+                        help="regenerate the cross-month reference file of every meteo_data parameter")
+    args = parser.parse_args()
+
+    inventory = build_inventory(args.bucket, args.prefixes or INVENTORY_PREFIXES)
+    write_inventory(inventory, args.output)
+    fs = s3fs.S3FileSystem(anon=False, **get_storage_options(REGION))
+    if args.rebuild_catalog:
+        save_bucket_catalog(fs, args.bucket, catalog_from_inventory(inventory))
+        print(f"Bucket catalog {args.bucket}/{BUCKET_CATALOG_KEY} rebuilt")
+    if args.rebuild_virtual:
+        for path in rebuild_virtual_datasets(inventory, fs):
+            print(f"Virtual dataset {path} rebuilt")
+    if not args.quiet:
+        print_inventory(inventory)
+    print(f"Inventory written to {args.output}")
@@ -1,10 +1,32 @@
 from AladinDownloadLOC import downloadAladin
+import argparse
 import asyncio
 from GRB_to_netCDF import convertToNC
 from transfrom_s3 import process_files_by_month
+from pipeline import run_pipeline
 from config import DIR, BUCKET_NAME, REGION
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stažení ALADIN dat a uložení do S3 jako Zarr")
+    # Výchozí zůstává původní cesta přes NetCDF, dokud se direct neověří v provozu
+    parser.add_argument("--mode", choices=["direct", "netcdf"], default="netcdf",
+                        help="netcdf = GRIB -> NetCDF -> Zarr (výchozí), direct = GRIB rovnou do Zarr")
+    parser.add_argument("--export-netcdf", action="store_true",
+                        help="v režimu direct navíc uloží NetCDF kopie")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="stahování, převod a nahrávání běží souběžně (fronty mezi kroky)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-   if (asyncio.run(  downloadAladin())):
-        if(convertToNC()):
+   args = parse_args()
+   if args.pipeline:
+        asyncio.run(run_pipeline(args.mode, args.export_netcdf))
+   elif (asyncio.run(  downloadAladin())):
+        if args.mode == "direct":
+            # GRIB -> Zarr bez mezikroku přes NetCDF
+            process_files_by_month(DIR, BUCKET_NAME, REGION, extension='.grb')
+            if args.export_netcdf:
+                convertToNC()
+        # Nahrajeme vše, co se podařilo převést, i když některé soubory selhaly
+        elif any(convertToNC().values()):
             process_files_by_month(DIR, BUCKET_NAME, REGION)
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from AladinDownloadLOC import downloadAladin, download_dates, TIME_VALUES
+from GRB_to_netCDF import convert_file, MAX_WORKERS
+from transfrom_s3 import (StoreCatalog, STORE_CATALOG_FILE, extract_date_and_param,
+                          get_storage_options, write_parameter)
+from config import ALADIN_ATTRIBUTES, DIR, BUCKET_NAME, REGION
+
+logger = logging.getLogger(__name__)
+
+# Max number of items waiting between two stages
+QUEUE_SIZE = 16
+# Number of (month, parameter) groups written to S3 at once
+UPLOAD_WORKERS = 2
+# How often queue depths are logged while the pipeline runs (seconds)
+MONITOR_INTERVAL = 30
+
+
+class StageStats:
+    """Counters of one pipeline stage - processed items, busy time and queue depth."""
+
+    def __init__(self, name, queue=None):
+        self.name = name
+        self.queue = queue
+        self.items = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.max_depth = 0
+
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def took_item(self):
+        # Depth including the item just taken from the queue
+        self.max_depth = max(self.max_depth, self.depth() + 1)
+
+    def record(self, started, ok=True):
+        self.busy += time.perf_counter() - started
+        self.items += 1
+        self.failed += 0 if ok else 1
+
+    def as_dict(self):
+        return {
+            "items": self.items,
+            "failed": self.failed,
+            "busy_s": round(self.busy, 3),
+            "queue_depth": self.depth(),
+            "max_queue_depth": self.max_depth,
+        }
+
+
+def expected_group_sizes():
+    """Number of files the downloader produces for each (month, parameter)."""
+    expected = defaultdict(int)
+    for date in download_dates():
+        for attribute in ALADIN_ATTRIBUTES:
+            _, _, _, param_name = extract_date_and_param(
+                f"{date.strftime('%Y%m%d')}00_{ALADIN_ATTRIBUTES[attribute]}.grb")
+            expected[(date.strftime("%Y%m"), param_name)] += len(TIME_VALUES)
+    return expected
+
+
+async def convert_worker(convert_queue, upload_queue, groups, expected, stats,
+                         download_stats, executor, mode, export_netcdf):
+    """
+    Take downloaded files, convert them (in the process pool) and collect
+    them per (month, parameter). A group goes to upload as soon as all of
+    its files were processed.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await convert_queue.get()
+        if item is None:
+            return
+        stats.took_item()
+        started = time.perf_counter()
+
+        attribute, current_date, path = item
+        download_stats.items += 1
+        download_stats.failed += 0 if path else 1
+        year, month, date, param_name = extract_date_and_param(
+            f"{current_date}_{ALADIN_ATTRIBUTES[attribute]}.grb")
+        key = (f"{year}{month}", param_name)
+
+        output = path
+        if path and (mode == "netcdf" or export_netcdf):
+            nc_path = await loop.run_in_executor(executor, convert_file, path, DIR)
+            if mode == "netcdf":
+                output = nc_path
+        stats.record(started, ok=output is not None)
+
+        group = groups[key]
+        group["seen"] += 1
+        if output:
+            group["files"].append((output, date))
+        if group["seen"] >= expected.get(key, 0):
+            groups.pop(key)
+            if group["files"]:
+                await upload_queue.put((key, group["files"]))
+
+
+async def upload_worker(upload_queue, stats, catalog):
+    """Write complete (month, parameter) groups to their Zarr stores in S3."""
+    storage_options = get_storage_options(REGION)
+    while True:
+        item = await upload_queue.get()
+        if item is None:
+            return
+        stats.took_item()
+        started = time.perf_counter()
+
+        (month_key, param_name), files = item
+        ok = await asyncio.to_thread(write_parameter, BUCKET_NAME, month_key, param_name,
+                                     files, storage_options, REGION, catalog)
+        stats.record(started, ok=ok)
+
+
+async def monitor(stages):
+    while True:
+        await asyncio.sleep(MONITOR_INTERVAL)
+        logger.info("Pipeline queues: " + ", ".join(
+            f"{stage.name}={stage.depth()} ({stage.items} done)" for stage in stages))
+
+
+async def run_pipeline(mode="netcdf", export_netcdf=False, convert_workers=MAX_WORKERS,
+                       upload_workers=UPLOAD_WORKERS, queue_size=QUEUE_SIZE):
+    """
+    Run download -> convert -> upload as overlapping stages connected by
+    bounded queues, so each file is converted as soon as it lands and each
+    (month, parameter) store is written as soon as all its files are ready.
+
+    Returns per-stage statistics (items, failures, busy time, queue depth).
+    """
+    convert_workers = convert_workers or os.cpu_count() or 1
+    convert_queue = asyncio.Queue(maxsize=queue_size)
+    upload_queue = asyncio.Queue(maxsize=queue_size)
+
+    download_stats = StageStats("download")
+    convert_stats = StageStats("convert", convert_queue)
+    upload_stats = StageStats("upload", upload_queue)
+    stages = [download_stats, convert_stats, upload_stats]
+
+    groups = defaultdict(lambda: {"seen": 0, "files": []})
+    expected = expected_group_sizes()
+    catalog = StoreCatalog(get_storage_options(REGION), STORE_CATALOG_FILE)
+    started = time.perf_counter()
+    monitor_task = asyncio.create_task(monitor(stages))
+
+    try:
+        with ProcessPoolExecutor(max_workers=convert_workers) as executor:
+            converters = [asyncio.create_task(convert_worker(convert_queue, upload_queue, groups, expected,
+                                                             convert_stats, download_stats, executor,
+                                                             mode, export_netcdf))
+                          for _ in range(convert_workers)]
+            uploaders = [asyncio.create_task(upload_worker(upload_queue, upload_stats, catalog))
+                         for _ in range(upload_workers)]
+
+            # Download stage busy time is the wall time of the whole download
+            download_started = time.perf_counter()
+            await downloadAladin(file_queue=convert_queue)
+            download_stats.busy = time.perf_counter() - download_started
+
+            for _ in converters:
+                await convert_queue.put(None)
+            await asyncio.gather(*converters)
+
+        # Groups that did not receive all expected files (should not happen)
+        for key, group in groups.items():
+            if group["files"]:
+                await upload_queue.put((key, group["files"]))
+        for _ in uploaders:
+            await upload_queue.put(None)
+        await asyncio.gather(*uploaders)
+    finally:
+        monitor_task.cancel()
+
+    elapsed = time.perf_counter() - started
+    result = {stage.name: stage.as_dict() for stage in stages}
+    result["total_s"] = round(elapsed, 3)
+    for stage in stages:
+        logger.info(f"Stage {stage.name}: {stage.as_dict()}")
+    logger.info(f"Pipeline finished in {elapsed:.1f} s "
+                f"(sum of stage busy time {sum(stage.busy for stage in stages):.1f} s)")
+    return result
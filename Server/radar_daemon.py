@@ -0,0 +1,247 @@
+import aiohttp
+import asyncio
+import io
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from HDFDownloadAWS import (
+    RADAR_TYPES,
+    discover_radar_files,
+    radar_s3_key,
+    upload_file_to_s3_async
+)
+from config import BUCKET_NAME
+
+# Jak často se kontrolují nové kompozity (sekundy)
+POLL_INTERVAL = 120
+# Horní mez prodlevy při opakovaných chybách (sekundy)
+MAX_BACKOFF = 900
+# Maximální počet souborů, které se současně stahují / nahrávají
+MAX_IN_FLIGHT = 10
+# Bez uloženého stavu se při startu dohání jen tato doba
+INITIAL_LOOKBACK = timedelta(hours=3)
+# Po tolika neúspěšných kolech se soubor vzdá, aby nedržel high-water mark
+MAX_ATTEMPTS = 5
+# Stav pro každý typ radaru - high-water mark, nahrané soubory za ním, počty pokusů
+# a statistika zpoždění zveřejnění -> S3 (pro monitoring)
+STATE_FILE = "radar_state.json"
+
+
+class LagStats:
+    """Počítadlo zpoždění mezi zveřejněním souboru na CHMI a jeho nahráním do S3"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = None
+        self.max = 0.0
+
+    def add(self, lag_seconds):
+        self.count += 1
+        self.total += lag_seconds
+        self.last = lag_seconds
+        self.max = max(self.max, lag_seconds)
+
+    def as_dict(self):
+        return {
+            "uploaded": self.count,
+            "last_lag_s": round(self.last, 1) if self.last is not None else None,
+            "mean_lag_s": round(self.total / self.count, 1) if self.count else None,
+            "max_lag_s": round(self.max, 1),
+        }
+
+    @classmethod
+    def from_dict(cls, value):
+        """Obnoví počítadlo z as_dict() uloženého ve stavu"""
+        stats = cls()
+        stats.count = int(value.get("uploaded", 0))
+        stats.total = (value.get("mean_lag_s") or 0.0) * stats.count
+        stats.last = value.get("last_lag_s")
+        stats.max = value.get("max_lag_s") or 0.0
+        return stats
+
+
+def new_entry(high_water):
+    """
+    Stav jednoho typu radaru - high-water mark, hotové časy za ním, počty
+    neúspěšných pokusů a zpoždění nahrávání (LagStats)
+    """
+    return {"high_water": high_water, "done": set(), "attempts": {}, "lag": LagStats()}
+
+
+def load_state(path=STATE_FILE):
+    """
+    Načte stav pro každý typ radaru {název: new_entry(...)}. Starší stav
+    {název: čas} (jen high-water mark) se převede.
+    """
+    try:
+        with open(path) as file:
+            raw = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"Stav {path} je poškozený, začínám znovu: {e}")
+        return {}
+
+    state = {}
+    try:
+        for name, value in raw.items():
+            if isinstance(value, str):
+                state[name] = new_entry(datetime.fromisoformat(value))
+                continue
+            entry = new_entry(datetime.fromisoformat(value["high_water"]))
+            entry["done"] = {datetime.fromisoformat(t) for t in value.get("done", [])}
+            entry["attempts"] = {datetime.fromisoformat(t): n for t, n in value.get("attempts", {}).items()}
+            entry["lag"] = LagStats.from_dict(value.get("lag", {}))
+            state[name] = entry
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Stav {path} je poškozený, začínám znovu: {e}")
+        return {}
+    return state
+
+
+def save_state(state, path=STATE_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump({name: {"high_water": entry["high_water"].isoformat(),
+                          "done": sorted(t.isoformat() for t in entry["done"]),
+                          "attempts": {t.isoformat(): n for t, n in sorted(entry["attempts"].items())},
+                          "lag": entry["lag"].as_dict()}
+                   for name, entry in state.items()}, file)
+    os.replace(tmp_path, path)
+
+
+def advance_high_water(entry, available):
+    """
+    Posune high-water mark za poslední souvislý úsek hotových časů ve výpisu
+    a zapomene hotové časy a pokusy, které jsou už za ním.
+    """
+    for timestamp in sorted(t for t in available if t > entry["high_water"]):
+        if timestamp not in entry["done"]:
+            break
+        entry["high_water"] = timestamp
+    entry["done"] = {t for t in entry["done"] if t > entry["high_water"]}
+    entry["attempts"] = {t: n for t, n in entry["attempts"].items() if t > entry["high_water"]}
+
+
+def next_delay(failures, poll_interval=POLL_INTERVAL):
+    """Čas do dalšího dotazu - exponenciální backoff při chybách, vždy s náhodným rozptylem"""
+    delay = poll_interval if failures == 0 else min(MAX_BACKOFF, poll_interval * 2 ** failures)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def published_time(last_modified):
+    """Čas zveřejnění (UTC) z hlavičky Last-Modified, None pokud chybí nebo je neplatná"""
+    if not last_modified:
+        return None
+    try:
+        published = parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError, IndexError):
+        print(f"Neplatná hlavička Last-Modified: {last_modified!r}")
+        return None
+    # Bez časové zóny (-0000) je čas v UTC
+    return published if published.tzinfo else published.replace(tzinfo=timezone.utc)
+
+
+async def fetch_with_published(session, url):
+    """Stáhne soubor, vrátí (data, čas zveřejnění z Last-Modified nebo None)"""
+    async with session.get(url) as response:
+        if response.status != 200:
+            print(f"Nepodařilo se stáhnout data z {url}, status kód: {response.status}")
+            return None, None
+        data = await response.read()
+        return data, published_time(response.headers.get("Last-Modified"))
+
+
+async def ingest_file(session, in_flight, timestamp, filename, radar_type, lag_stats):
+    """Stáhne a nahraje jeden kompozit (název z výpisu adresáře), vrátí True při úspěchu"""
+    async with in_flight:
+        url = f"{radar_type['base_url']}{filename}"
+        try:
+            data, published = await fetch_with_published(session, url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Chyba při stahování dat z {url}: {e}")
+            return False
+        if not data:
+            return False
+        if not await upload_file_to_s3_async(io.BytesIO(data), BUCKET_NAME,
+                                            radar_s3_key(timestamp, radar_type, filename)):
+            return False
+
+    # Bez Last-Modified počítáme zpoždění od nominálního času kompozitu (UTC)
+    published = published or timestamp.replace(tzinfo=timezone.utc)
+    lag_stats.add((datetime.now(timezone.utc) - published).total_seconds())
+    return True
+
+
+async def poll_once(session, state, in_flight):
+    """
+    Jedno kolo - pro každý typ radaru najde soubory novější než high-water
+    mark, které ještě nejsou nahrané, a nahraje je. Nahrané soubory se
+    zapamatují (v dalším kole se nestahují znovu), neúspěšné se zkusí znovu
+    a po MAX_ATTEMPTS kolech se vzdají. High-water mark se posune za poslední
+    souvislý úsek hotových souborů. Zpoždění nahrání se počítá do stavu
+    každého typu (entry["lag"]) a ukládá se s ním.
+    """
+    uploaded = 0
+    for radar_type in RADAR_TYPES:
+        available = await discover_radar_files(radar_type, session)
+        if available is None:
+            raise RuntimeError(f"Výpis adresáře {radar_type['base_url']} se nepodařilo načíst")
+
+        name = radar_type['name']
+        if name not in state:
+            state[name] = new_entry(datetime.now(timezone.utc).replace(tzinfo=None) - INITIAL_LOOKBACK)
+        entry = state[name]
+        new_timestamps = sorted(t for t in available if t > entry["high_water"] and t not in entry["done"])
+        if not new_timestamps:
+            continue
+
+        results = await asyncio.gather(*[ingest_file(session, in_flight, timestamp, available[timestamp],
+                                                     radar_type, entry["lag"])
+                                         for timestamp in new_timestamps])
+        uploaded += sum(results)
+
+        for timestamp, ok in zip(new_timestamps, results):
+            if ok:
+                entry["done"].add(timestamp)
+                entry["attempts"].pop(timestamp, None)
+                continue
+            entry["attempts"][timestamp] = entry["attempts"].get(timestamp, 0) + 1
+            if entry["attempts"][timestamp] >= MAX_ATTEMPTS:
+                print(f"Soubor {available[timestamp]} se nepodařilo nahrát ani na {MAX_ATTEMPTS}. pokus, vzdávám ho")
+                entry["done"].add(timestamp)
+        advance_high_water(entry, available)
+        save_state(state)
+    return uploaded
+
+
+async def run_daemon(poll_interval=POLL_INTERVAL, max_in_flight=MAX_IN_FLIGHT):
+    """
+    Průběžně nahrává nové radarové kompozity do S3 - každých `poll_interval`
+    sekund (s rozptylem) zkontroluje výpisy adresářů a nahraje nové soubory.
+    """
+    state = load_state()
+    in_flight = asyncio.Semaphore(max_in_flight)
+    failures = 0
+
+    async with aiohttp.ClientSession() as session:
+        while True:
+            started = time.perf_counter()
+            try:
+                uploaded = await poll_once(session, state, in_flight)
+                failures = 0
+                lags = {name: entry["lag"].as_dict() for name, entry in state.items()}
+                print(f"Nahráno {uploaded} nových souborů za {time.perf_counter() - started:.1f} s, "
+                      f"zpoždění zveřejnění -> S3: {lags}")
+            except Exception as e:
+                failures += 1
+                print(f"Chyba při kontrole nových dat ({failures}. v řadě): {e}")
+            await asyncio.sleep(next_delay(failures, poll_interval))
+
+
+if __name__ == "__main__":
+    asyncio.run(run_daemon())
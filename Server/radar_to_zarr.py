@@ -0,0 +1,218 @@
+import io
+import logging
+import threading
+from collections import defaultdict
+
+import h5py
+import numpy as np
+import xarray as xr
+
+from bucket_catalog import catalog_entry, update_bucket_catalog
+from transfrom_s3 import (
+    StoreCatalog,
+    aligned_time_chunks,
+    chunk_encoding,
+    new_times_mask,
+    resolve_chunks
+)
+
+logger = logging.getLogger(__name__)
+
+# Radar cubes use the same layout as the Aladin stores: <prefix>/<YYYYMM>/<type>.zarr
+RADAR_ZARR_PREFIX = "radar_data"
+# One hour of 5-minute composites per chunk, 256x256 spatial tiles
+RADAR_CHUNKS = {"time": 12, "y": 256, "x": 256}
+RADAR_COMPRESSOR = {"cname": "zstd", "clevel": 3}
+# Number of composites of one type buffered before they are appended
+RADAR_BATCH_SIZE = 48
+
+
+def read_odim_composite(data):
+    """
+    Decode one ODIM HDF5 composite (bytes) to a float32 grid.
+    `nodata` pixels become NaN; returns (values, attributes).
+    """
+    with h5py.File(io.BytesIO(data), "r") as file:
+        what = file["dataset1/data1/what"].attrs
+        raw = file["dataset1/data1/data"][()]
+        attrs = {key: _attr_value(value) for key, value in file["where"].attrs.items()}
+        attrs["quantity"] = _attr_value(what.get("quantity", b""))
+
+        gain = float(what.get("gain", 1.0))
+        offset = float(what.get("offset", 0.0))
+        values = (raw * gain + offset).astype("float32")
+        if "nodata" in what:
+            values[raw == what["nodata"]] = np.nan
+    return values, attrs
+
+
+def _attr_value(value):
+    """HDF5 attributes as plain JSON-friendly python values"""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    return value
+
+
+def composites_to_dataset(radar_name, composites):
+    """Stack [(timestamp, values, attrs)] of one grid size into a (time, y, x) dataset."""
+    composites = sorted(composites, key=lambda c: c[0])
+    shape = composites[0][1].shape
+    same_grid = [c for c in composites if c[1].shape == shape]
+    if len(same_grid) != len(composites):
+        logger.error(f"Skipping {len(composites) - len(same_grid)} {radar_name} composites with a different grid")
+
+    times = np.array([c[0] for c in same_grid], dtype="datetime64[ns]")
+    ds = xr.Dataset(
+        {radar_name: (("time", "y", "x"), np.stack([c[1] for c in same_grid]))},
+        coords={"time": times, "y": np.arange(shape[0]), "x": np.arange(shape[1])},
+    )
+    ds[radar_name].attrs["quantity"] = same_grid[0][2].get("quantity", "")
+    ds.attrs.update({key: value for key, value in same_grid[0][2].items() if key != "quantity"})
+    return ds
+
+
+class RadarZarrWriter:
+    """
+    Optional conversion stage of HDFDownloadAWS - appends decoded composites
+    to monthly chunked Zarr cubes <RADAR_ZARR_PREFIX>/<YYYYMM>/<type>.zarr.
+
+    `add` is called from worker threads; composites are buffered per type
+    and appended every `batch_size` files, `flush` writes the rest.
+    """
+
+    def __init__(self, bucket_name, storage_options, batch_size=RADAR_BATCH_SIZE):
+        self.bucket_name = bucket_name
+        self.storage_options = storage_options
+        self.batch_size = batch_size
+        self.catalog = StoreCatalog(storage_options)
+        self.buffers = defaultdict(list)
+        self.lock = threading.Lock()
+        self.write_locks = defaultdict(threading.Lock)
+
+    def add(self, radar_name, timestamp, data):
+        values, attrs = read_odim_composite(data)
+        batch = None
+        with self.lock:
+            self.buffers[radar_name].append((timestamp, values, attrs))
+            if len(self.buffers[radar_name]) >= self.batch_size:
+                batch = self.buffers.pop(radar_name)
+        if batch:
+            self.write(radar_name, batch)
+
+    def flush(self):
+        with self.lock:
+            buffers = dict(self.buffers)
+            self.buffers.clear()
+        for radar_name, batch in buffers.items():
+            if batch:
+                self.write(radar_name, batch)
+
+    def store_uri(self, radar_name, month):
+        return f"s3://{self.bucket_name}/{RADAR_ZARR_PREFIX}/{month}/{radar_name}.zarr"
+
+    def missing(self, radar_name, timestamps):
+        """
+        Timestamps (datetime) that are not in the monthly cubes of `radar_name` -
+        raw files uploaded earlier whose conversion failed or never ran.
+        """
+        by_month = defaultdict(list)
+        for timestamp in timestamps:
+            by_month[timestamp.strftime("%Y%m")].append(timestamp)
+
+        missing = []
+        for month, month_times in sorted(by_month.items()):
+            existing_times = self.catalog.times(self.store_uri(radar_name, month))
+            if existing_times is None:
+                missing.extend(month_times)
+                continue
+            mask = new_times_mask(np.array(month_times, dtype="datetime64[ns]"), existing_times)
+            missing.extend(timestamp for timestamp, new in zip(month_times, mask) if new)
+        return missing
+
+    def write(self, radar_name, composites):
+        """Write composites to the monthly cubes in time order, skipping times already stored."""
+        ds = composites_to_dataset(radar_name, composites)
+        months = ds.time.dt.strftime("%Y%m").values
+
+        with self.write_locks[radar_name]:
+            for month in sorted(set(months)):
+                s3_uri = self.store_uri(radar_name, month)
+                month_ds = ds.isel(time=np.flatnonzero(months == month))
+
+                existing_times = self.catalog.times(s3_uri)
+                if existing_times is not None:
+                    month_ds = month_ds.isel(time=np.flatnonzero(
+                        new_times_mask(month_ds.time.values, existing_times)))
+                    if len(month_ds.time) == 0:
+                        continue
+                    chunks = self.catalog.store_chunks(s3_uri)
+                    existing_len = len(existing_times)
+                else:
+                    chunks = dict(resolve_chunks(month_ds[radar_name], RADAR_CHUNKS), time=RADAR_CHUNKS["time"])
+                    existing_len = 0
+
+                time_chunk = chunks.get("time") or RADAR_CHUNKS["time"]
+                if existing_times is None:
+                    month_ds = month_ds.chunk(dict(chunks, time=aligned_time_chunks(0, len(month_ds.time), time_chunk)))
+                    month_ds.to_zarr(s3_uri, mode="w-", storage_options=self.storage_options, consolidated=True,
+                                     encoding=chunk_encoding(month_ds, chunks, RADAR_COMPRESSOR))
+                elif month_ds.time.values[0] > existing_times[-1]:
+                    month_ds = month_ds.chunk(dict(chunks, time=aligned_time_chunks(
+                        existing_len, len(month_ds.time), time_chunk)))
+                    month_ds.to_zarr(s3_uri, mode="a", append_dim="time",
+                                     storage_options=self.storage_options, consolidated=True)
+                else:
+                    # Earlier than the end of the cube (download order, backfill) - keep time sorted
+                    self.insert(radar_name, s3_uri, month_ds, chunks, time_chunk)
+                self.catalog.add_times(s3_uri, month_ds.time.values, dict(chunks, time=time_chunk))
+                store_key = s3_uri[len(f"s3://{self.bucket_name}/"):]
+                store_times = self.catalog.times(s3_uri)
+                variable = month_ds[radar_name]
+                try:
+                    update_bucket_catalog(self.catalog.fs, self.bucket_name, {store_key: catalog_entry(
+                        store_key, radar_name, variable.dims, dict(variable.sizes, time=len(store_times)),
+                        dict(chunks, time=time_chunk), store_times)})
+                except Exception as e:
+                    logger.error(f"Failed to update bucket catalog for {s3_uri}: {e}")
+                logger.info(f"Wrote {len(month_ds.time)} {radar_name} composites to {s3_uri}")
+
+    def insert(self, radar_name, s3_uri, month_ds, chunks, time_chunk):
+        """
+        Write composites that are not all later than the cube's last time.
+
+        The cube is rewritten from the time chunk holding the first new
+        composite (or from where an older unsorted cube stops being sorted):
+        that tail is read, merged with `month_ds` and sorted, the part
+        beyond the current end is appended first and then the whole merged
+        tail is written back with a region write. The data is never removed
+        from the cube in between, an interrupted insert at worst leaves
+        duplicated times for the next run to repair.
+        """
+        stored = xr.open_zarr(s3_uri, storage_options=self.storage_options, consolidated=True)
+        stored_times = stored.time.values
+        stored_len = len(stored_times)
+        breaks = np.flatnonzero(np.diff(stored_times) <= np.timedelta64(0))
+        sorted_len = int(breaks[0]) + 1 if len(breaks) else stored_len
+        start = min(int(np.searchsorted(stored_times[:sorted_len], month_ds.time.values[0])), sorted_len)
+        start -= start % time_chunk
+
+        tail = stored[[radar_name]].isel(time=slice(start, None)).load()
+        merged = xr.concat([tail, month_ds[[radar_name]].load()], dim="time").sortby("time")
+        for variable in merged.variables.values():
+            variable.encoding = {}
+
+        appended = merged.isel(time=slice(stored_len - start, None))
+        appended.chunk(dict(chunks, time=aligned_time_chunks(stored_len, len(appended.time), time_chunk))).to_zarr(
+            s3_uri, mode="a", append_dim="time", storage_options=self.storage_options, consolidated=True)
+        # The region ends at the new end of the cube, so it stays aligned to whole chunks.
+        # xarray leaves indexed coordinates out of region writes - time goes without its index
+        # and unchunked (the time array has its own chunks)
+        variable = merged[radar_name].variable.chunk(
+            dict(chunks, time=aligned_time_chunks(start, len(merged.time), time_chunk)))
+        region = xr.Dataset({radar_name: variable}, coords={"time": merged.time.variable}).drop_indexes("time")
+        region.to_zarr(s3_uri, region={"time": slice(start, start + len(merged.time))},
+                       storage_options=self.storage_options)
+        logger.info(f"Rewrote {len(region.time)} {radar_name} composites of {s3_uri} to insert "
+                    f"{len(month_ds.time)} earlier ones")
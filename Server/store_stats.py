@@ -0,0 +1,134 @@
+import itertools
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Side object with summary statistics, stored inside each Zarr store next to .zmetadata
+STATS_KEY = ".zstats"
+# Max number of time gaps listed in the summary (the count is always complete)
+MAX_LISTED_GAPS = 100
+
+
+def compute_chunk_stats(values, dims, chunks, time_offset):
+    """
+    min/max/sum/count of non-NaN values for every Zarr chunk touched by
+    `values` (numpy array with `dims`), written at `time_offset` of a store
+    chunked by `chunks` {dim: size}.
+
+    Returns {chunk key "t.s.y.x": [min, max, sum, count]}. A chunk only
+    partly covered by `values` gets partial stats, see merge_chunk_stats.
+    """
+    time_axis = dims.index("time")
+    time_chunk = chunks["time"]
+    ranges = []
+    for axis, dim in enumerate(dims):
+        size = values.shape[axis]
+        if axis == time_axis:
+            # Boundaries of the store's chunk grid, shifted by the append offset
+            bounds = sorted({0, size} | {b - time_offset for b in range(0, time_offset + size, time_chunk)
+                                          if 0 < b - time_offset < size})
+            ranges.append([(lo, hi, (time_offset + lo) // time_chunk) for lo, hi in zip(bounds, bounds[1:])])
+        else:
+            step = chunks.get(dim) or size
+            ranges.append([(lo, min(lo + step, size), lo // step) for lo in range(0, size, step)])
+
+    stats = {}
+    for block in itertools.product(*ranges):
+        data = values[tuple(slice(lo, hi) for lo, hi, _ in block)]
+        valid = data[~np.isnan(data)] if np.issubdtype(data.dtype, np.floating) else data.ravel()
+        key = ".".join(str(index) for _, _, index in block)
+        if valid.size:
+            stats[key] = [float(valid.min()), float(valid.max()), float(valid.sum(dtype="float64")), int(valid.size)]
+        else:
+            stats[key] = [None, None, 0.0, 0]
+    return stats
+
+
+def merge_chunk_stats(stats, new_stats):
+    """Merge `new_stats` into `stats` in place (a chunk can be filled by two appends)."""
+    for key, (new_min, new_max, new_sum, new_count) in new_stats.items():
+        if key not in stats or not stats[key][3]:
+            stats[key] = [new_min, new_max, new_sum, new_count]
+        elif new_count:
+            old_min, old_max, old_sum, old_count = stats[key]
+            stats[key] = [min(old_min, new_min), max(old_max, new_max), old_sum + new_sum, old_count + new_count]
+    return stats
+
+
+def variable_summary(chunk_stats):
+    """Variable-wide min/max/mean/count from the per-chunk stats."""
+    filled = [s for s in chunk_stats.values() if s[3]]
+    count = sum(s[3] for s in filled)
+    if not count:
+        return {"min": None, "max": None, "mean": None, "count": 0}
+    return {
+        "min": min(s[0] for s in filled),
+        "max": max(s[1] for s in filled),
+        "mean": sum(s[2] for s in filled) / count,
+        "count": count,
+    }
+
+
+def time_summary(times):
+    """Coverage of a sorted datetime64 time array - range, days, usual interval and gaps."""
+    times = np.sort(np.asarray(times, dtype="datetime64[ns]"))
+    if len(times) == 0:
+        return {"start": None, "end": None, "n_times": 0, "n_days": 0,
+                "interval_s": None, "n_gaps": 0, "gaps": []}
+    diffs = np.diff(times).astype("timedelta64[s]").astype("int64")
+    interval = None
+    if len(diffs):
+        values, counts = np.unique(diffs, return_counts=True)
+        interval = int(values[counts.argmax()])
+    gap_idx = np.flatnonzero(diffs > interval) if interval else np.array([], dtype=int)
+    return {
+        "start": str(times[0]),
+        "end": str(times[-1]),
+        "n_times": int(len(times)),
+        "n_days": int(len(np.unique(times.astype("datetime64[D]")))),
+        "interval_s": interval,
+        "n_gaps": int(len(gap_idx)),
+        "gaps": [[str(times[i]), str(times[i + 1])] for i in gap_idx[:MAX_LISTED_GAPS]],
+    }
+
+
+def read_store_stats(fs, s3_uri):
+    """Statistics of one store (dict), None if it has none yet."""
+    try:
+        with fs.open(f"{s3_uri}/{STATS_KEY}", "rb") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.warning(f"Statistics {s3_uri}/{STATS_KEY} are corrupted, rebuilding them: {e}")
+        return None
+
+
+def update_store_stats(fs, s3_uri, variable, new_chunk_stats, times, chunks, had_data=False, missed=False):
+    """
+    Merge stats of freshly appended chunks into the store's STATS_KEY
+    object and recompute the variable and time summaries.
+
+    `had_data` - the store held data before this append; if it had no
+    statistics yet, they are marked "partial" (older chunks are not covered).
+    `missed` - some chunks were written without their statistics (run
+    interrupted before this update), also marks them "partial".
+    """
+    stats = read_store_stats(fs, s3_uri)
+    partial = (stats.get("partial", False) if stats else had_data) or missed
+    stats = stats or {}
+    chunk_stats = merge_chunk_stats(stats.get("chunk_stats", {}), new_chunk_stats)
+    stats = {
+        "variable": variable,
+        "partial": partial,
+        "chunks": {dim: int(size) for dim, size in chunks.items()},
+        "summary": variable_summary(chunk_stats),
+        "time": time_summary(times),
+        "chunk_stats": chunk_stats,
+    }
+    with fs.open(f"{s3_uri}/{STATS_KEY}", "wb") as file:
+        file.write(json.dumps(stats).encode())
+    return stats
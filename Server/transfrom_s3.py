@@ -1,10 +1,18 @@
 import xarray as xr
+import numpy as np
 import os
 import re
-import boto3
 import s3fs
+import zarr
+from numcodecs import Blosc
+import json
+import threading
 from datetime import datetime
 import logging
+from bucket_catalog import catalog_entry, update_bucket_catalog
+from virtual_dataset import update_virtual_dataset
+from store_stats import compute_chunk_stats, merge_chunk_stats, update_store_stats
+from valid_index import write_valid_index
 from config import aws_access_key_id, aws_secret_access_key, BUCKET_NAME, DIR, REGION
 
 # Set up logging
@@ -12,6 +20,41 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Local copy of the store catalog (existing Zarr stores and their times)
+STORE_CATALOG_FILE = os.path.join(DIR, "store_catalog.json")
+
+# Chunk sizes of new Zarr stores
+TIME_CHUNK = 5
+STEP_CHUNK = 20
+
+# Write profiles - chunk sizes and Blosc codec of new Zarr stores.
+# "y" and "x" are the two spatial dimensions (last two dims of the variable),
+# missing dimension = whole dimension in one chunk, compressor None = zarr default.
+WRITE_PROFILES = {
+    # Original layout - whole grid in a chunk, medium blocks over time and step
+    "default": {"chunks": {"time": TIME_CHUNK, "step": STEP_CHUNK}, "compressor": None},
+    # Time series at a point / small area - long in time, small spatial tiles
+    "timeseries": {"chunks": {"time": 20, "step": 72, "y": 64, "x": 64},
+                   "compressor": {"cname": "zstd", "clevel": 3}},
+    # Map at one timestep - whole grid, one run and a few steps per chunk
+    "map": {"chunks": {"time": 1, "step": 6},
+            "compressor": {"cname": "lz4", "clevel": 5}},
+}
+
+# Profile used for each parameter, others use "default"
+PARAMETER_PROFILES = {
+    "CLSTEMPERATURE": "timeseries",
+    "CLSHUMI_RELATIVE": "timeseries",
+    "MSLPRESSURE": "timeseries",
+    "CLSWIND_SPEED": "timeseries",
+    "CLSWIND_DIREC": "timeseries",
+    "SURFPREC_TOTAL": "map",
+    "SURFNEBUL_TOTALE": "map",
+    "MAXSIM_REFLECTI": "map",
+}
+# Max estimated size of data loaded for one append to Zarr (bytes)
+WRITE_MEMORY_BUDGET = 512 * 1024 * 1024
+
 def list_files_in_directory(directory_path, extension=None):
     """List all files in a directory with a specific extension."""
     file_paths = []
@@ -49,25 +92,507 @@ def extract_date_and_param(filename):
         return year, month, date, param_name
     return None, None, None, None
 
-# Funkce pro kontrolu existence pomocí boto3
-def check_exists_boto3(bucket, prefix,REGION):
-    """Kontroluje existenci objektu/prefixu pomocí boto3 místo s3fs"""
-    s3_client = boto3.client('s3',
-                           region_name=REGION,
-                           aws_access_key_id=aws_access_key_id,
-                           aws_secret_access_key=aws_secret_access_key)
-    response = s3_client.list_objects_v2(
-        Bucket=bucket,
-        Prefix=prefix,
-        MaxKeys=1
-    )
-    return 'Contents' in response and len(response['Contents']) > 0
-
-def process_files_by_month(dir_path, bucket_name, REGION):
-    """Process files by month and parameter and save to S3 bucket."""
-    # List NetCDF files
-    nc_files = list_files_in_directory(dir_path, '.nc')
-    logger.info(f"Found {len(nc_files)} NetCDF files to process")
+def decode_times(time_array):
+    """Decode CF-encoded zarr `time` (or `step`) array to datetime64 (timedelta64) values."""
+    attrs = {k: v for k, v in time_array.attrs.items() if k != "_ARRAY_DIMENSIONS"}
+    raw = xr.Dataset(coords={"time": ("time", time_array[:], attrs)})
+    return xr.decode_cf(raw).time.values
+
+def read_store_times(s3_uri, storage_options):
+    """
+    Read only the decoded `time` coordinate of an existing Zarr store,
+    without opening the whole dataset.
+    """
+    mapper = s3fs.S3FileSystem(anon=False, **storage_options).get_mapper(s3_uri)
+    return decode_times(zarr.open_consolidated(mapper, mode="r")["time"])
+
+def new_times_mask(new_times, existing_times):
+    """
+    Boolean mask of `new_times` that are not in `existing_times`.
+    Uses binary search over sorted times instead of a Python scan per timestamp.
+    """
+    new_times = np.asarray(new_times, dtype="datetime64[ns]")
+    existing_times = np.sort(np.asarray(existing_times, dtype="datetime64[ns]"))
+    if len(existing_times) == 0:
+        return np.ones(len(new_times), dtype=bool)
+    idx = np.searchsorted(existing_times, new_times)
+    found = existing_times[np.minimum(idx, len(existing_times) - 1)] == new_times
+    return ~found
+
+class StoreCatalog:
+    """
+    In-process record of Zarr stores in S3 - whether they exist and which
+    times they hold.
+
+    Each store is refreshed from S3 at most once per run - from .zgroup and
+    time/.zarray, not from .zmetadata, which is only consolidated after the
+    last batch; the time array itself is only read when its length differs
+    from the cached one. Later batches are answered from memory and kept up
+    to date by `add_times` after each successful write.
+    If `path` is given, the catalog is persisted to that local JSON file.
+    """
+
+    def __init__(self, storage_options, path=None):
+        self.fs = s3fs.S3FileSystem(anon=False, **storage_options)
+        self.path = path
+        self.stores = {}
+        self.chunks = {}
+        self.refreshed = set()
+        # Stores whose .zmetadata does not match their arrays (interrupted run)
+        self.stale = set()
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as file:
+                    for s3_uri, times in json.load(file).items():
+                        self.stores[s3_uri] = np.array(times, dtype="datetime64[ns]")
+            except ValueError as e:
+                logger.warning(f"Store catalog {path} is corrupted, ignoring it: {e}")
+
+    def forget_listings(self, s3_uri):
+        """
+        Drop cached directory listings of the store and everything below it.
+        The s3fs instance is shared with writers that may use another instance
+        (xarray's to_zarr), so a cached listing of e.g. time/ can miss new chunks.
+        """
+        path = self.fs._strip_protocol(s3_uri)
+        for key in [key for key in self.fs.dircache if key.startswith(f"{path}/")]:
+            self.fs.dircache.pop(key, None)
+        self.fs.invalidate_cache(path)
+
+    def refresh(self, s3_uri):
+        """
+        Re-read existence and times of one store from S3.
+
+        A prefix without a Zarr group but with some objects (interrupted
+        first write, foreign data) raises ValueError - it is never reported
+        as a missing store, which would be created (overwritten) again.
+        So does a time array with missing chunks (append interrupted between
+        resizing the array and writing it), whose values cannot be trusted.
+        A store whose .zmetadata is missing or older than its time array is
+        recorded as stale, see `needs_consolidation`.
+        """
+        self.forget_listings(s3_uri)
+        try:
+            group = zarr.open_group(self.fs.get_mapper(s3_uri), mode="r")
+            time_array = group["time"]
+        except (KeyError, FileNotFoundError, zarr.errors.GroupNotFoundError):
+            if self.fs.exists(s3_uri):
+                raise ValueError(f"{s3_uri} has objects but no readable Zarr group with time, not touching it")
+            times = None
+        else:
+            if time_array.nchunks_initialized < time_array.nchunks:
+                raise ValueError(f"{s3_uri}: time array has {time_array.nchunks - time_array.nchunks_initialized} "
+                                 f"missing chunks (interrupted append), repair the store first")
+            try:
+                consolidated = json.loads(self.fs.cat_file(f"{s3_uri}/.zmetadata"))["metadata"]
+                stale = consolidated["time/.zarray"]["shape"] != list(time_array.shape)
+            except (FileNotFoundError, ValueError, KeyError):
+                consolidated = None
+                stale = True
+            if stale:
+                logger.warning(f"Consolidated metadata of {s3_uri} is out of date (interrupted run?)")
+            # Chunks of data variables (the time coordinate is chunked differently).
+            # Chunks are fixed at creation, so even out of date .zmetadata has them and
+            # the group is only listed (a HEAD and LIST per key) when it is missing.
+            if consolidated is not None:
+                layouts = [(consolidated.get(f"{key.rsplit('/', 1)[0]}/.zattrs", {}).get("_ARRAY_DIMENSIONS", []),
+                            meta["chunks"])
+                           for key, meta in consolidated.items() if key.endswith("/.zarray")]
+            else:
+                layouts = [(array.attrs.get("_ARRAY_DIMENSIONS", []), array.chunks) for _, array in group.arrays()]
+            for dims, chunks in layouts:
+                if len(dims) > 2 and dims[0] == "time":
+                    self.chunks[s3_uri] = dict(zip(dims, chunks))
+                    break
+            cached = self.stores.get(s3_uri)
+            if cached is not None and len(cached) == time_array.shape[0]:
+                times = cached
+            else:
+                times = np.sort(decode_times(time_array))
+        with self.lock:
+            if times is None:
+                self.stores.pop(s3_uri, None)
+            else:
+                self.stores[s3_uri] = times
+                if stale:
+                    self.stale.add(s3_uri)
+            self.refreshed.add(s3_uri)
+        return times
+
+    def needs_consolidation(self, s3_uri):
+        """The store's .zmetadata was found out of date and was not consolidated since."""
+        return s3_uri in self.stale
+
+    def mark_consolidated(self, s3_uri):
+        with self.lock:
+            self.stale.discard(s3_uri)
+
+    def times(self, s3_uri):
+        """Sorted times stored in `s3_uri`, None if the store does not exist."""
+        if s3_uri not in self.refreshed:
+            return self.refresh(s3_uri)
+        return self.stores.get(s3_uri)
+
+    def exists(self, s3_uri):
+        return self.times(s3_uri) is not None
+
+    def store_chunks(self, s3_uri):
+        """Chunk size per dimension of the store's data variables ({} if unknown)."""
+        self.times(s3_uri)
+        return dict(self.chunks.get(s3_uri, {}))
+
+    def add_times(self, s3_uri, times, chunks=None):
+        """Record times just written to `s3_uri`."""
+        with self.lock:
+            if chunks:
+                self.chunks[s3_uri] = dict(chunks)
+            existing = self.stores.get(s3_uri, np.array([], dtype="datetime64[ns]"))
+            self.stores[s3_uri] = np.union1d(existing, np.asarray(times, dtype="datetime64[ns]"))
+            self.refreshed.add(s3_uri)
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = {s3_uri: [str(t) for t in np.datetime_as_string(times)]
+                    for s3_uri, times in self.stores.items()}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(data, file)
+            os.replace(tmp_path, self.path)
+
+def get_storage_options(REGION):
+    """Storage options for s3fs / xarray with our credentials."""
+    return {"key": aws_access_key_id, "secret": aws_secret_access_key,"client_kwargs": {"region_name": REGION}}
+
+def load_dataset(file_path, date, param_name):
+    """
+    Open one NetCDF (.nc) or GRIB (.grb) file and prepare it for Zarr:
+    rename the data variable to parameter name, set time and limit steps.
+    """
+    if file_path.endswith('.grb'):
+        # Read GRIB directly with cfgrib, without writing .idx files next to it
+        ds = xr.open_dataset(file_path, engine="cfgrib", decode_timedelta=True,
+                             backend_kwargs={"indexpath": ""})
+    else:
+        # Load NetCDF file as xarray dataset
+        ds = xr.open_dataset(file_path, decode_timedelta=True)
+
+    # Rename data variable to parameter name
+    var_name = list(ds.data_vars.keys())[0]
+    ds = ds.rename({var_name: param_name})
+
+    # Set correct time
+    ds['time'] = xr.DataArray([datetime.fromisoformat(date)], dims=['time'])
+
+    # Give data and valid_time the time dimension already here, so that
+    # a batch of a single file has the same layout as xr.concat of more files
+    for name in [param_name, 'valid_time']:
+        if name in ds.variables and 'time' not in ds[name].dims:
+            expanded = ds[name].expand_dims(time=ds['time'])
+            ds = ds.assign_coords({name: expanded}) if name in ds.coords else ds.assign({name: expanded})
+
+    # If 'step' has more than 72, truncate to 72
+    if 'step' in ds.dims and len(ds['step']) > 72:
+        ds = ds.isel(step=slice(0, 72))
+
+    return ds
+
+def plan_write_batches(n_files, file_bytes, time_chunk, existing_len, memory_budget=WRITE_MEMORY_BUDGET):
+    """
+    Split `n_files` new timesteps into batch sizes for appending to a store
+    that already holds `existing_len` timesteps chunked by `time_chunk`.
+
+    Each batch fits into `memory_budget` (estimated from `file_bytes` per
+    file) and every batch except the last ends on a time chunk boundary,
+    so no chunk object is rewritten by two appends.
+    """
+    budget_files = max(1, memory_budget // max(file_bytes, 1))
+    batches = []
+    offset = existing_len
+    remaining = n_files
+    while remaining > 0:
+        size = min(remaining, budget_files)
+        if size < remaining:
+            aligned = size - (offset + size) % time_chunk
+            # Budget smaller than one chunk - write at least up to the next boundary
+            size = aligned if aligned > 0 else min(remaining, (-offset) % time_chunk or time_chunk)
+        batches.append(size)
+        offset += size
+        remaining -= size
+    return batches
+
+def aligned_time_chunks(offset, n_times, time_chunk):
+    """Dask chunks along time for appending `n_times` at `offset`, matching zarr chunks."""
+    chunks = []
+    first = (-offset) % time_chunk or time_chunk
+    while n_times > 0:
+        size = min(first if not chunks else time_chunk, n_times)
+        chunks.append(size)
+        n_times -= size
+    return tuple(chunks)
+
+def get_write_profile(param_name):
+    """Write profile (chunks and codec) of a parameter."""
+    return WRITE_PROFILES[PARAMETER_PROFILES.get(param_name, "default")]
+
+def resolve_chunks(var, chunk_sizes):
+    """
+    Chunk size for each dimension of `var`. `chunk_sizes` is keyed by dimension
+    name or by "y"/"x" for the last two (spatial) dimensions; missing = whole dimension.
+    """
+    resolved = {}
+    spatial = {var.dims[-2]: "y", var.dims[-1]: "x"} if var.ndim >= 2 else {}
+    for dim in var.dims:
+        size = chunk_sizes.get(dim) or chunk_sizes.get(spatial.get(dim))
+        resolved[dim] = min(size, var.sizes[dim]) if size else var.sizes[dim]
+    return resolved
+
+def chunk_encoding(ds, chunks, compressor=None):
+    """
+    Zarr encoding for a new store - fixed chunks (even if the first batch
+    is shorter) and Blosc codec with byte shuffle.
+    """
+    encoding = {}
+    for name, var in ds.variables.items():
+        if 'time' not in var.dims or name == 'time':
+            continue
+        encoding[name] = {"chunks": tuple(chunks.get(dim) or var.sizes[dim] for dim in var.dims)}
+        if compressor:
+            encoding[name]["compressor"] = Blosc(shuffle=Blosc.SHUFFLE, **compressor)
+    return encoding
+
+def store_object_stats(fs, s3_uri):
+    """Number of objects and total bytes of a Zarr store in S3."""
+    objects = fs.find(s3_uri, detail=True)
+    return len(objects), sum(info.get("size", 0) for info in objects.values())
+
+def finalize_store(catalog, bucket_name, month_key, param_name, storage_options, new_chunk_stats, had_data):
+    """
+    Consolidate the metadata of a store after appends and refresh what is
+    derived from it - statistics, bucket catalog record, cross-month
+    reference file and valid-time index. Layout is read back from the
+    store, so this also completes a store left by an interrupted run.
+
+    Every step is guarded - a failure is logged, the remaining steps still
+    run and False is returned.
+    """
+    s3_zarr_path = f"meteo_data/{month_key}/{param_name}.zarr"
+    s3_uri = f"s3://{bucket_name}/{s3_zarr_path}"
+    # Chunks appended by an interrupted run have no statistics
+    missed_stats = catalog.needs_consolidation(s3_uri)
+    # Listing cached before this run's appends would hide new keys
+    catalog.fs.invalidate_cache()
+    try:
+        # One consolidated metadata write for all batches
+        group = zarr.consolidate_metadata(catalog.fs.get_mapper(s3_uri))
+        catalog.mark_consolidated(s3_uri)
+        variable = group[param_name]
+        dims = variable.attrs["_ARRAY_DIMENSIONS"]
+        sizes = dict(zip(dims, variable.shape))
+        chunks = dict(zip(dims, variable.chunks))
+    except Exception as e:
+        logger.error(f"Failed to consolidate metadata of {s3_uri}: {e}")
+        return False
+
+    ok = True
+    store_times = catalog.times(s3_uri)
+    try:
+        update_store_stats(catalog.fs, s3_uri, param_name, new_chunk_stats,
+                           store_times, chunks, had_data, missed_stats)
+    except Exception as e:
+        logger.error(f"Failed to update statistics of {s3_uri}: {e}")
+        ok = False
+    try:
+        entry = catalog_entry(s3_zarr_path, param_name, dims, sizes, chunks, store_times)
+        update_bucket_catalog(catalog.fs, bucket_name, {s3_zarr_path: entry})
+    except Exception as e:
+        logger.error(f"Failed to update bucket catalog for {s3_uri}: {e}")
+        ok = False
+    try:
+        update_virtual_dataset(catalog.fs, bucket_name, "meteo_data", param_name,
+                               month_key, read_store_times(s3_uri, storage_options))
+    except Exception as e:
+        logger.error(f"Failed to update virtual dataset of {param_name}: {e}")
+        ok = False
+    if "step" in dims:
+        try:
+            write_valid_index(catalog.fs, s3_uri, decode_times(group["time"]),
+                              decode_times(group["step"]), chunks)
+        except Exception as e:
+            logger.error(f"Failed to write valid-time index of {s3_uri}: {e}")
+            ok = False
+    try:
+        n_objects, n_bytes = store_object_stats(catalog.fs, s3_uri)
+        logger.info(f"Store {s3_uri}: {n_objects} objects, "
+                    f"{n_bytes / max(n_objects, 1) / 1024:.1f} KiB per object")
+    except Exception as e:
+        logger.error(f"Failed to list objects of {s3_uri}: {e}")
+    return ok
+
+def write_parameter(bucket_name, month_key, param_name, param_files, storage_options, REGION, catalog=None):
+    """
+    Write all files of one parameter for one month to its Zarr store in S3.
+    `catalog` (StoreCatalog) is shared between calls to avoid probing S3 again.
+
+    Files are appended in batches planned by plan_write_batches (memory
+    budget, aligned to the store's time chunks) and the consolidated
+    metadata is written only once, after the last batch, by finalize_store
+    together with the per-chunk statistics (store_stats.STATS_KEY), the
+    store's record in the bucket catalog (bucket_catalog.BUCKET_CATALOG_KEY),
+    the parameter's cross-month reference file (virtual_dataset) and the
+    valid-time index (valid_index.VALID_INDEX_KEY).
+
+    Returns False if a batch or one of the finishing steps failed; never raises.
+    """
+    if catalog is None:
+        catalog = StoreCatalog(storage_options)
+    # S3 path for month
+    s3_month_prefix = f"meteo_data/{month_key}"
+    
+    logger.info(f"Processing parameter: {param_name}")
+    
+    # S3 path for this parameter
+    s3_zarr_path = f"{s3_month_prefix}/{param_name}.zarr"
+    s3_uri = f"s3://{bucket_name}/{s3_zarr_path}"
+    
+    # Sort files by date
+    param_files.sort(key=lambda x: x[1])
+    
+    ok = True
+    written = False
+    # Statistics of the chunks written by this call, merged into the store's .zstats at the end
+    new_chunk_stats = {}
+    had_data = False
+    try:
+        # Existence and stored times come from the catalog, S3 is read once per store
+        existing_times = catalog.times(s3_uri)
+        zarr_exists = existing_times is not None
+        logger.info(f"Checking if zarr store exists at {s3_uri} using catalog: {zarr_exists}")
+        
+        # Skip files whose time is already stored, before loading them at all
+        if zarr_exists:
+            file_times = [np.datetime64(date, "ns") for _, date in param_files]
+            keep = new_times_mask(file_times, existing_times)
+            if not keep.all():
+                logger.warning(f"Found {int((~keep).sum())} duplicate timestamps - removing")
+                param_files = [f for f, k in zip(param_files, keep) if k]
+        if not param_files:
+            logger.info("All timestamps already exist, skipping parameter")
+        else:
+            existing_len = len(existing_times) if zarr_exists else 0
+            had_data = existing_len > 0
+            # Chunks of an existing store are fixed at creation, new stores use the parameter's profile
+            profile = get_write_profile(param_name)
+            chunk_sizes = catalog.store_chunks(s3_uri) if zarr_exists else dict(profile["chunks"])
+            time_chunk = chunk_sizes.get("time") or TIME_CHUNK
+        
+            # Estimate memory per file from the first one (lazy open, nothing is loaded)
+            first_file, first_date = param_files[0]
+            with load_dataset(first_file, first_date, param_name) as first_ds:
+                file_bytes = first_ds.nbytes
+            batch_sizes = plan_write_batches(len(param_files), file_bytes, time_chunk, existing_len)
+        
+            batch_idx = 0
+            for batch_num, batch_size in enumerate(batch_sizes, start=1):
+                batch_files = param_files[batch_idx:batch_idx + batch_size]
+                batch_idx += batch_size
+                logger.info(f"Processing batch {batch_num}/{len(batch_sizes)} ({batch_size} files)")
+            
+                # Collecting datasets for this batch
+                datasets = []
+            
+                for nc_file, date in batch_files:
+                    try:
+                        datasets.append(load_dataset(nc_file, date, param_name))
+                    except Exception as e:
+                        logger.error(f"Error processing file {nc_file}: {e}")
+            
+                # Combine all datasets in batch
+                if datasets:
+                    logger.info(f"Combining {len(datasets)} files from batch {batch_num}")
+                
+                    combined_ds = xr.concat(datasets, dim="time")
+                
+                    # Time chunks continue the store's existing chunk grid
+                    chunks = resolve_chunks(combined_ds[param_name], chunk_sizes)
+                    chunks['time'] = time_chunk
+                    dask_chunks = dict(chunks, time=aligned_time_chunks(existing_len, len(combined_ds.time), time_chunk))
+                
+                    # Batch fits the memory budget - load it once for both the write and the statistics
+                    combined_ds = combined_ds.chunk(dask_chunks).persist()
+                
+                    if zarr_exists:
+                        mode = "a"
+                        append_dim = "time"
+                        encoding = None
+                        logger.info(f"Appending data to existing Zarr store at {s3_uri}")
+                    else:
+                        # Create only - fails instead of overwriting an existing store
+                        mode = "w-"
+                        append_dim = None
+                        encoding = chunk_encoding(combined_ds, chunks, profile["compressor"])
+                        logger.info(f"Creating new Zarr store at {s3_uri} "
+                                    f"(profile {PARAMETER_PROFILES.get(param_name, 'default')}, chunks {chunks})")
+                
+                    # Save to S3
+                    logger.info(f"Saving batch to {s3_uri} (mode={mode})")
+                    try:
+                        # Add retry mechanism
+                        max_retries = 3
+                        retry_count = 0
+                        while retry_count < max_retries:
+                            try:
+                                # Metadata is consolidated once after the last batch
+                                combined_ds.to_zarr(s3_uri, mode=mode, append_dim=append_dim,
+                                                encoding=encoding, storage_options=storage_options,
+                                                consolidated=False)
+                                logger.info(f"Successfully saved data to {s3_uri}")
+                                catalog.add_times(s3_uri, combined_ds.time.values, chunks)
+                                variable = combined_ds[param_name]
+                                merge_chunk_stats(new_chunk_stats, compute_chunk_stats(
+                                    variable.values, variable.dims, chunks, existing_len))
+                                written = True
+                                zarr_exists = True
+                                existing_len += len(combined_ds.time)
+                                break
+                            except Exception as e:
+                                retry_count += 1
+                                logger.warning(f"Error saving to Zarr (attempt {retry_count}/{max_retries}): {e}")
+                                if retry_count >= max_retries:
+                                    raise
+                    except Exception as e:
+                        logger.error(f"Failed to save data after {max_retries} attempts: {e}")
+                        ok = False
+                
+                    # Close datasets and clear memory
+                    combined_ds.close()
+                    combined_ds = None
+                    for ds in datasets:
+                        ds.close()
+                    datasets = []
+    except Exception as e:
+        logger.error(f"Error processing parameter {param_name}: {e}")
+        ok = False
+
+    # Also after a run that was interrupted before consolidating this store
+    if written or catalog.needs_consolidation(s3_uri):
+        ok = finalize_store(catalog, bucket_name, month_key, param_name, storage_options,
+                            new_chunk_stats, had_data) and ok
+    return ok
+
+def process_files_by_month(dir_path, bucket_name, REGION, extension='.nc'):
+    """
+    Process files by month and parameter and save to S3 bucket.
+
+    `extension` selects the source files: '.nc' (output of convertToNC)
+    or '.grb' to write Zarr straight from the downloaded GRIB files.
+    """
+    # List source files
+    nc_files = list_files_in_directory(dir_path, extension)
+    logger.info(f"Found {len(nc_files)} {extension} files to process")
     
     # Group files by month
     files_by_month = {}
@@ -80,16 +605,14 @@ def process_files_by_month(dir_path, bucket_name, REGION):
             files_by_month[month_key].append((nc_file, date, param_name))
     
     # Initialize S3 filesystem interface
-    storage_options = {"key": aws_access_key_id, "secret": aws_secret_access_key,"client_kwargs": {"region_name": REGION}}
+    storage_options = get_storage_options(REGION)
     s3fs_instance = s3fs.S3FileSystem(anon=False, **storage_options)
+    catalog = StoreCatalog(storage_options, STORE_CATALOG_FILE)
     
     # Process files by month
     for month_key, file_info_list in files_by_month.items():
         logger.info(f"Processing month: {month_key}")
         
-        # S3 path for month
-        s3_month_prefix = f"meteo_data/{month_key}"
-        
         # Group files by parameters
         params_dict = {}
         for file_info in file_info_list:
@@ -99,211 +622,16 @@ def process_files_by_month(dir_path, bucket_name, REGION):
             params_dict[param_name].append((nc_file, date))
         
         for param_name, param_files in params_dict.items():
-            logger.info(f"Processing parameter: {param_name}")
-            
-            # S3 path for this parameter
-            s3_zarr_path = f"{s3_month_prefix}/{param_name}.zarr"
-            s3_uri = f"s3://{bucket_name}/{s3_zarr_path}"
-            
-            # Sort files by date
-            param_files.sort(key=lambda x: x[1])
-            
-            try:
-                # Process each file for this parameter in batches
-                batch_size = 10  # Process 10 files at a time
-                for batch_idx in range(0, len(param_files), batch_size):
-                    batch_files = param_files[batch_idx:batch_idx + batch_size]
-                    batch_num = batch_idx // batch_size + 1
-                    logger.info(f"Processing batch {batch_num}/{(len(param_files)-1)//batch_size + 1}")
-                    
-                    # Collecting datasets for this batch
-                    datasets = []
-                    
-                    for nc_file, date in batch_files:
-                        try:
-                            # Load NetCDF file as xarray dataset
-                            ds = xr.open_dataset(nc_file, decode_timedelta=True)
-                            
-                            # Rename data variable to parameter name
-                            var_name = list(ds.data_vars.keys())[0]
-                            ds = ds.rename({var_name: param_name})
-                            
-                            # Set correct time
-                            ds['time'] = xr.DataArray([datetime.fromisoformat(date)], dims=['time'])
-                            
-                            # If 'step' has more than 72, truncate to 72
-                            if 'step' in ds.dims and len(ds['step']) > 72:
-                                ds = ds.isel(step=slice(0, 72))
-                            
-                            # Add dataset to list
-                            datasets.append(ds)
-                        except Exception as e:
-                            logger.error(f"Error processing file {nc_file}: {e}")
-                    
-                    # Combine all datasets in batch
-                    if datasets:
-                        logger.info(f"Combining {len(datasets)} files from batch {batch_num}")
-                        
-                        combined_ds = xr.concat(datasets, dim="time")
-                        
-                        # Optimize chunking - use reasonably sized chunks
-                        time_chunk = min(len(combined_ds.time), 5)  # More reasonable time chunk size
-                        step_chunk = min(20, len(combined_ds.step)) if 'step' in combined_ds.dims else None
-                        
-                        chunks = {'time': time_chunk}
-                        if step_chunk:
-                            chunks['step'] = step_chunk
-                            
-                        combined_ds = combined_ds.chunk(chunks)
-                        
-                        # ZMĚNA: Check if Zarr store already exists using boto3 instead of s3fs
-                        zarr_prefix = f"{s3_zarr_path}/"
-                        zarr_exists = check_exists_boto3(bucket_name, zarr_prefix, REGION)
-                        
-                        logger.info(f"Checking if zarr store exists at {zarr_prefix} using boto3: {zarr_exists}")
-                        
-                        if zarr_exists:
-                            mode = "a"
-                            append_dim = "time"
-                            logger.info(f"Appending data to existing Zarr store at {s3_uri}")
-                            
-                            # For appending, make sure there are no time duplicates
-                            try:
-                                existing_ds = xr.open_zarr(s3_uri, storage_options=storage_options)
-                                existing_times = existing_ds.time.values
-                                new_times = combined_ds.time.values
-                                
-                                # Filter out times that already exist
-                                duplicate_mask = [t in existing_times for t in new_times]
-                                if any(duplicate_mask):
-                                    logger.warning(f"Found {sum(duplicate_mask)} duplicate timestamps - removing")
-                                    combined_ds = combined_ds.isel(time=[i for i, m in enumerate(duplicate_mask) if not m])
-                                    
-                                # If everything was duplicate, skip this batch
-                                if len(combined_ds.time) == 0:
-                                    logger.info("All timestamps already exist, skipping batch")
-                                    continue
-                                    
-                                existing_ds.close()
-                            except Exception as e:
-                                logger.error(f"Error checking for time duplicates: {e}")
-                                # Pokud nelze otevřít existující dataset, pokračujeme s append
-                                logger.warning("Will continue with append mode despite error")
-                                pass
-                        else:
-                            mode = "w"
-                            append_dim = None
-                            logger.info(f"Creating new Zarr store at {s3_uri}")
-                        
-                        # Save to S3
-                        logger.info(f"Saving batch to {s3_uri} (mode={mode})")
-                        try:
-                            # Add retry mechanism
-                            max_retries = 3
-                            retry_count = 0
-                            while retry_count < max_retries:
-                                try:
-                                    combined_ds.to_zarr(s3_uri, mode=mode, append_dim=append_dim, 
-                                                    storage_options=storage_options,
-                                                    consolidated=True)  # Enable metadata consolidation for better performance
-                                    logger.info(f"Successfully saved data to {s3_uri}")
-                                    break
-                                except Exception as e:
-                                    retry_count += 1
-                                    logger.warning(f"Error saving to Zarr (attempt {retry_count}/{max_retries}): {e}")
-                                    if retry_count >= max_retries:
-                                        raise
-                        except Exception as e:
-                            logger.error(f"Failed to save data after {max_retries} attempts: {e}")
-                        
-                        # Close datasets and clear memory
-                        combined_ds.close()
-                        combined_ds = None
-                        for ds in datasets:
-                            ds.close()
-                        datasets = []
-            
-            except Exception as e:
-                logger.error(f"Error processing parameter {param_name}: {e}")
+            write_parameter(bucket_name, month_key, param_name, param_files, storage_options, REGION, catalog)
     
     logger.info("Finished processing all files")
     return True
 
 def print_data_structure(bucket_name):
     """Display structure of stored data by month and parameter from S3 bucket"""
-    # Initialize S3FS with credentials
-    storage_options = {"key": aws_access_key_id, "secret": aws_secret_access_key}
-    s3fs_instance = s3fs.S3FileSystem(anon=False, **storage_options)
-    base_prefix = "meteo_data"
-    
-    # Initialize boto3 client for checking existence
-    s3_client = boto3.client('s3',
-                           aws_access_key_id=aws_access_key_id,
-                           aws_secret_access_key=aws_secret_access_key)
-    
-    # Check if prefix exists
-    prefix_exists = check_exists_boto3(bucket_name, base_prefix, REGION)
-    if not prefix_exists:
-        print("Data prefix doesn't exist in S3 bucket yet.")
-        return
-    
-    # List months in S3
+    # Imported here - inventory builds on this module
+    from inventory import build_inventory, print_inventory
     try:
-        # Use boto3 to list months
-        response = s3_client.list_objects_v2(
-            Bucket=bucket_name,
-            Prefix=base_prefix + "/",
-            Delimiter="/"
-        )
-        
-        months = []
-        if 'CommonPrefixes' in response:
-            for prefix in response['CommonPrefixes']:
-                month_prefix = prefix['Prefix']
-                month = month_prefix.split('/')[-2]  # Extract month from path
-                months.append(month)
-        
-        for month in sorted(months):
-            print(f"Month: {month}")
-            month_prefix = f"{base_prefix}/{month}"
-            
-            # List zarr files for given month using boto3
-            response = s3_client.list_objects_v2(
-                Bucket=bucket_name,
-                Prefix=month_prefix + "/",
-                Delimiter="/"
-            )
-            
-            params = []
-            if 'CommonPrefixes' in response:
-                for prefix in response['CommonPrefixes']:
-                    param_path = prefix['Prefix']
-                    if param_path.endswith(".zarr/"):
-                        param = param_path.split('/')[-2].replace(".zarr", "")
-                        params.append(param)
-            
-            for param in sorted(params):
-                s3_zarr_path = f"s3://{bucket_name}/{base_prefix}/{month}/{param}.zarr"
-                try:
-                    # Open dataset with decode_timedelta=True
-                    ds = xr.open_zarr(s3_zarr_path, storage_options=storage_options)
-                    
-                    # Get time range and unique days
-                    time_min = ds.time.min().values
-                    time_max = ds.time.max().values
-                    days = len(set(ds.time.dt.strftime('%Y-%m-%d').values))
-                    
-                    print(f"  - {param}: {days} days, {len(ds.time)} measurements, time range: {time_min} to {time_max}")
-                    
-                    # Check for gaps in time series
-                    time_diff = ds.time.diff('time')
-                    if len(time_diff) > 0:
-                        unique_diffs = set(time_diff.astype(str).values)
-                        if len(unique_diffs) > 1:
-                            print(f"    * Warning: Irregular time intervals detected: {unique_diffs}")
-                    
-                    ds.close()
-                except Exception as e:
-                    print(f"  - {param}: Error opening dataset: {e}")
+        print_inventory(build_inventory(bucket_name))
     except Exception as e:
-        print(f"Error reading S3 structure: {e}")
\ No newline at end of file
+        print(f"Error reading S3 structure: {e}")
@@ -0,0 +1,47 @@
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Side object with the valid-time (time + step) index, stored inside each Zarr store next to .zmetadata
+VALID_INDEX_KEY = ".zvalid"
+
+
+def _minutes(values, dtype):
+    return np.asarray(values, dtype=dtype).astype(f"{dtype}[m]").astype("int64")
+
+
+def build_valid_index(times, steps, chunks):
+    """
+    Valid-time index of a forecast store with (time, step) dims.
+
+    `times` (runs) are in store order, `chunks` is {dim: size}. For every
+    valid time the (time, step) position of the latest run is listed, so
+    a "best available forecast" series is one vectorized selection that
+    touches only the chunks holding those positions. All times are minutes
+    since 1970-01-01, steps minutes.
+    """
+    runs = _minutes(times, "datetime64")
+    step_minutes = _minutes(steps, "timedelta64")
+    valid = (runs[:, None] + step_minutes[None, :]).ravel()
+    run_of = np.repeat(runs, len(step_minutes))
+    # Latest run first within each valid time
+    order = np.lexsort((-run_of, valid))
+    valid_times, first = np.unique(valid[order], return_index=True)
+    time_idx, step_idx = np.divmod(order[first], len(step_minutes))
+    return {
+        "runs": runs.tolist(),
+        "steps": step_minutes.tolist(),
+        "chunks": {"time": int(chunks["time"]), "step": int(chunks.get("step") or len(step_minutes))},
+        "valid_times": valid_times.tolist(),
+        "latest": np.column_stack([time_idx, step_idx]).tolist(),
+    }
+
+
+def write_valid_index(fs, s3_uri, times, steps, chunks):
+    index = build_valid_index(times, steps, chunks)
+    with fs.open(f"{s3_uri}/{VALID_INDEX_KEY}", "wb") as file:
+        file.write(json.dumps(index).encode())
+    return index
@@ -0,0 +1,217 @@
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import math
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Reference files (fsspec "reference://" format, version 1) - one per parameter,
+# virtual/<prefix>/<parameter>.json, presenting all monthly stores as one dataset
+VIRTUAL_PREFIX = "virtual"
+# Times are stored in the reference file itself, padded slots are NaT
+TIME_UNITS = "minutes since 1970-01-01"
+TIME_FILL = int(np.iinfo("int64").min)
+
+_virtual_lock = threading.Lock()
+
+
+def virtual_key(prefix, param_name):
+    return f"{VIRTUAL_PREFIX}/{prefix}/{param_name}.json"
+
+
+def _chunk_keys(shape, chunks, separator="."):
+    """All chunk keys of an array as (index tuple, key)."""
+    grid = [range(math.ceil(size / chunk)) if size else range(0) for size, chunk in zip(shape, chunks)]
+    for index in itertools.product(*grid):
+        yield index, separator.join(str(i) for i in index) or "0"
+
+
+# .zarray fields that must match for chunk objects to be interchangeable between months
+# (zarr adds e.g. "dimension_separator" only once a store is appended to)
+LAYOUT_FIELDS = ("chunks", "dtype", "compressor", "filters", "fill_value")
+# Bumped when _array_layout changes - older month entries are re-hashed
+LAYOUT_VERSION = 2
+
+
+def _array_layout(metadata):
+    """Shape (without the time length), chunks, dtype and codecs of the store's arrays."""
+    layout = {}
+    for key, value in metadata.items():
+        if key.endswith("/.zarray") and key[:-len("/.zarray")] not in _skipped_arrays(metadata):
+            layout[key] = {field: value.get(field) for field in LAYOUT_FIELDS}
+            layout[key]["dimension_separator"] = value.get("dimension_separator") or "."
+            layout[key]["shape"] = value["shape"][1:] if _has_time(metadata, key) else value["shape"]
+    return hashlib.sha1(json.dumps(layout, sort_keys=True).encode()).hexdigest()
+
+
+def _has_time(metadata, zarray_key):
+    attrs = metadata.get(zarray_key.replace(".zarray", ".zattrs"), {})
+    dims = attrs.get("_ARRAY_DIMENSIONS", [])
+    return bool(dims) and dims[0] == "time"
+
+
+def _skipped_arrays(metadata):
+    """
+    Arrays not taken over into the virtual dataset - `time` (stored inline)
+    and datetimes along time like `valid_time`, whose CF units differ per month
+    (valid_time = time + step).
+    """
+    skipped = {"time"}
+    for key, attrs in metadata.items():
+        name = key[:-len("/.zattrs")]
+        if key.endswith("/.zattrs") and _has_time(metadata, f"{name}/.zarray") \
+                and " since " in str(attrs.get("units", "")):
+            skipped.add(name)
+    return skipped
+
+
+def build_references(bucket_name, prefix, param_name, months):
+    """
+    fsspec reference set joining monthly stores along time.
+
+    Each month starts at a time chunk boundary of the virtual arrays (zarr
+    stores edge chunks padded to full size), so chunk objects are referenced
+    as they are and only the padding slots get a NaT time. Months whose
+    array layout differs from the newest month are left out.
+    """
+    newest = months[max(months)]
+    metadata = newest["metadata"]
+    compatible = sorted(month for month, info in months.items()
+                        if info["layout"] == newest["layout"] and info["n_times"])
+    skipped = sorted(set(months) - set(compatible))
+    if skipped:
+        logger.warning(f"Virtual {param_name}: months {skipped} have a different layout, left out")
+
+    skipped_arrays = _skipped_arrays(metadata)
+    time_arrays = [key[:-len("/.zarray")] for key in metadata
+                   if key.endswith("/.zarray") and _has_time(metadata, key)
+                   and key[:-len("/.zarray")] not in skipped_arrays]
+    time_chunk = metadata[f"{time_arrays[0]}/.zarray"]["chunks"][0]
+    offsets, total = {}, 0
+    for month in compatible:
+        offsets[month] = total
+        total += math.ceil(months[month]["n_times"] / time_chunk) * time_chunk
+
+    store_url = "{{u}}/%s/" + f"{param_name}.zarr/"
+    refs = {}
+    virtual_metadata = {key: value for key, value in metadata.items()
+                        if key.split("/")[0] not in skipped_arrays and not key.endswith("/.zarray")}
+    for key, attrs in list(virtual_metadata.items()):
+        if key.endswith("/.zattrs") and "coordinates" in attrs:
+            coordinates = [c for c in attrs["coordinates"].split() if c not in skipped_arrays]
+            virtual_metadata[key] = dict(attrs, coordinates=" ".join(coordinates))
+
+    for key, zarray in metadata.items():
+        if not key.endswith("/.zarray") or key[:-len("/.zarray")] in skipped_arrays:
+            continue
+        name = key[:-len("/.zarray")]
+        separator = zarray.get("dimension_separator", ".")
+        if name in time_arrays:
+            virtual_metadata[key] = dict(zarray, shape=[total] + zarray["shape"][1:])
+            for month in compatible:
+                shape = [months[month]["n_times"]] + zarray["shape"][1:]
+                chunk_offset = offsets[month] // time_chunk
+                for index, chunk_key in _chunk_keys(shape, zarray["chunks"], separator):
+                    virtual_chunk = separator.join(str(i) for i in (index[0] + chunk_offset,) + index[1:])
+                    refs[f"{name}/{virtual_chunk}"] = [store_url % month + f"{name}/{chunk_key}"]
+        else:
+            # Coordinates without time (grid, steps) come from the newest month
+            virtual_metadata[key] = zarray
+            for _, chunk_key in _chunk_keys(zarray["shape"], zarray["chunks"], separator):
+                refs[f"{name}/{chunk_key}"] = [store_url % max(compatible) + f"{name}/{chunk_key}"]
+
+    # Inline time coordinate over the whole virtual axis, NaT in padding slots
+    times = np.full(total, TIME_FILL, dtype="<i8")
+    for month in compatible:
+        month_times = np.array(months[month]["times"], dtype="<i8")
+        times[offsets[month]:offsets[month] + len(month_times)] = month_times
+    virtual_metadata["time/.zarray"] = {
+        "zarr_format": 2, "shape": [total], "chunks": [max(total, 1)], "dtype": "<i8",
+        "compressor": None, "filters": None, "fill_value": TIME_FILL, "order": "C",
+    }
+    virtual_metadata["time/.zattrs"] = {"_ARRAY_DIMENSIONS": ["time"], "units": TIME_UNITS,
+                                        "calendar": "proleptic_gregorian"}
+    refs["time/0"] = "base64:" + base64.b64encode(times.tobytes()).decode()
+
+    for key, value in virtual_metadata.items():
+        refs[key] = json.dumps(value)
+    refs[".zmetadata"] = json.dumps({"zarr_consolidated_format": 1, "metadata": virtual_metadata})
+
+    return {
+        "version": 1,
+        "templates": {"u": f"s3://{bucket_name}/{prefix}"},
+        "refs": refs,
+        # Not part of the reference format - months present in the refs (clients
+        # open the others per month) and state for the next incremental update
+        "included": compatible,
+        "months": months,
+    }
+
+
+def read_month_metadata(fs, bucket_name, prefix, param_name, month):
+    with fs.open(f"{bucket_name}/{prefix}/{month}/{param_name}.zarr/.zmetadata", "rb") as file:
+        return json.load(file)["metadata"]
+
+
+def month_entry(metadata, times):
+    """State of one month in the reference file; `times` in store order."""
+    # Order of the store's time array (appends are not always chronological)
+    times = np.asarray(times, dtype="datetime64[ns]")
+    return {
+        "n_times": int(len(times)),
+        "times": times.astype("datetime64[m]").astype("int64").tolist(),
+        "layout": _array_layout(metadata),
+        "layout_version": LAYOUT_VERSION,
+        "metadata": metadata,
+    }
+
+
+def write_references(fs, bucket_name, prefix, param_name, months):
+    # Only the newest month's metadata is needed as the template
+    for other in months:
+        if other != max(months):
+            months[other].pop("metadata", None)
+    references = build_references(bucket_name, prefix, param_name, months)
+    path = f"{bucket_name}/{virtual_key(prefix, param_name)}"
+    with fs.open(path, "wb") as file:
+        file.write(json.dumps(references).encode())
+    return path
+
+
+def update_virtual_dataset(fs, bucket_name, prefix, param_name, month, times):
+    """
+    Re-generate the parameter's reference file after `month` was written.
+    `times` is the month's time array in store order. Reads the month's
+    .zmetadata and the previous reference file, nothing else.
+    """
+    with _virtual_lock:
+        metadata = read_month_metadata(fs, bucket_name, prefix, param_name, month)
+        path = f"{bucket_name}/{virtual_key(prefix, param_name)}"
+        try:
+            with fs.open(path, "rb") as file:
+                months = json.load(file).get("months", {})
+        except FileNotFoundError:
+            months = {}
+        except ValueError as e:
+            logger.warning(f"Reference file {path} is corrupted, rebuilding it from this month: {e}")
+            months = {}
+
+        months[month] = month_entry(metadata, times)
+        for other, entry in months.items():
+            if entry.get("layout_version") != LAYOUT_VERSION:
+                entry["layout"] = _array_layout(read_month_metadata(fs, bucket_name, prefix, param_name, other))
+                entry["layout_version"] = LAYOUT_VERSION
+        return write_references(fs, bucket_name, prefix, param_name, months)
+
+
+def rebuild_virtual_dataset(fs, bucket_name, prefix, param_name, month_times):
+    """Reference file built from scratch, `month_times` = {month: times in store order}."""
+    months = {month: month_entry(read_month_metadata(fs, bucket_name, prefix, param_name, month), times)
+              for month, times in month_times.items()}
+    with _virtual_lock:
+        return write_references(fs, bucket_name, prefix, param_name, months)
@@ -0,0 +1,51 @@
+"""
+GRIB -> NetCDF conversion (GRB_to_netCDF.convertToNC) over a directory of
+synthetic GRIB files at 1, 2 and N worker processes. Reports files/s and
+the speed-up over one process.
+"""
+import contextlib
+import glob
+import io
+import os
+
+import numpy as np
+
+from common import WORK_DIR, make_grib, print_table, timed
+
+import GRB_to_netCDF
+
+N_FILES = 24
+STEPS = 24
+GRID = (300, 200)
+
+
+def main():
+    directory = os.path.join(WORK_DIR, "grib")
+    os.makedirs(directory)
+    for i in range(N_FILES):
+        make_grib(os.path.join(directory, f"2026010100_PARAM{i:02d}.grb"), np.datetime64("2026-01-01T00"),
+                  steps=STEPS, ni=GRID[0], nj=GRID[1])
+    GRB_to_netCDF.DIR = directory
+    # Warm-up (imports, eccodes definitions, page cache) outside the measured runs
+    with contextlib.redirect_stdout(io.StringIO()):
+        GRB_to_netCDF.convert_file(os.path.join(directory, "2026010100_PARAM00.grb"), WORK_DIR)
+
+    rows = []
+    for workers in sorted({1, 2, os.cpu_count()}):
+        # Every run starts without .nc outputs and cfgrib .idx files
+        for path in glob.glob(os.path.join(directory, "*.nc")) + glob.glob(os.path.join(directory, "*.idx")):
+            os.remove(path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds, results = timed(GRB_to_netCDF.convertToNC, workers)
+        assert all(results.values())
+        rows.append([workers, f"{seconds:.2f}", f"{N_FILES / seconds:.1f}"])
+
+    single = float(rows[0][1])
+    for row in rows:
+        row.append(f"{single / float(row[1]):.2f}x")
+    print(f"{N_FILES} GRIB files, {STEPS} steps on a {GRID[0]}x{GRID[1]} grid, {os.cpu_count()} CPUs")
+    print_table(["workers", "seconds", "files/s", "speed-up"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+De-duplication of times before a Zarr append, previous scheme against the
+current one:
+
+- mask: `[t in existing for t in new]` against new_times_mask over
+  month-sized time axes (6-hourly runs up to 15-minute data)
+- reading the existing times: xr.open_zarr of the whole store against
+  read_store_times, on a store in moto S3 (seconds, S3 requests, bytes)
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+import s3fs
+import xarray as xr
+
+from common import BUCKET, REGION, count_s3_traffic, print_table, quiet, start_moto, timed
+
+import transfrom_s3
+
+# Month of 6-hourly runs, hourly, 15-minute data
+EXISTING = [124, 744, 2976]
+# One day of new times, half of them already stored
+NEW = 96
+REPEAT = 5
+
+
+def times(n, start="2026-01-01"):
+    return pd.date_range(start, periods=n, freq=pd.Timedelta(days=31) / n).values
+
+
+def mask_rows():
+    rows = []
+    for n in EXISTING:
+        existing = times(n)
+        step = existing[1] - existing[0]
+        new = np.concatenate([existing[-NEW // 2:], existing[-1] + step * np.arange(1, NEW // 2 + 1)])
+
+        def python_scan():
+            return [t in existing for t in new]
+
+        def vectorized():
+            return transfrom_s3.new_times_mask(new, existing)
+
+        assert list(~vectorized()) == python_scan()
+        scan = min(timeit.repeat(python_scan, number=1, repeat=REPEAT))
+        mask = min(timeit.repeat(vectorized, number=1, repeat=REPEAT))
+        rows.append([n, NEW, f"{scan * 1000:.2f}", f"{mask * 1000:.3f}", f"{scan / mask:.0f}x"])
+    return rows
+
+
+def read_rows():
+    start_moto()
+    storage_options = transfrom_s3.get_storage_options(REGION)
+    fs = s3fs.S3FileSystem(anon=False, **storage_options)
+    traffic = count_s3_traffic(fs)
+    s3_uri = f"s3://{BUCKET}/meteo_data/202601/CLSTEMPERATURE.zarr"
+    n = EXISTING[0]
+    ds = xr.Dataset(
+        {"CLSTEMPERATURE": (("time", "step", "latitude", "longitude"),
+                            np.random.rand(n, 25, 30, 40).astype("float32"))},
+        coords={"time": times(n), "step": (np.arange(25) * np.timedelta64(1, "h")).astype("timedelta64[ns]"),
+                "latitude": np.linspace(51, 48, 30), "longitude": np.linspace(12, 19, 40)})
+    ds.to_zarr(fs.get_mapper(s3_uri), mode="w", encoding={"CLSTEMPERATURE": {"chunks": (1, 25, 30, 40)}})
+
+    def open_whole():
+        existing_ds = xr.open_zarr(fs.get_mapper(s3_uri))
+        values = existing_ds.time.values
+        existing_ds.close()
+        return values
+
+    readers = [("xr.open_zarr", open_whole),
+               ("read_store_times", lambda: transfrom_s3.read_store_times(s3_uri, storage_options))]
+    # Warm-up (backend entry points, codecs) outside the measured reads
+    for _, read in readers:
+        read()
+    rows = []
+    for name, read in readers:
+        fs.invalidate_cache()
+        traffic.update(requests=0, bytes=0)
+        seconds, values = timed(read)
+        assert len(values) == n
+        rows.append([name, f"{seconds * 1000:.0f}", traffic["requests"], traffic["bytes"]])
+    return rows
+
+
+def main():
+    quiet()
+    print(f"New times per batch: {NEW} (half already stored), best of {REPEAT}")
+    print_table(["existing times", "new times", "list scan ms", "new_times_mask ms", "speed-up"], mask_rows())
+    print()
+    print(f"Existing times of a store with {EXISTING[0]} times in moto S3")
+    print_table(["reader", "ms", "S3 requests", "bytes"], read_rows())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Aladin download engine against a local HTTP stand-in of opendata.chmi.cz.
+
+Compares the previous scheme - a new aiohttp session per file and the
+attributes of a run fetched one after another, only the runs in parallel -
+with downloadAladin's pooled keep-alive session and one semaphore over all
+(date, run, attribute) files. Every response is delayed by LATENCY to
+stand in for the round trip to CHMI. Reports files/s and TCP connections
+opened.
+
+Files are small, so the round trips dominate rather than bz2 decompression
+sharing the process with the server. The stand-in is plain HTTP, so the
+TLS handshake that every new connection to CHMI costs is not included.
+"""
+import asyncio
+import bz2
+import contextlib
+import io
+import os
+from datetime import datetime
+
+from common import WORK_DIR, print_table, serve_files, timed
+
+import AladinDownloadLOC as aladin
+
+# ALADIN_ATTRIBUTES of the production config has about this many entries
+N_ATTRIBUTES = 12
+FILE_SIZE = 128 * 1024
+LATENCY = 0.1
+CONCURRENCIES = [4, 8, 16]
+DATE = datetime(2026, 1, 1)
+
+
+def source_files():
+    payload = bz2.compress(os.urandom(FILE_SIZE // 4) * 4)
+    return {f"{time_value}/x/{DATE:%Y%m%d}{time_value}_{name}.grb.bz2": payload
+            for time_value in aladin.TIME_VALUES for name in aladin.ALADIN_ATTRIBUTES.values()}
+
+
+def fresh_output(name):
+    aladin.DIRNAME = os.path.join(WORK_DIR, name)
+    aladin.MANIFEST_FILE = os.path.join(aladin.DIRNAME, "manifest.json")
+
+
+async def per_file_sessions(connections):
+    """Previous scheme: a session per file, attributes of a run in sequence"""
+    manifest = {}
+
+    async def time_slot(time_value):
+        for attribute in aladin.ALADIN_ATTRIBUTES:
+            async with aladin.create_session(stats=connections) as session:
+                await aladin.process_file(session, asyncio.Semaphore(1), manifest, DATE, time_value, attribute)
+
+    await asyncio.gather(*(time_slot(time_value) for time_value in aladin.TIME_VALUES))
+
+
+def run(name, coroutine_function, connections):
+    """[name, files, seconds, files/s, connections]; `connections` is read after the run"""
+    fresh_output(name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds, _ = timed(asyncio.run, coroutine_function())
+    downloaded = sum(filename.endswith(".grb") for _, _, filenames in os.walk(aladin.DIRNAME)
+                     for filename in filenames)
+    return [name, downloaded, f"{seconds:.2f}", f"{downloaded / seconds:.1f}", connections()["connections"]]
+
+
+def main():
+    aladin.ALADIN_ATTRIBUTES = {i: f"PARAM{i:02d}" for i in range(N_ATTRIBUTES)}
+    aladin.download_dates = lambda: [DATE]
+    create_session = aladin.create_session
+
+    # downloadAladin only prints its connection count - keep its stats dict
+    sessions = []
+
+    def recording_session(connections_per_host, stats=None):
+        sessions.append(stats)
+        return create_session(connections_per_host, stats)
+
+    rows = []
+    with serve_files(source_files(), LATENCY) as base_url:
+        aladin.DOMAIN = f"{base_url}/"
+        aladin.SUBDOMAIN = "/x/"
+
+        connections = {}
+        rows.append(run("session per file", lambda: per_file_sessions(connections), lambda: connections))
+
+        aladin.create_session = recording_session
+        for concurrency in CONCURRENCIES:
+            sessions.clear()
+            rows.append(run(f"pooled, {concurrency} concurrent",
+                            lambda: aladin.downloadAladin(concurrency, concurrency), lambda: sessions[0]))
+        aladin.create_session = create_session
+
+    print(f"{len(aladin.TIME_VALUES) * N_ATTRIBUTES} files of {FILE_SIZE // 1024} KiB, "
+          f"{LATENCY * 1000:.0f} ms per response")
+    print_table(["variant", "files", "seconds", "files/s", "connections"], rows)
+
+
+if __name__ == "__main__":
+    main()
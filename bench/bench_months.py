@@ -0,0 +1,86 @@
+"""
+query.load_data over 1, 3 and 12 months of one parameter in moto S3,
+written by process_files_by_month (so with the bucket catalog and the
+cross-month reference file):
+
+- one by one: month stores opened in sequence (max_workers=1), as
+  before the thread pool
+- concurrent: month stores opened in the thread pool (MAX_OPEN_WORKERS)
+- virtual: one open of the cross-month reference file (USE_VIRTUAL_DATASET)
+
+Every S3 request of the Client is delayed by LATENCY to stand in for the
+round trip to AWS, the local chunk cache is off. Reports the seconds until
+the lazy dataset is returned, S3 requests and bytes fetched - the data
+itself is only read for the returned window, after load_data.
+"""
+import contextlib
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import s3fs
+
+from common import (BUCKET, REGION, WORK_DIR, add_s3_latency, count_s3_traffic, make_netcdf_runs,
+                    print_table, quiet, start_moto, timed)
+
+import query
+import transfrom_s3
+
+PARAMETER = "CLSTEMPERATURE"
+RUNS = pd.date_range("2025-01-01", "2025-12-31 18:00", freq="6h")
+STEPS = 13
+GRID = (40, 50)
+LATENCY = 0.03
+QUERIES = {"1 month": ("2025-03-01", "2025-03-31 18:00"),
+           "3 months": ("2025-03-01", "2025-05-31 18:00"),
+           "12 months": ("2025-01-01", "2025-12-31 18:00")}
+VARIANTS = {"one by one": {"max_workers": 1, "use_virtual": False},
+            "concurrent": {"use_virtual": False},
+            "virtual": {"use_virtual": True}}
+
+
+def main():
+    quiet()
+    start_moto()
+    directory = os.path.join(WORK_DIR, "runs")
+    os.makedirs(directory)
+    make_netcdf_runs(directory, RUNS, [PARAMETER], STEPS, GRID)
+    transfrom_s3.STORE_CATALOG_FILE = os.path.join(WORK_DIR, "store_catalog.json")
+    with contextlib.redirect_stdout(io.StringIO()):
+        transfrom_s3.process_files_by_month(directory, BUCKET, REGION)
+
+    query.BUCKET_NAME = BUCKET
+    fs = s3fs.S3FileSystem(**query.STORAGE_OPTIONS)
+    # The catalog is read through the module's instance, created before moto was reset
+    query.s3fs_instance = fs
+    traffic = count_s3_traffic(fs)
+    add_s3_latency(fs, LATENCY)
+    # Warm-up (backend entry points, codecs) outside the measured queries
+    with contextlib.redirect_stdout(io.StringIO()):
+        for options in VARIANTS.values():
+            query.load_data(PARAMETER, *QUERIES["1 month"], use_cache=False, **options)
+
+    rows = []
+    for name, (start, end) in QUERIES.items():
+        expected = len(RUNS[(RUNS >= start) & (RUNS <= end)])
+        for variant, options in VARIANTS.items():
+            fs.invalidate_cache()
+            traffic.update(requests=0, bytes=0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                seconds, ds = timed(query.load_data, PARAMETER, start, end, use_cache=False, **options)
+            assert len(ds.time) == expected
+            opened = dict(traffic)
+            # A point time series over the window, only its chunks are fetched
+            values = ds[PARAMETER].isel(step=0, y=20, x=25).values
+            assert not np.isnan(values).any()
+            rows.append([name, variant, f"{seconds:.2f}", opened["requests"], f"{opened['bytes'] / 1024:.0f}",
+                         traffic["requests"] - opened["requests"]])
+
+    print(f"{len(RUNS)} runs of {PARAMETER} in 12 monthly stores, {STEPS} steps on a {GRID[0]}x{GRID[1]} grid, "
+          f"{LATENCY * 1000:.0f} ms per S3 request")
+    print_table(["query", "variant", "open s", "S3 requests", "KiB fetched", "requests for a point series"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+query.load_parameters against a loop of query.load_data calls, one per
+parameter, for the same 4-month window and area. Three parameters of six
+monthly stores each in moto S3, written by process_files_by_month.
+
+Both are run over the month stores (use_virtual=False) and over the
+cross-month virtual datasets. Every S3 request of the Client is delayed
+by LATENCY to stand in for the round trip to AWS, the local chunk cache
+is off. Reports seconds until the lazy data is returned, seconds including
+loading the values, S3 requests and bytes fetched.
+"""
+import contextlib
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import s3fs
+
+from common import (BUCKET, REGION, WORK_DIR, add_s3_latency, count_s3_traffic, make_netcdf_runs,
+                    print_table, quiet, start_moto, timed)
+
+import query
+import transfrom_s3
+
+PARAMETERS = ["CLSTEMPERATURE", "CLSVENT_ZONAL", "SURFNEBUL_TOTALE"]
+RUNS = pd.date_range("2025-01-01", "2025-06-30 18:00", freq="6h")
+STEPS = 13
+GRID = (60, 80)
+LATENCY = 0.03
+WINDOW = ("2025-02-01", "2025-05-31 18:00")
+BBOX = ((49.0, 49.6), (13.5, 15.0))
+
+
+def per_parameter_loop(use_virtual):
+    """Previous way - a load_data call per parameter"""
+    return {name: query.load_data(name, *WINDOW, lat_range=BBOX[0], lon_range=BBOX[1], use_cache=False,
+                                  use_virtual=use_virtual)[name] for name in PARAMETERS}
+
+
+def batch(use_virtual):
+    ds = query.load_parameters(PARAMETERS, *WINDOW, lat_range=BBOX[0], lon_range=BBOX[1], use_cache=False,
+                               use_virtual=use_virtual)
+    return {name: ds[name] for name in PARAMETERS}
+
+
+def main():
+    quiet()
+    start_moto()
+    directory = os.path.join(WORK_DIR, "runs")
+    os.makedirs(directory)
+    make_netcdf_runs(directory, RUNS, PARAMETERS, STEPS, GRID)
+    transfrom_s3.STORE_CATALOG_FILE = os.path.join(WORK_DIR, "store_catalog.json")
+    with contextlib.redirect_stdout(io.StringIO()):
+        transfrom_s3.process_files_by_month(directory, BUCKET, REGION)
+
+    query.BUCKET_NAME = BUCKET
+    fs = s3fs.S3FileSystem(**query.STORAGE_OPTIONS)
+    # The catalog is read through the module's instance, created before moto was reset
+    query.s3fs_instance = fs
+    traffic = count_s3_traffic(fs)
+    add_s3_latency(fs, LATENCY)
+    # Warm-up (grid index, backend entry points, codecs) outside the measured queries
+    with contextlib.redirect_stdout(io.StringIO()):
+        batch(True)
+        batch(False)
+
+    rows, results = [], {}
+    for use_virtual in [False, True]:
+        for variant, function in [("load_data loop", per_parameter_loop), ("load_parameters", batch)]:
+            fs.invalidate_cache()
+            traffic.update(requests=0, bytes=0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                opened, arrays = timed(function, use_virtual)
+                loaded, values = timed(lambda: {name: array.values for name, array in arrays.items()})
+            results[use_virtual, variant] = values
+            rows.append(["virtual" if use_virtual else "month stores", variant, f"{opened:.2f}",
+                         f"{opened + loaded:.2f}", traffic["requests"], f"{traffic['bytes'] / 1024 ** 2:.2f}"])
+
+    reference = results[False, "load_data loop"]
+    for values in results.values():
+        assert all(np.array_equal(values[name], reference[name], equal_nan=True) for name in PARAMETERS)
+
+    print(f"{len(PARAMETERS)} parameters x 6 monthly stores, {STEPS} steps on a {GRID[0]}x{GRID[1]} grid, "
+          f"{WINDOW[0]} - {WINDOW[1]}, {LATENCY * 1000:.0f} ms per S3 request; values identical")
+    print_table(["stores", "variant", "open s", "total s", "S3 requests", "MiB fetched"], rows)
+
+
+if __name__ == "__main__":
+    main()
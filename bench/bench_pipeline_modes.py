@@ -0,0 +1,67 @@
+"""
+The two main.py modes on the same synthetic GRIB downloads, into moto S3:
+
+- netcdf: convertToNC, then process_files_by_month over the .nc files
+- direct: process_files_by_month straight from the .grb files
+
+Reports wall time and the bytes each mode writes to the local disk next
+to the downloaded GRIB files (.nc copies, cfgrib .idx files, catalog).
+"""
+import contextlib
+import io
+import os
+import shutil
+
+import numpy as np
+
+from common import BUCKET, REGION, WORK_DIR, make_grib, print_table, quiet, start_moto, timed
+
+import GRB_to_netCDF
+import transfrom_s3
+
+RUNS = ["2026-01-01T00", "2026-01-01T06", "2026-01-01T12", "2026-01-01T18"]
+PARAMETERS = ["CLSTEMPERATURE", "CLSHUMI_RELATIVE", "CLSVENT_ZONAL"]
+STEPS = 24
+GRID = (300, 200)
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(directory) for name in names)
+
+
+def run_mode(mode, source):
+    directory = os.path.join(WORK_DIR, mode)
+    shutil.copytree(source, directory)
+    downloaded = directory_bytes(directory)
+    start_moto()
+    GRB_to_netCDF.DIR = directory
+    transfrom_s3.STORE_CATALOG_FILE = os.path.join(directory, "store_catalog.json")
+
+    def run():
+        if mode == "direct":
+            return transfrom_s3.process_files_by_month(directory, BUCKET, REGION, extension=".grb")
+        GRB_to_netCDF.convertToNC()
+        return transfrom_s3.process_files_by_month(directory, BUCKET, REGION)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds, _ = timed(run)
+    return [mode, f"{seconds:.2f}", f"{(directory_bytes(directory) - downloaded) / 1024 ** 2:.1f}"]
+
+
+def main():
+    quiet()
+    source = os.path.join(WORK_DIR, "source")
+    os.makedirs(source)
+    for run in RUNS:
+        for parameter in PARAMETERS:
+            name = f"{np.datetime64(run, 'h').astype(object):%Y%m%d%H}_{parameter}.grb"
+            make_grib(os.path.join(source, name), run, steps=STEPS, ni=GRID[0], nj=GRID[1])
+
+    rows = [run_mode(mode, source) for mode in ["netcdf", "direct"]]
+    print(f"{len(RUNS)} runs x {len(PARAMETERS)} parameters, {STEPS} steps on a {GRID[0]}x{GRID[1]} grid, "
+          f"{directory_bytes(source) / 1024 ** 2:.1f} MiB of GRIB")
+    print_table(["mode", "seconds", "MiB written locally"], rows)
+
+
+if __name__ == "__main__":
+    main()
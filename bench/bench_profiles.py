@@ -0,0 +1,94 @@
+"""
+Write profiles (transfrom_s3.WRITE_PROFILES) against the Client's query
+patterns, in moto S3.
+
+The same week of synthetic ALADIN-like runs (NetCDF as from convertToNC,
+2-D latitude/longitude on y/x) is written once per profile, each as its
+own parameter, by process_files_by_month. Then query.load_data reads,
+without the local chunk cache:
+
+- point: time series of all runs and steps at one grid point
+- map: one run and step over the whole grid
+- bbox: all runs and steps over a small area
+
+Reports store size and, per query, seconds, S3 requests and bytes fetched.
+moto answers from memory, so the request count stands in for the latency
+each request costs against real S3.
+"""
+import contextlib
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import s3fs
+
+from common import BUCKET, REGION, WORK_DIR, count_s3_traffic, make_netcdf_runs, print_table, quiet, start_moto, timed
+
+import query
+import transfrom_s3
+
+RUNS = pd.date_range("2026-01-05", periods=28, freq="6h")
+STEPS = 72
+GRID = (100, 150)
+POINT = (49.5, 15.5)
+BBOX = ((49.2, 49.8), (15.0, 16.0))
+
+
+def parameter(profile):
+    return f"BENCH_{profile.upper()}"
+
+
+def queries(name):
+    start, end = RUNS[0], RUNS[-1]
+    return {
+        "point": lambda: query.load_data(name, start, end, point=POINT, use_cache=False)[name].load(),
+        "map": lambda: query.load_data(name, RUNS[10], RUNS[10], use_cache=False)[name].isel(step=12).load(),
+        "bbox": lambda: query.load_data(name, start, end, lat_range=BBOX[0], lon_range=BBOX[1],
+                                        use_cache=False)[name].load(),
+    }
+
+
+def main():
+    quiet()
+    start_moto()
+    directory = os.path.join(WORK_DIR, "runs")
+    os.makedirs(directory)
+    make_netcdf_runs(directory, RUNS, [parameter(profile) for profile in transfrom_s3.WRITE_PROFILES], STEPS, GRID)
+
+    transfrom_s3.PARAMETER_PROFILES = {parameter(profile): profile for profile in transfrom_s3.WRITE_PROFILES}
+    transfrom_s3.STORE_CATALOG_FILE = os.path.join(WORK_DIR, "store_catalog.json")
+    with contextlib.redirect_stdout(io.StringIO()):
+        transfrom_s3.process_files_by_month(directory, BUCKET, REGION)
+
+    query.BUCKET_NAME = BUCKET
+    fs = s3fs.S3FileSystem(**query.STORAGE_OPTIONS)
+    traffic = count_s3_traffic(fs)
+    # Warm-up (grid index, backend entry points) outside the measured queries
+    with contextlib.redirect_stdout(io.StringIO()):
+        for run in queries(parameter("default")).values():
+            run()
+
+    sizes, rows = [], []
+    for profile, settings in transfrom_s3.WRITE_PROFILES.items():
+        name = parameter(profile)
+        objects, size = transfrom_s3.store_object_stats(fs, f"s3://{BUCKET}/meteo_data/202601/{name}.zarr")
+        sizes.append([profile, settings["chunks"], objects, f"{size / 1024 ** 2:.1f}"])
+        for pattern, run in queries(name).items():
+            fs.invalidate_cache()
+            traffic.update(requests=0, bytes=0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                seconds, values = timed(run)
+            assert values.size and not np.isnan(values).all()
+            rows.append([profile, pattern, values.shape, f"{seconds:.2f}", traffic["requests"],
+                         f"{traffic['bytes'] / 1024 ** 2:.2f}"])
+
+    print(f"{len(RUNS)} runs x {STEPS} steps on a {GRID[0]}x{GRID[1]} grid, "
+          f"{len(RUNS) * STEPS * GRID[0] * GRID[1] * 4 / 1024 ** 2:.0f} MiB of float32 per profile")
+    print_table(["profile", "chunks", "objects", "MiB stored"], sizes)
+    print()
+    print_table(["profile", "query", "shape", "seconds", "S3 requests", "MiB fetched"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Shared setup of the benchmarks in bench/.
+
+The Server and Client scripts are flat modules importing a local `config`
+module that is not in the repository, so Server/ and Client/ are put on
+sys.path and `config` is provided with benchmark values. S3 is a moto
+server, opendata.chmi.cz a local aiohttp server. Run the scripts from the
+repository root, e.g.
+
+    python bench/bench_download.py
+
+Needs moto[server] on top of requirements.txt. The numbers are only
+comparable between the variants of one run, on the same machine.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.request
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT_DIR, "Server"), os.path.join(ROOT_DIR, "Client")]
+
+BUCKET = "bench-bucket"
+REGION = "us-east-1"
+WORK_DIR = tempfile.mkdtemp(prefix="npw-bench-")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Endpoint and credentials have to be known before any module creates its
+# boto3 client / s3fs instance at import time
+MOTO_ENDPOINT = f"http://127.0.0.1:{_free_port()}"
+os.environ["AWS_ENDPOINT_URL"] = MOTO_ENDPOINT
+os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+os.environ["AWS_DEFAULT_REGION"] = REGION
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+config = types.ModuleType("config")
+config.BUCKET_NAME = BUCKET
+config.REGION = REGION
+config.aws_access_key_id = "testing"
+config.aws_secret_access_key = "testing"
+config.DOMAINCZ = config.DOMAINLA = "http://127.0.0.1/"
+config.SUBDOMAINCZ = config.SUBDOMAINLA = "/"
+config.ALADIN_ATTRIBUTES = {}
+config.DIR = os.path.join(WORK_DIR, "data")
+sys.modules["config"] = config
+
+_moto = {}
+
+
+def start_moto():
+    """Start the moto server (once per process) and create an empty BUCKET"""
+    import boto3
+    import s3fs
+    from moto.server import ThreadedMotoServer
+
+    if not _moto:
+        port = int(MOTO_ENDPOINT.rsplit(":", 1)[1])
+        _moto["server"] = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+        _moto["server"].start()
+    urllib.request.urlopen(urllib.request.Request(f"{MOTO_ENDPOINT}/moto-api/reset", method="POST")).close()
+    s3fs.S3FileSystem.clear_instance_cache()
+    client = boto3.client("s3", region_name=REGION)
+    client.create_bucket(Bucket=BUCKET)
+    return client
+
+
+def quiet():
+    """Keep the INFO logging of the Server modules out of the results"""
+    logging.getLogger().setLevel(logging.WARNING)
+    # Access log of the moto server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+
+@contextlib.contextmanager
+def serve_files(files, latency=0.0):
+    """
+    Serve `files` ({path: bytes}) from a local aiohttp server in a background
+    thread, every response delayed by `latency` seconds (network round trip).
+    Yields the base URL.
+    """
+    from aiohttp import web
+
+    async def handle(request):
+        body = files.get(request.match_info["path"])
+        await asyncio.sleep(latency)
+        if body is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=body)
+
+    app = web.Application()
+    app.router.add_get("/{path:.*}", handle)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    stop = asyncio.Event()
+    base_url = {}
+
+    async def run():
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base_url["url"] = f"http://127.0.0.1:{runner.addresses[0][1]}"
+        started.set()
+        await stop.wait()
+        await runner.cleanup()
+
+    thread = threading.Thread(target=loop.run_until_complete, args=(run(),), daemon=True)
+    thread.start()
+    started.wait()
+    try:
+        yield base_url["url"]
+    finally:
+        loop.call_soon_threadsafe(stop.set)
+        thread.join()
+        loop.close()
+
+
+def make_grib(path, run, steps=6, ni=40, nj=30):
+    """
+    Synthetic ALADIN-like GRIB2 file: 2 m temperature on a regular
+    `ni` x `nj` grid over Czechia, forecast steps 0..steps-1 h of `run`.
+    """
+    import eccodes
+
+    run = np.datetime64(run, "h").astype(object)
+    with open(path, "wb") as file:
+        for step in range(steps):
+            handle = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+            for key, value in {
+                "Ni": ni, "Nj": nj,
+                "latitudeOfFirstGridPointInDegrees": 51.0, "longitudeOfFirstGridPointInDegrees": 12.0,
+                "latitudeOfLastGridPointInDegrees": 48.0, "longitudeOfLastGridPointInDegrees": 19.0,
+                "iDirectionIncrementInDegrees": 7 / (ni - 1), "jDirectionIncrementInDegrees": 3 / (nj - 1),
+                "dataDate": int(run.strftime("%Y%m%d")), "dataTime": run.hour * 100,
+                "stepUnits": 1, "forecastTime": step,
+                "discipline": 0, "parameterCategory": 0, "parameterNumber": 0,
+                "typeOfFirstFixedSurface": 103, "scaledValueOfFirstFixedSurface": 2,
+            }.items():
+                eccodes.codes_set(handle, key, value)
+            eccodes.codes_set_values(handle, np.random.rand(ni * nj) * 30 + 270)
+            eccodes.codes_write(handle, file)
+            eccodes.codes_release(handle)
+
+
+def curvilinear_grid(shape):
+    """
+    2-D latitude/longitude of a `shape` (y, x) grid from 48.5 N 12.5 E,
+    about 2 km spacing, slightly rotated like the ALADIN Lambert grid
+    """
+    y, x = np.mgrid[0:shape[0], 0:shape[1]]
+    return 48.5 + y * 0.02 + x * 0.002, 12.5 + x * 0.045 - y * 0.003
+
+
+def make_netcdf_runs(directory, runs, parameters, steps=72, shape=(100, 150)):
+    """
+    Synthetic runs as convertToNC leaves them - YYYYMMDDHH_<parameter>.nc
+    for every run and parameter, `steps` hourly steps on a curvilinear
+    `shape` grid. A run is written once and hard-linked per parameter.
+    """
+    import pandas as pd
+    import xarray as xr
+
+    latitude, longitude = curvilinear_grid(shape)
+    step = pd.to_timedelta(np.arange(steps), unit="h")
+    rng = np.random.default_rng(0)
+    for run in pd.DatetimeIndex(runs):
+        # Smooth field + noise to 0.1 K, compresses about like real data
+        field = (275 + 8 * np.sin(latitude[None] * 3 + np.arange(steps)[:, None, None] / 6)
+                 + np.cos(longitude[None] * 2) + rng.normal(0, 0.3, (steps, *shape)))
+        ds = xr.Dataset({"t2m": (("step", "y", "x"), np.round(field, 1).astype("float32"))},
+                        coords={"time": run, "step": step, "latitude": (("y", "x"), latitude),
+                                "longitude": (("y", "x"), longitude), "valid_time": ("step", run + step)})
+        source = os.path.join(directory, f"{run:%Y%m%d%H}.nc.tmp")
+        ds.to_netcdf(source)
+        for parameter in parameters:
+            os.link(source, os.path.join(directory, f"{run:%Y%m%d%H}_{parameter}.nc"))
+        os.remove(source)
+
+
+def add_s3_latency(fs, latency):
+    """Delay every S3 request of an s3fs instance by `latency` seconds (round trip to AWS)"""
+    call_s3 = fs._call_s3
+
+    async def delayed(method, *args, **kwargs):
+        await asyncio.sleep(latency)
+        return await call_s3(method, *args, **kwargs)
+
+    fs._call_s3 = delayed
+
+
+def count_s3_traffic(fs):
+    """
+    Count S3 requests and response bytes of an s3fs instance, returns a dict
+    {"requests": n, "bytes": b} updated in place (reset it between runs).
+    """
+    stats = {"requests": 0, "bytes": 0}
+    call_s3 = fs._call_s3
+
+    async def counting(method, *args, **kwargs):
+        response = await call_s3(method, *args, **kwargs)
+        stats["requests"] += 1
+        if method == "get_object":
+            stats["bytes"] += response.get("ContentLength", 0)
+        return response
+
+    fs._call_s3 = counting
+    return stats
+
+
+def timed(function, *args, **kwargs):
+    """(seconds, result) of one call"""
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def print_table(headers, rows):
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max(len(str(header)), *(len(row[i]) for row in rows)) for i, header in enumerate(headers)]
+    print("  ".join(str(header).ljust(width) for header, width in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
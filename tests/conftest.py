@@ -0,0 +1,80 @@
+"""
+Shared test setup.
+
+The Server and Client scripts are flat modules importing a deployment-local
+`config` module that is not in the repository, so Server/ and Client/ are
+put on sys.path and `config` is provided with test values. S3 is a moto
+server (s3fs talks to a real endpoint, so the in-process mock does not
+cover it); HTTP sources are local aiohttp servers, see servers.py.
+
+Needs pytest and moto[server] on top of requirements.txt:
+    python -m pytest tests
+"""
+import os
+import socket
+import sys
+import tempfile
+import types
+import urllib.request
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT_DIR, "Server"), os.path.join(ROOT_DIR, "Client")]
+
+TEST_BUCKET = "test-bucket"
+TEST_REGION = "us-east-1"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Endpoint and credentials have to be known before any module creates its
+# boto3 client / s3fs instance at import time
+MOTO_PORT = _free_port()
+MOTO_ENDPOINT = f"http://127.0.0.1:{MOTO_PORT}"
+os.environ["AWS_ENDPOINT_URL"] = MOTO_ENDPOINT
+os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+os.environ["AWS_DEFAULT_REGION"] = TEST_REGION
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+config = types.ModuleType("config")
+config.BUCKET_NAME = TEST_BUCKET
+config.REGION = TEST_REGION
+config.aws_access_key_id = "testing"
+config.aws_secret_access_key = "testing"
+config.DOMAINCZ = "http://127.0.0.1/"
+config.SUBDOMAINCZ = "/"
+config.DOMAINLA = "http://127.0.0.1/"
+config.SUBDOMAINLA = "/"
+config.ALADIN_ATTRIBUTES = ["CLSTEMPERATURE"]
+config.DIR = tempfile.mkdtemp(prefix="npw-test-")
+sys.modules["config"] = config
+
+
+@pytest.fixture(scope="session")
+def moto_server():
+    from moto.server import ThreadedMotoServer
+
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=MOTO_PORT, verbose=False)
+    server.start()
+    yield MOTO_ENDPOINT
+    server.stop()
+
+
+@pytest.fixture
+def s3(moto_server):
+    """Empty moto S3 with TEST_BUCKET, returns a boto3 client"""
+    import boto3
+    import s3fs
+
+    urllib.request.urlopen(urllib.request.Request(f"{moto_server}/moto-api/reset", method="POST")).close()
+    # Cached s3fs instances would keep listings from the previous test
+    s3fs.S3FileSystem.clear_instance_cache()
+    client = boto3.client("s3", region_name=TEST_REGION)
+    client.create_bucket(Bucket=TEST_BUCKET)
+    return client
@@ -0,0 +1,97 @@
+"""Local aiohttp servers standing in for opendata.chmi.cz"""
+import asyncio
+import contextlib
+import hashlib
+import threading
+
+from aiohttp import web
+
+
+@contextlib.asynccontextmanager
+async def serve(app):
+    """Run `app` on a free local port, yields its base URL"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    try:
+        yield f"http://127.0.0.1:{runner.addresses[0][1]}"
+    finally:
+        await runner.cleanup()
+
+
+@contextlib.contextmanager
+def serve_in_thread(app):
+    """Run `app` in a background thread (own event loop), yields its base URL"""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    base_url = {}
+
+    async def run(stop):
+        async with serve(app) as url:
+            base_url["url"] = url
+            started.set()
+            await stop.wait()
+
+    stop = asyncio.Event()
+    thread = threading.Thread(target=loop.run_until_complete, args=(run(stop),), daemon=True)
+    thread.start()
+    started.wait()
+    try:
+        yield base_url["url"]
+    finally:
+        loop.call_soon_threadsafe(stop.set)
+        thread.join()
+        loop.close()
+
+
+def static_app(files, log=None, index=None, headers=None):
+    """
+    App serving `files` ({name: bytes}) under /<name> with ETag,
+    If-None-Match, Range (bytes=<start>-) and If-Range (ETag) support.
+    `index` (list of names, by default all files) is served as an
+    Apache-style directory listing at /. `headers` are added to every
+    file response.
+    Every request is appended to `log` as (name, status, request headers).
+    """
+    log = [] if log is None else log
+
+    async def handle_index(request):
+        log.append(("", 200, dict(request.headers)))
+        names = sorted(files) if index is None else index
+        rows = "".join(f'<a href="{name}">{name}</a>   01-Jan-2026 00:00  {len(files.get(name, b""))}\n'
+                       for name in names)
+        return web.Response(text=f'<html><body><h1>Index of /</h1><pre><a href="../">../</a>\n{rows}</pre>'
+                                 f'</body></html>', content_type="text/html")
+
+    async def handle(request):
+        name = request.match_info["name"]
+        body = files.get(name)
+        if body is None:
+            log.append((name, 404, dict(request.headers)))
+            raise web.HTTPNotFound()
+        response = _respond(request, body)
+        response.headers.update(headers or {})
+        log.append((name, response.status, dict(request.headers)))
+        return response
+
+    app = web.Application()
+    app.router.add_get("/", handle_index)
+    app.router.add_get("/{name}", handle)
+    return app
+
+
+def _respond(request, body):
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers={"ETag": etag})
+
+    range_header = request.headers.get("Range")
+    # A Range whose If-Range does not match the current ETag is ignored (full 200)
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        start = int(range_header.removeprefix("bytes=").rstrip("-"))
+        if start >= len(body):
+            return web.Response(status=416, headers={"Content-Range": f"bytes */{len(body)}"})
+        return web.Response(status=206, body=body[start:], headers={
+            "ETag": etag, "Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"})
+    return web.Response(body=body, headers={"ETag": etag})
@@ -0,0 +1,175 @@
+import asyncio
+import bz2
+import hashlib
+import os
+from datetime import datetime
+
+import pytest
+
+import AladinDownloadLOC as aladin
+from servers import serve_in_thread, static_app
+
+NAME = "CLSTEMPERATURE.grb.bz2"
+PAYLOAD = bytes(range(256)) * 4096
+# Two concatenated bz2 streams, like some of the published files
+COMPRESSED = bz2.compress(PAYLOAD[:500000]) + bz2.compress(PAYLOAD[500000:])
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.setattr(aladin, "MANIFEST_FILE", str(tmp_path / "manifest.json"))
+    return {NAME: COMPRESSED}
+
+
+@pytest.fixture
+def log():
+    return []
+
+
+@pytest.fixture
+def url(files, log):
+    with serve_in_thread(static_app(files, log)) as base_url:
+        yield f"{base_url}/{NAME}"
+
+
+def fetch(url, output_path, manifest):
+    async def run():
+        async with aladin.create_session() as session:
+            return await aladin.fetch_to_file(session, url, str(output_path), manifest)
+
+    return asyncio.run(run())
+
+
+def download(url, output_path, log):
+    """Complete first download, returns the manifest"""
+    manifest = {}
+    assert fetch(url, output_path, manifest) == "downloaded"
+    log.clear()
+    return manifest
+
+
+def interrupt(output_path, part):
+    """State left by a run that died while streaming: part file, no output"""
+    os.remove(output_path)
+    with open(f"{output_path}.bz2.part", "wb") as file:
+        file.write(part)
+
+
+def test_download_then_not_modified(url, log, tmp_path):
+    output_path = tmp_path / "CLSTEMPERATURE.grb"
+    manifest = download(url, output_path, log)
+
+    assert output_path.read_bytes() == PAYLOAD
+    assert not os.path.exists(f"{output_path}.bz2.part")
+    entry = next(iter(manifest.values()))
+    assert entry["complete"] and entry["size"] == len(PAYLOAD)
+    assert entry["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+    assert aladin.load_manifest(aladin.MANIFEST_FILE) == manifest
+
+    assert fetch(url, output_path, manifest) == "not_modified"
+    [(_, status, headers)] = log
+    assert status == 304
+    assert headers["If-None-Match"] == entry["etag"]
+
+
+def test_resume_with_range(url, log, tmp_path):
+    output_path = tmp_path / "CLSTEMPERATURE.grb"
+    manifest = download(url, output_path, log)
+    manifest[next(iter(manifest))]["complete"] = False
+    half = len(COMPRESSED) // 2
+    interrupt(output_path, COMPRESSED[:half])
+
+    assert fetch(url, output_path, manifest) == "downloaded"
+    [(_, status, headers)] = log
+    assert status == 206
+    assert headers["Range"] == f"bytes={half}-"
+    assert output_path.read_bytes() == PAYLOAD
+    assert not os.path.exists(f"{output_path}.bz2.part")
+
+
+def test_changed_file_is_downloaded_again(url, log, tmp_path):
+    output_path = tmp_path / "CLSTEMPERATURE.grb"
+    manifest = download(url, output_path, log)
+    manifest[next(iter(manifest))].update(complete=False, etag='"old"')
+    interrupt(output_path, b"part of the previous version")
+
+    assert fetch(url, output_path, manifest) == "downloaded"
+    [(_, status, headers)] = log
+    # If-Range does not match, the server ignores the Range
+    assert status == 200 and headers["If-Range"] == '"old"'
+    assert output_path.read_bytes() == PAYLOAD
+
+
+def test_unsatisfiable_range_starts_over(url, log, tmp_path):
+    output_path = tmp_path / "CLSTEMPERATURE.grb"
+    manifest = download(url, output_path, log)
+    manifest[next(iter(manifest))]["complete"] = False
+    interrupt(output_path, COMPRESSED + b"garbage")
+
+    assert fetch(url, output_path, manifest) == "downloaded"
+    assert [status for _, status, _ in log] == [416, 200]
+    assert "Range" not in log[1][2]
+    assert output_path.read_bytes() == PAYLOAD
+    assert next(iter(manifest.values()))["complete"]
+
+
+def test_missing_file(url, log, tmp_path):
+    output_path = tmp_path / "CLSTEMPERATURE.grb"
+    assert fetch(f"{url}.missing", output_path, {}) is False
+    assert log[0][1] == 404
+    assert not output_path.exists()
+
+
+def test_streams_in_separate_chunks(tmp_path):
+    output_path = tmp_path / "CLSTEMPERATURE.grb"
+    writer = aladin.Bz2StreamWriter(str(output_path))
+    # Every chunk ends exactly at the end of a stream
+    writer.write(bz2.compress(PAYLOAD[:500000]))
+    writer.write(bz2.compress(PAYLOAD[500000:]))
+    writer.commit()
+    assert output_path.read_bytes() == PAYLOAD
+    assert writer.streams == 2
+
+
+def test_resume_at_stream_boundary(url, log, tmp_path):
+    output_path = tmp_path / "CLSTEMPERATURE.grb"
+    manifest = download(url, output_path, log)
+    manifest[next(iter(manifest))]["complete"] = False
+    first = len(bz2.compress(PAYLOAD[:500000]))
+    interrupt(output_path, COMPRESSED[:first])
+
+    assert fetch(url, output_path, manifest) == "downloaded"
+    [(_, status, headers)] = log
+    assert status == 206 and headers["Range"] == f"bytes={first}-"
+    assert output_path.read_bytes() == PAYLOAD
+
+
+def test_truncated_stream_is_not_committed(tmp_path):
+    output_path = tmp_path / "CLSTEMPERATURE.grb"
+    writer = aladin.Bz2StreamWriter(str(output_path))
+    writer.write(bz2.compress(PAYLOAD[:500000]))
+    writer.write(bz2.compress(PAYLOAD[500000:])[:1000])
+    with pytest.raises(EOFError):
+        writer.commit()
+    assert not output_path.exists()
+
+
+def test_failed_decompression_is_handed_over(tmp_path, monkeypatch):
+    date = datetime(2026, 1, 1)
+    name = f"{date:%Y%m%d}00_{aladin.ALADIN_ATTRIBUTES[0]}.grb.bz2"
+    monkeypatch.setattr(aladin, "MANIFEST_FILE", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(aladin, "DIRNAME", str(tmp_path))
+    monkeypatch.setattr(aladin, "SUBDOMAIN", "/x/")
+
+    async def run(base_url):
+        monkeypatch.setattr(aladin, "DOMAIN", f"{base_url}/")
+        queue = asyncio.Queue()
+        async with aladin.create_session() as session:
+            status = await aladin.process_file(session, asyncio.Semaphore(1), {}, date, "00", 0, queue)
+        return status, queue.get_nowait()
+
+    with serve_in_thread(static_app({f"00/x/{name}": b"not bz2 data"})) as base_url:
+        status, handed_over = asyncio.run(run(base_url))
+    # The next pipeline stage still gets the file's (failed) result
+    assert status is False
+    assert handed_over == (0, f"{date:%Y%m%d}00", None)
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import s3fs
+import xarray as xr
+
+import query
+import transfrom_s3
+from bucket_catalog import catalog_entry, update_bucket_catalog
+from conftest import TEST_BUCKET, TEST_REGION
+
+PARAMETER = "CLSTEMPERATURE"
+MONTHS = ["202601", "202602", "202603"]
+
+
+def write_month(month, storage_options):
+    times = pd.date_range(pd.Timestamp(f"{month}01"), periods=4, freq="6h")
+    ds = xr.Dataset({PARAMETER: (("time", "y", "x"), np.random.rand(len(times), 3, 4).astype("float32"))},
+                    coords={"time": times, "latitude": (("y", "x"), np.full((3, 4), 49.0)),
+                            "longitude": (("y", "x"), np.full((3, 4), 15.0))})
+    store_key = f"meteo_data/{month}/{PARAMETER}.zarr"
+    ds.to_zarr(f"s3://{TEST_BUCKET}/{store_key}", mode="w", storage_options=storage_options, consolidated=True)
+    return store_key, ds
+
+
+def test_months_missing_from_catalog_are_listed(s3, monkeypatch):
+    monkeypatch.setattr(query, "BUCKET_NAME", TEST_BUCKET)
+    storage_options = transfrom_s3.get_storage_options(TEST_REGION)
+    fs = s3fs.S3FileSystem(anon=False, **storage_options)
+    monkeypatch.setattr(query, "s3fs_instance", fs)
+    stores = [write_month(month, storage_options) for month in MONTHS]
+
+    # Only the newest month was written after the catalog was introduced
+    store_key, ds = stores[-1]
+    update_bucket_catalog(fs, TEST_BUCKET, {store_key: catalog_entry(
+        store_key, PARAMETER, ds[PARAMETER].dims, ds[PARAMETER].sizes, {}, ds.time.values)})
+
+    for use_virtual in [False, True]:
+        loaded = query.load_data(PARAMETER, "2026-01-01", "2026-03-31", use_cache=False, use_virtual=use_virtual)
+        assert loaded is not None
+        assert list(loaded.time.values) == [t for _, ds in stores for t in ds.time.values]
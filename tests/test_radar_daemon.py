@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+import aiohttp
+import pytest
+
+import radar_daemon as daemon
+from conftest import TEST_BUCKET
+from servers import serve_in_thread, static_app
+
+NAMES = [f"T_PABV23_C_OKPR_20260101{hhmm}00.hdf" for hhmm in ["0000", "0005", "0010"]]
+
+
+@pytest.fixture
+def poll(s3, tmp_path, monkeypatch):
+    """One poll_once over NAMES served with `headers`, returns the state"""
+    monkeypatch.chdir(tmp_path)
+
+    def run(headers, state=None):
+        with serve_in_thread(static_app({name: b"hdf" for name in NAMES}, headers=headers)) as base_url:
+            monkeypatch.setattr(daemon, "RADAR_TYPES", [{"name": "maxz", "base_url": f"{base_url}/",
+                                                         "code": "PABV23", "s3_prefix": "radar/maxz"}])
+            state = state or {"maxz": daemon.new_entry(datetime(2025, 12, 31, 23, 55))}
+
+            async def once():
+                async with aiohttp.ClientSession() as session:
+                    return await daemon.poll_once(session, state, asyncio.Semaphore(4))
+
+            return asyncio.run(once()), state
+
+    return run
+
+
+def stored(s3):
+    return len(s3.list_objects_v2(Bucket=TEST_BUCKET, Prefix="radar/").get("Contents", []))
+
+
+@pytest.mark.parametrize("last_modified", ["garbage", "Thu, 01 Jan 2026 00:20:00 -0000"])
+def test_bad_or_naive_last_modified(poll, s3, last_modified):
+    uploaded, state = poll({"Last-Modified": last_modified})
+    assert uploaded == len(NAMES) and stored(s3) == len(NAMES)
+    assert state["maxz"]["lag"].count == len(NAMES)
+
+
+def test_lag_stats_are_persisted(poll):
+    poll({"Last-Modified": "Thu, 01 Jan 2026 00:20:00 GMT"})
+
+    saved = daemon.load_state()["maxz"]["lag"].as_dict()
+    assert saved["uploaded"] == len(NAMES)
+    assert saved["mean_lag_s"] > 0 and saved["max_lag_s"] >= saved["mean_lag_s"]
+
+    # Counting continues after a restart
+    state = daemon.load_state()
+    state["maxz"]["high_water"] = datetime(2025, 12, 31, 23, 55)
+    poll({}, state)
+    assert daemon.load_state()["maxz"]["lag"].count == 2 * len(NAMES)
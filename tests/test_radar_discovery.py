@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import HDFDownloadAWS as radar
+from conftest import TEST_BUCKET
+from servers import serve_in_thread, static_app
+
+DATE = datetime(2026, 1, 1)
+# Irregular times with gaps, as published
+TIMES = ["000000", "000500", "001500", "013000", "235500"]
+LISTED = [f"T_PABV23_C_OKPR_20260101{hhmmss}.hdf" for hhmmss in TIMES]
+# Other products, days and files in the same directory
+NOISE = ["T_PADV23_C_OKPR_20260101000000.hdf", "T_PABV23_C_OKPR_20251231235500.hdf",
+         "T_PABV23_C_OKPR_20260101000000.hdf.md5", "README.txt"]
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """Starts a server for ({name: bytes}, index), returns (radar type, request log)"""
+    started = []
+
+    def start(files, index=None, **radar_type):
+        log = []
+        server = serve_in_thread(static_app(files, log, index))
+        base_url = server.__enter__()
+        started.append(server)
+        radar_type = dict({"name": "maxz", "base_url": f"{base_url}/", "code": "PABV23",
+                           "s3_prefix": "radar/maxz"}, **radar_type)
+        monkeypatch.setattr(radar, "RADAR_TYPES", [radar_type])
+        return radar_type, log
+
+    yield start
+    for server in started:
+        server.__exit__(None, None, None)
+
+
+def ingest(radar_type):
+    """One HDFDownloadAWS run for DATE driven by the directory listing"""
+    async def run():
+        available = {"maxz": await radar.discover_radar_files(radar_type)}
+        return await radar.process_time_period(DATE, available)
+
+    return asyncio.run(run())
+
+
+def fetched(log):
+    return sorted(name for name, _, _ in log if name)
+
+
+def stored(s3):
+    return sorted(obj["Key"] for obj in s3.list_objects_v2(Bucket=TEST_BUCKET, Prefix="radar/").get("Contents", []))
+
+
+def test_index_is_parsed(serve):
+    radar_type, log = serve({name: b"hdf" for name in LISTED + NOISE})
+
+    available = asyncio.run(radar.discover_radar_files(radar_type))
+    # All days in the listing, process_time_period picks its date
+    expected = LISTED + ["T_PABV23_C_OKPR_20251231235500.hdf"]
+    assert available == {datetime.strptime(name[16:30], "%Y%m%d%H%M%S"): name for name in expected}
+    assert len(log) == 1
+
+
+def test_only_listed_files_are_fetched(s3, serve):
+    radar_type, log = serve({name: name.encode() for name in LISTED + NOISE})
+
+    assert ingest(radar_type) == len(LISTED)
+    # No requests for the missing 5-minute slots, no 404s
+    assert fetched(log) == sorted(LISTED)
+    assert all(status == 200 for _, status, _ in log)
+    assert stored(s3) == sorted(f"radar/maxz/20260101/{name}" for name in LISTED)
+
+    # Diffed against S3 - the next run downloads nothing
+    log.clear()
+    assert ingest(radar_type) == 0
+    assert fetched(log) == []
+
+
+def test_listed_but_missing_file_fails_alone(s3, serve):
+    radar_type, log = serve({name: b"hdf" for name in LISTED[1:]}, index=LISTED)
+
+    assert ingest(radar_type) == len(LISTED) - 1
+    assert len(stored(s3)) == len(LISTED) - 1
+
+
+def test_custom_filename_regex(s3, serve):
+    names = [f"maxz_20260101{hhmmss}_v2.h5" for hhmmss in TIMES]
+    radar_type, log = serve({name: b"hdf" for name in names + LISTED},
+                            filename_regex=r"maxz_(\d{14})_v2\.h5")
+
+    assert ingest(radar_type) == len(names)
+    # Fetched and stored under the name from the index, not the default T_<code>_... name
+    assert fetched(log) == sorted(names)
+    assert stored(s3) == sorted(f"radar/maxz/20260101/{name}" for name in names)
+
+
+def test_unreadable_index(serve):
+    radar_type, log = serve({})
+    radar_type["base_url"] += "missing/"
+    assert asyncio.run(radar.discover_radar_files(radar_type)) is None
+
+
+def test_one_session_reuses_connections(s3, serve):
+    names = [f"T_PABV23_C_OKPR_20260101{hour:02d}{minute:02d}00.hdf" for hour in range(4) for minute in range(0, 60, 5)]
+    radar_type, log = serve({name: b"hdf" for name in names})
+    stats = {}
+
+    async def run():
+        async with radar.radar_session(stats) as session:
+            available = {"maxz": await radar.discover_radar_files(radar_type, session)}
+            return await radar.process_time_period(DATE, available, session=session)
+
+    assert asyncio.run(run()) == len(names)
+    assert fetched(log) == sorted(names)
+    # Listing and all downloads go over the pooled keep-alive connections
+    assert 0 < stats["connections"] <= radar.MAX_CONCURRENT_DOWNLOADS
@@ -0,0 +1,86 @@
+import asyncio
+import io
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import HDFDownloadAWS as radar
+from conftest import TEST_BUCKET
+from servers import serve_in_thread, static_app
+
+DATE = datetime(2026, 1, 1)
+# One day of 5-minute composites
+TIMESTAMPS = [DATE + timedelta(minutes=5 * i) for i in range(288)]
+
+
+@pytest.fixture
+def source(monkeypatch):
+    """Local server with a day of maxz composites, returns (radar type, files, request log)"""
+    files = {radar.radar_filename(timestamp, {"code": "PABV23"}): os.urandom(64 * 1024) for timestamp in TIMESTAMPS}
+    log = []
+    with serve_in_thread(static_app(files, log)) as base_url:
+        radar_type = {"name": "maxz", "base_url": f"{base_url}/", "code": "PABV23", "s3_prefix": "radar/maxz"}
+        monkeypatch.setattr(radar, "RADAR_TYPES", [radar_type])
+        yield radar_type, files, log
+
+
+@pytest.fixture
+def concurrent_uploads(monkeypatch):
+    """Highest number of uploads running at the same time"""
+    running = {"now": 0, "max": 0}
+    lock = threading.Lock()
+    upload = radar.upload_file_to_s3
+
+    def counting(*args):
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        try:
+            return upload(*args)
+        finally:
+            with lock:
+                running["now"] -= 1
+
+    monkeypatch.setattr(radar, "upload_file_to_s3", counting)
+    return running
+
+
+def stored(s3, prefix):
+    paginator = s3.get_paginator("list_objects_v2")
+    return {obj["Key"]: obj["Size"] for page in paginator.paginate(Bucket=TEST_BUCKET, Prefix=prefix)
+            for obj in page.get("Contents", [])}
+
+
+def test_day_of_composites(s3, source, concurrent_uploads):
+    radar_type, files, log = source
+    available = {"maxz": {timestamp: radar.radar_filename(timestamp, radar_type) for timestamp in TIMESTAMPS}}
+
+    started = time.perf_counter()
+    assert asyncio.run(radar.process_time_period(DATE, available)) == len(TIMESTAMPS)
+    elapsed = time.perf_counter() - started
+    print(f"{len(TIMESTAMPS)} files in {elapsed:.2f} s ({len(TIMESTAMPS) / elapsed:.1f} files/s), "
+          f"up to {concurrent_uploads['max']} concurrent uploads")
+
+    objects = stored(s3, "radar/maxz/20260101/")
+    assert objects == {f"radar/maxz/20260101/{name}": len(data) for name, data in files.items()}
+    # Uploads run in the thread pool, beside the downloads and each other
+    assert concurrent_uploads["max"] > 1
+
+    # Second run only lists the prefix
+    log.clear()
+    assert asyncio.run(radar.process_time_period(DATE, available)) == 0
+    assert log == []
+
+
+def test_large_file_is_uploaded_in_parts(s3):
+    data = os.urandom(radar.MULTIPART_THRESHOLD + radar.MULTIPART_CHUNKSIZE // 2)
+    assert asyncio.run(radar.upload_file_to_s3_async(io.BytesIO(data), TEST_BUCKET, "radar/large.hdf"))
+
+    head = s3.head_object(Bucket=TEST_BUCKET, Key="radar/large.hdf")
+    assert head["ContentLength"] == len(data)
+    # ETag of a multipart upload ends with the number of parts
+    assert head["ETag"].strip('"').endswith("-2")
+    assert s3.get_object(Bucket=TEST_BUCKET, Key="radar/large.hdf")["Body"].read() == data
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import xarray as xr
+
+import transfrom_s3
+from conftest import TEST_BUCKET, TEST_REGION
+from radar_to_zarr import RadarZarrWriter
+
+START = datetime(2026, 1, 1)
+SHAPE = (20, 30)
+
+
+def composites(indexes):
+    """5-minute composites whose every pixel holds the slot index"""
+    return [(START + timedelta(minutes=5 * i), np.full(SHAPE, i, dtype="float32"), {"quantity": "DBZH"})
+            for i in indexes]
+
+
+def read_back(writer):
+    return xr.open_zarr(writer.store_uri("maxz", "202601"), storage_options=writer.storage_options)
+
+
+def test_out_of_order_batches_keep_time_sorted(s3):
+    writer = RadarZarrWriter(TEST_BUCKET, transfrom_s3.get_storage_options(TEST_REGION))
+    # Batches in the order concurrent downloads finish, then a backfill of the gaps
+    for batch in [range(0, 24), range(30, 36), [27, 25, 29, 24, 26, 28], [5], range(40, 44), [36, 38]]:
+        writer.write("maxz", composites(batch))
+
+    ds = read_back(writer)
+    stored = sorted([*range(0, 30), *range(30, 36), *range(40, 44), 36, 38])
+    assert ds.indexes["time"].is_monotonic_increasing
+    assert list(ds.maxz.isel(y=0, x=0).values) == stored
+    assert len(writer.catalog.times(writer.store_uri("maxz", "202601"))) == len(stored)
+
+    # A day of radar for one area, by time range
+    window = ds.sel(time=slice(START + timedelta(minutes=20), START + timedelta(minutes=140)),
+                    y=slice(5, 10), x=slice(5, 15))
+    assert list(window.maxz.isel(y=0, x=0).values) == [*range(4, 29)]
+    assert (window.maxz.values == np.arange(4, 29)[:, None, None]).all()
+
+    # Writing the same composites again changes nothing
+    writer.write("maxz", composites([5, 26, 38]))
+    assert len(read_back(writer).time) == len(stored)
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import transfrom_s3
+from conftest import TEST_BUCKET, TEST_REGION
+from transfrom_s3 import StoreCatalog, get_storage_options, write_parameter
+
+MONTH = "202601"
+PARAMETER = "T2M"
+URI = f"s3://{TEST_BUCKET}/meteo_data/{MONTH}/{PARAMETER}.zarr"
+
+
+@pytest.fixture
+def options():
+    return get_storage_options(TEST_REGION)
+
+
+@pytest.fixture
+def files(tmp_path):
+    """12 six-hourly NetCDF runs (3 steps on a 4x5 grid) as write_parameter expects them"""
+    files = []
+    for i, run in enumerate(pd.date_range("2026-01-01", periods=12, freq="6h")):
+        path = tmp_path / f"{i}.nc"
+        xr.Dataset(
+            {"t": (("step", "y", "x"), np.random.rand(3, 4, 5).astype("float32"))},
+            coords={"step": pd.to_timedelta([0, 1, 2], "h"),
+                    "latitude": (("y", "x"), np.linspace(48, 51, 20).reshape(4, 5)),
+                    "longitude": (("y", "x"), np.linspace(12, 19, 20).reshape(4, 5))},
+        ).to_netcdf(path)
+        files.append((str(path), run.isoformat()))
+    return files
+
+
+@pytest.fixture
+def one_file_batches(monkeypatch):
+    """Memory budget of one file - batches of one time chunk"""
+    plan = transfrom_s3.plan_write_batches
+    monkeypatch.setattr(transfrom_s3, "plan_write_batches", lambda *args: plan(*args, memory_budget=1))
+
+
+def count_s3_calls(catalog, monkeypatch):
+    """List of (S3 API call, key) made through the catalog's s3fs instance"""
+    calls = []
+    call_s3 = catalog.fs._call_s3
+
+    async def counting(method, *args, **kwargs):
+        calls.append((method, kwargs.get("Key") or kwargs.get("Prefix")))
+        return await call_s3(method, *args, **kwargs)
+
+    monkeypatch.setattr(catalog.fs, "_call_s3", counting)
+    return calls
+
+
+def test_store_is_probed_once_per_run(s3, files, options, one_file_batches, monkeypatch):
+    catalog = StoreCatalog(options)
+    refreshed = []
+    refresh = catalog.refresh
+    monkeypatch.setattr(catalog, "refresh", lambda s3_uri: refreshed.append(s3_uri) or refresh(s3_uri))
+
+    # 2 calls of 3 batches each (time chunk 5)
+    assert write_parameter(TEST_BUCKET, MONTH, PARAMETER, files[:6], options, TEST_REGION, catalog)
+    assert write_parameter(TEST_BUCKET, MONTH, PARAMETER, files[6:], options, TEST_REGION, catalog)
+    assert refreshed == [URI]
+
+    calls = count_s3_calls(catalog, monkeypatch)
+    for _ in range(10):
+        assert len(catalog.times(URI)) == 12
+        assert catalog.exists(URI)
+        assert catalog.store_chunks(URI)["time"] == 5
+    assert calls == []
+
+
+def test_refresh_cost_of_a_new_run(s3, files, options, tmp_path, monkeypatch):
+    path = str(tmp_path / "catalog.json")
+    assert write_parameter(TEST_BUCKET, MONTH, PARAMETER, files, options, TEST_REGION, StoreCatalog(options, path))
+
+    catalog = StoreCatalog(options)
+    calls = count_s3_calls(catalog, monkeypatch)
+    times = catalog.times(URI)
+    without_file = len(calls)
+    assert np.array_equal(times, np.array([run for _, run in files], dtype="datetime64[ns]"))
+    # .zgroup, time/.zarray, time/.zattrs, listing of time/, .zmetadata and the time array
+    assert 0 < without_file <= 12, calls
+
+    calls.clear()
+    catalog.times(URI)
+    assert calls == []
+
+    # Persisted catalog with the same number of times - time array is not read
+    persisted = StoreCatalog(options, path)
+    calls = count_s3_calls(persisted, monkeypatch)
+    assert np.array_equal(persisted.times(URI), times)
+    assert len(calls) < without_file
+
+
+def test_missing_store(s3, options):
+    assert StoreCatalog(options).times(f"s3://{TEST_BUCKET}/meteo_data/{MONTH}/MISSING.zarr") is None
+
+
+def test_foreign_objects_are_never_overwritten(s3, files, options):
+    key = f"meteo_data/{MONTH}/{PARAMETER}.zarr/foreign.txt"
+    s3.put_object(Bucket=TEST_BUCKET, Key=key, Body=b"not a zarr store")
+
+    with pytest.raises(ValueError):
+        StoreCatalog(options).times(URI)
+    assert write_parameter(TEST_BUCKET, MONTH, PARAMETER, files, options, TEST_REGION) is False
+
+    keys = [obj["Key"] for obj in s3.list_objects_v2(Bucket=TEST_BUCKET, Prefix="meteo_data/")["Contents"]]
+    assert keys == [key]
+
+
+def test_interrupted_append_is_refused(s3, files, options):
+    assert write_parameter(TEST_BUCKET, MONTH, PARAMETER, files, options, TEST_REGION)
+    # Array resized, but the chunk with the new times never written
+    s3.delete_object(Bucket=TEST_BUCKET, Key=f"meteo_data/{MONTH}/{PARAMETER}.zarr/time/0")
+
+    with pytest.raises(ValueError, match="missing chunks"):
+        StoreCatalog(options).times(URI)
+
+
+def test_refresh_sees_appends_made_by_another_writer(s3, files, options):
+    assert write_parameter(TEST_BUCKET, MONTH, PARAMETER, files[:5], options, TEST_REGION)
+    # Lists time/ through the s3fs instance shared by every catalog of this process
+    assert len(StoreCatalog(options).times(URI)) == 5
+
+    assert write_parameter(TEST_BUCKET, MONTH, PARAMETER, files[5:], options, TEST_REGION)
+    assert len(StoreCatalog(options).times(URI)) == 12